@@ -0,0 +1,323 @@
+'''A non-blocking variant of yelp.Api driven by an asyncore event loop.'''
+
+import asyncore
+import collections
+import socket
+import sys
+import threading
+import time
+import urlparse
+import zlib
+
+import yelp
+from transport import DEFAULT_TIMEOUT
+
+
+# Maximum number of requests on the wire at once.
+DEFAULT_MAX_IN_FLIGHT = 50
+
+
+class Future(object):
+    '''The eventual result of an AsyncApi call.'''
+
+    def __init__(self, api):
+        self._api = api
+        self._done = False
+        self._result = None
+        self._exc_info = None
+        self._callbacks = []
+
+    def Done(self):
+        '''Return True once the call has either succeeded or failed.'''
+        return self._done
+
+    def Result(self):
+        '''Return the result of the call, running the event loop until done.
+
+        Raises the exception of the call if it failed.
+        '''
+        if not self._done:
+            self._api.Wait([self])
+        if self._exc_info is not None:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._result
+
+    def Error(self):
+        '''Return the exception of a failed call, or None.'''
+        if not self._done:
+            self._api.Wait([self])
+        if self._exc_info is None:
+            return None
+        return self._exc_info[1]
+
+    def AddDoneCallback(self, callback):
+        '''Call callback(future) once the call completes.'''
+        if self._done:
+            callback(self)
+        else:
+            self._callbacks.append(callback)
+
+    def _SetResult(self, result):
+        self._result = result
+        self._Finish()
+
+    def _SetError(self, exc_info):
+        self._exc_info = exc_info
+        self._Finish()
+
+    def _Finish(self):
+        self._done = True
+        callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+
+class AsyncApi(yelp.Api):
+    '''A yelp.Api whose GetBusiness and Search return Futures.
+
+    Requests are multiplexed over non-blocking sockets in a single thread,
+    so thousands of calls can be outstanding without a thread apiece.  No
+    more than max_in_flight of them are sent at once; the rest wait in a
+    queue.  Signing, caching and model construction are shared with
+    yelp.Api.  The loop runs whenever Wait, or Result on a pending Future,
+    is called; a single AsyncApi must only be driven from one thread.
+
+    Hooks added with AddHook see the same events and phases as with
+    yelp.Api, except that each call makes a single attempt.  A rate
+    limiter, if set, is honoured without blocking the loop, but throttled
+    or failed requests are not retried.  Only plain http urls are
+    supported.  Host names are resolved with a blocking lookup when each
+    connection is opened.
+    '''
+
+    def __init__(self, *args, **kwargs):
+        '''Accepts the arguments of yelp.Api, plus:
+
+        Args:
+          max_in_flight:
+            The maximum number of requests sent concurrently.
+          timeout:
+            Time, in seconds, after which a request is abandoned.
+        '''
+        max_in_flight = kwargs.pop('max_in_flight', DEFAULT_MAX_IN_FLIGHT)
+        self._timeout = kwargs.pop('timeout', DEFAULT_TIMEOUT)
+        yelp.Api.__init__(self, *args, **kwargs)
+        self._map = {}
+        self._pending = collections.deque()
+        self._in_flight = threading.BoundedSemaphore(max_in_flight)
+
+    def GetBusiness(self, id):
+        return self._Call(self._GetBusinessUrl, id, self._ParseBusiness)
+
+    def Search(self, **kwargs):
+        return self._Call(self._GetSearchUrl, kwargs, self._ParseSearch)
+
+    def Wait(self, futures=None, timeout=None):
+        '''Run the event loop until futures, or every pending call, complete.
+
+        Args:
+          futures:
+            An iterable of Futures.  Defaults to all outstanding calls.
+          timeout:
+            Time, in seconds, to run the loop for at most.
+
+        Returns:
+          True if every awaited call completed.
+        '''
+        if futures is not None:
+            futures = list(futures)
+        deadline = None
+        if timeout is not None:
+            deadline = time.time() + timeout
+
+        while True:
+            if futures is None:
+                if not self._map and not self._pending:
+                    return True
+            elif all(future.Done() for future in futures):
+                return True
+            if deadline is not None and time.time() >= deadline:
+                return False
+            wait = self._Start()
+            if self._map:
+                asyncore.loop(timeout=0.1, use_poll=True, map=self._map, count=1)
+                self._Expire()
+            elif wait:
+                # Nothing to poll until the rate limiter lets a call start
+                if deadline is not None:
+                    wait = min(wait, max(deadline - time.time(), 0))
+                time.sleep(wait)
+
+    def _Call(self, get_url, request, parse):
+        future = Future(self)
+        try:
+            url = get_url(request)
+            key = self._GetCacheKey(url)
+            if self._hooks:
+                start = time.time()
+                response = self._GetCachedResponse(key, url)
+                self._EmitPhase(yelp.PHASE_CACHE_LOOKUP, start, url=url, key=key)
+                if response is None:
+                    self._Emit(yelp.EVENT_CACHE_MISS, url=url, key=key)
+                else:
+                    self._Emit(yelp.EVENT_CACHE_HIT, url=url, key=key)
+            else:
+                response = self._GetCachedResponse(key, url)
+        except Exception:
+            future._SetError(sys.exc_info())
+            return future
+
+        if response is not None:
+            self._Resolve(future, parse, response, key)
+        else:
+            self._pending.append((future, url, key, parse))
+            self._Start()
+        return future
+
+    def _Start(self):
+        # Returns the time, in seconds, until a throttled call may start, or 0
+        while self._pending and self._in_flight.acquire(False):
+            if self._rate_limiter is not None:
+                wait = self._rate_limiter.TryAcquire()
+                if wait:
+                    # Throttled; the loop tries again on its next pass
+                    self._in_flight.release()
+                    return wait
+            future, url, key, parse = self._pending.popleft()
+            try:
+                _AsyncRequest(self, future, url, key, parse)
+            except Exception, error:
+                self._in_flight.release()
+                future._SetError(sys.exc_info())
+                self._Emit(yelp.EVENT_ERROR, url=url, attempt=0, error=error)
+        return 0
+
+    def _Expire(self):
+        now = time.time()
+        for request in self._map.values():
+            if now >= request.deadline:
+                request.Fail(socket.timeout('Timed out fetching ' + request.url))
+
+    def _Complete(self, request, status, headers, body):
+        self._in_flight.release()
+        if self._hooks:
+            self._EmitPhase(yelp.PHASE_NETWORK, request.sent, url=request.url, status=status)
+            self._Emit(yelp.EVENT_AFTER_RESPONSE, url=request.url, attempt=0, status=status,
+                       seconds=time.time() - request.sent)
+        # Error bodies are returned to the parser but never cached
+        if status == 200 and self._cache is not None:
+            try:
+                self._cache.Set(request.key, body)
+            except Exception:
+                request.future._SetError(sys.exc_info())
+                return
+        self._Resolve(request.future, request.parse, body, request.key)
+
+    def _Abandon(self, request, exc_info):
+        self._in_flight.release()
+        request.future._SetError(exc_info)
+        self._Emit(yelp.EVENT_ERROR, url=request.url, attempt=0, error=exc_info[1])
+
+    def _Resolve(self, future, parse, response, key):
+        try:
+            result = parse(response, key)
+        except Exception:
+            future._SetError(sys.exc_info())
+        else:
+            future._SetResult(result)
+
+
+class _AsyncRequest(asyncore.dispatcher):
+    '''A single HTTP/1.0 GET whose response is read until the server closes.'''
+
+    def __init__(self, api, future, url, key, parse):
+        asyncore.dispatcher.__init__(self, map=api._map)
+        self.api = api
+        self.future = future
+        self.url = url
+        self.key = key
+        self.parse = parse
+        self.deadline = time.time() + api._timeout
+        self._finished = False
+        self._chunks = []
+
+        parts = urlparse.urlsplit(url)
+        if parts.scheme != 'http':
+            raise ValueError('AsyncApi only supports http urls, not ' + url)
+        path = parts.path or '/'
+        headers = ['GET %s HTTP/1.0' % path, 'Host: ' + parts.netloc]
+        if api._use_gzip:
+            headers.append('Accept-Encoding: gzip')
+
+        start = time.time()
+        signed_url = api._SignUrl(url)
+        if api._hooks:
+            api._EmitPhase(yelp.PHASE_SIGN, start, url=url)
+            api._Emit(yelp.EVENT_BEFORE_REQUEST, url=url, method='GET', attempt=0)
+        query = urlparse.urlsplit(signed_url).query
+        if query:
+            headers[0] = 'GET %s?%s HTTP/1.0' % (path, query)
+        self._outbuf = '\r\n'.join(headers) + '\r\n\r\n'
+
+        self.sent = time.time()
+        self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            self.connect((parts.hostname, parts.port or 80))
+        except:
+            self.close()
+            raise
+
+    def Fail(self, error):
+        if self._finished:
+            return
+        self._finished = True
+        self.close()
+        try:
+            raise error
+        except Exception:
+            self.api._Abandon(self, sys.exc_info())
+
+    def writable(self):
+        return self.connecting or bool(self._outbuf)
+
+    def handle_connect(self):
+        pass
+
+    def handle_write(self):
+        sent = self.send(self._outbuf)
+        self._outbuf = self._outbuf[sent:]
+
+    def handle_read(self):
+        data = self.recv(65536)
+        if data:
+            self._chunks.append(data)
+
+    def handle_close(self):
+        if self._finished:
+            return
+        self.close()
+        try:
+            status, headers, body = _ParseResponse(''.join(self._chunks))
+        except Exception, error:
+            self.Fail(error)
+            return
+        self._finished = True
+        self.api._Complete(self, status, headers, body)
+
+    def handle_error(self):
+        self.Fail(sys.exc_info()[1])
+
+
+def _ParseResponse(data):
+    head, separator, body = data.partition('\r\n\r\n')
+    if not separator:
+        raise IOError('Incomplete HTTP response')
+    lines = head.split('\r\n')
+    status = int(lines[0].split(None, 2)[1])
+    headers = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+    if headers.get('content-encoding') == 'gzip':
+        body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+    return status, headers, body
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+
+'''Compares cache backends writing, then reading back, many small entries.
+
+Usage: python bench/bench_cache_backends.py [entries]
+'''
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from filecache import FileCache
+from sqlitecache import SqliteCache
+
+
+BODY = '{"id": "post-no-bills-brooklyn", "name": "Post No Bills", "rating": 4.5}'
+
+
+def Measure(name, cache, keys):
+    start = time.time()
+    for key in keys:
+        cache.Set(key, BODY)
+    written = time.time() - start
+
+    shuffled = list(keys)
+    random.shuffle(shuffled)
+    start = time.time()
+    for key in shuffled:
+        assert cache.GetCachedTime(key) is not None
+        assert cache.Get(key) == BODY
+    read = time.time() - start
+
+    print '%-12s %8.1f us per Set %8.1f us per hit' % (
+        name, written / len(keys) * 1e6, read / len(keys) * 1e6)
+
+
+def Main():
+    entries = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    keys = ['key:http://api.yelp.com/v2/business/business-%d' % i for i in xrange(entries)]
+    directory = tempfile.mkdtemp()
+    try:
+        Measure('FileCache', FileCache(os.path.join(directory, 'files')), keys)
+        Measure('SqliteCache', SqliteCache(os.path.join(directory, 'cache.sqlite')), keys)
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    Main()
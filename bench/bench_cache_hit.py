@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+
+'''Measures the latency of Api._FetchUrl when the response is cached.
+
+Usage: python bench/bench_cache_hit.py [iterations]
+'''
+
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import yelp
+from filecache import FileCache
+from memorycache import MemoryCache
+
+
+URL = 'http://api.yelp.com/v2/business/post-no-bills-brooklyn'
+BODY = '{"id": "post-no-bills-brooklyn", "name": "Post No Bills"}'
+
+
+def MakeApi(cache):
+    api = yelp.Api(consumer_key='key',
+                   consumer_secret='secret',
+                   access_token_key='token',
+                   access_token_secret='token-secret',
+                   cache=cache,
+                   cache_timeout=3600)
+    cache.Set(api._GetCacheKey(URL), BODY)
+    return api
+
+
+def Main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    directory = tempfile.mkdtemp()
+    try:
+        for name, cache in [('MemoryCache', MemoryCache()),
+                            ('FileCache', FileCache(directory))]:
+            api = MakeApi(cache)
+            assert api._FetchUrl(URL) == BODY
+            seconds = min(timeit.repeat(lambda: api._FetchUrl(URL),
+                                        number=iterations, repeat=3))
+            print '%-12s %8.2f us per cache hit' % (name, seconds / iterations * 1e6)
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    Main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+
+'''Drives the client against a local FakeYelpServer and reports throughput
+and latency percentiles for the main request paths.
+
+Usage: python bench/bench_client.py [--requests N] [--latency SECONDS]
+                                    [--error-rate FRACTION] [--archive PATH]
+
+Without --archive the server answers with synthetic businesses and search
+pages.  With it, GetBusiness and Search replay the recorded responses; ids
+and searches are taken from the archive.
+'''
+
+import argparse
+import json
+import os
+import sys
+import time
+import urllib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import yelp
+from bench_model_memory import SyntheticBusiness
+from memorycache import MemoryCache
+from replay import Archive, FakeYelpServer
+
+
+def SearchResponder(query):
+    offset = int(query.get('offset', 0))
+    limit = int(query.get('limit', yelp.SEARCH_PAGE_SIZE))
+    return 200, json.dumps({'total': 1000,
+                            'businesses': [SyntheticBusiness(i) for i in range(offset, offset + limit)]})
+
+
+def MakeApi(server, cache=None, **kwargs):
+    api = yelp.Api(consumer_key='key',
+                   consumer_secret='secret',
+                   access_token_key='token',
+                   access_token_secret='token-secret',
+                   cache=cache,
+                   cache_timeout=3600,
+                   **kwargs)
+    api.host = server.host
+    return api
+
+
+def Percentile(latencies, fraction):
+    return latencies[min(int(len(latencies) * fraction), len(latencies) - 1)]
+
+
+def Run(name, calls, call):
+    '''Time call(i) for each i in range(calls) and print a summary line.'''
+    latencies = []
+    errors = 0
+    start = time.time()
+    for i in xrange(calls):
+        begin = time.time()
+        try:
+            call(i)
+        except Exception:
+            errors += 1
+        latencies.append(time.time() - begin)
+    elapsed = time.time() - start
+    latencies.sort()
+    print '%-26s %8.1f calls/s  p50 %7.2f ms  p90 %7.2f ms  p99 %7.2f ms  errors %d' % (
+        name, calls / elapsed,
+        Percentile(latencies, 0.5) * 1e3,
+        Percentile(latencies, 0.9) * 1e3,
+        Percentile(latencies, 0.99) * 1e3,
+        errors)
+
+
+def Main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--latency', type=float, default=0)
+    parser.add_argument('--error-rate', type=float, default=0)
+    parser.add_argument('--batch-size', type=int, default=50)
+    parser.add_argument('--archive')
+    options = parser.parse_args()
+
+    if options.archive:
+        archive = Archive.Load(options.archive)
+        paths = [key.split(' ', 1)[1] for key in sorted(archive.responses) if key.startswith('GET ')]
+    else:
+        archive = None
+        paths = []
+    server = FakeYelpServer(archive, latency=options.latency,
+                            error_rate=options.error_rate, seed=0)
+    for i in xrange(options.requests * 2):
+        server.responses['/v2/business/business-%d' % i] = (200, json.dumps(SyntheticBusiness(i)))
+    server.responses['/v2/search'] = SearchResponder
+    server.Start()
+
+    business_ids = [path.rsplit('/', 1)[1] for path in paths if path.startswith('/v2/business/')]
+    if not business_ids:
+        business_ids = ['business-%d' % i for i in xrange(options.requests)]
+    searches = [dict(item.split('=', 1) for item in path.split('?', 1)[1].split('&'))
+                for path in paths if path.startswith('/v2/search?')]
+    if not searches:
+        searches = [{'location': 'bushwick', 'offset': str(i % 50 * 20)}
+                    for i in xrange(options.requests)]
+    searches = [dict((name, urllib.unquote_plus(value)) for name, value in search.items())
+                for search in searches]
+
+    def BusinessId(i):
+        return business_ids[i % len(business_ids)]
+
+    try:
+        api = MakeApi(server)
+        Run('GetBusiness, no cache', options.requests, lambda i: api.GetBusiness(BusinessId(i)))
+        Run('Search, no cache', options.requests,
+            lambda i: api.Search(**searches[i % len(searches)]))
+
+        cached = MakeApi(server, cache=MemoryCache())
+        Run('GetBusiness, cache miss', options.requests,
+            lambda i: cached.GetBusiness(BusinessId(i) if i < len(business_ids) else
+                                         'business-%d' % (options.requests + i)))
+        Run('GetBusiness, cache hit', options.requests, lambda i: cached.GetBusiness(BusinessId(0)))
+
+        batches = max(options.requests / options.batch_size, 1)
+        batched = MakeApi(server, cache=MemoryCache())
+        Run('GetBusinesses x%d, miss' % options.batch_size, batches,
+            lambda i: list(batched.GetBusinesses(
+                ['business-%d' % (options.requests + i * options.batch_size + j)
+                 for j in xrange(options.batch_size)])))
+        Run('GetBusinesses x%d, hit' % options.batch_size, batches,
+            lambda i: list(batched.GetBusinesses(
+                ['business-%d' % (options.requests + j) for j in xrange(options.batch_size)])))
+        for client in (api, cached, batched):
+            client.Close()
+    finally:
+        server.Stop()
+
+
+if __name__ == '__main__':
+    Main()
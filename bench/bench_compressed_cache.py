@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+
+'''Compares the throughput and disk usage of FileCache and SqliteCache with
+and without compression of the entries.
+
+Usage: python bench/bench_compressed_cache.py [entries]
+'''
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import zlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from bench_model_memory import SyntheticBusiness
+from compressedcache import CompressedCache, TrainDictionary, zstandard
+from filecache import FileCache
+from sqlitecache import SqliteCache
+
+
+def Gzip(data):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def DiskUsage(directory):
+    apparent = allocated = 0
+    for path, _, filenames in os.walk(directory):
+        for filename in filenames:
+            stat = os.stat(os.path.join(path, filename))
+            apparent += stat.st_size
+            allocated += stat.st_blocks * 512
+    return apparent, allocated
+
+
+def Measure(name, cache, directory, bodies, gzipped=None):
+    megabytes = sum(len(body) for body in bodies) / 1e6
+    start = time.time()
+    for i, body in enumerate(bodies):
+        if gzipped is None:
+            cache.Set('key-%d' % i, body)
+        else:
+            cache.SetGzipped('key-%d' % i, gzipped[i])
+    written = time.time() - start
+
+    start = time.time()
+    for i, body in enumerate(bodies):
+        assert cache.Get('key-%d' % i) == body
+    read = time.time() - start
+
+    apparent, allocated = DiskUsage(directory)
+    print '%-34s %7.1f MB/s write %7.1f MB/s read %8.1f KB data %8.1f KB on disk' % (
+        name, megabytes / written, megabytes / read, apparent / 1e3, allocated / 1e3)
+
+
+def Main():
+    entries = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    bodies = [json.dumps(SyntheticBusiness(i)) for i in xrange(entries)]
+    print '%d bodies, %.1f KB on average' % (entries, sum(map(len, bodies)) / 1e3 / entries)
+    root = tempfile.mkdtemp()
+    try:
+        runs = [('uncompressed', lambda cache: cache, None),
+                ('zlib', CompressedCache, None),
+                ('gzip as received', CompressedCache, [Gzip(body) for body in bodies])]
+        if zstandard is not None:
+            dictionary = TrainDictionary(bodies[:1000])
+            runs.append(('zstd with dictionary',
+                         lambda cache: CompressedCache(cache, level=3, dictionary=dictionary),
+                         None))
+        for backend in (FileCache, SqliteCache):
+            for name, wrap, gzipped in runs:
+                directory = os.path.join(root, '%s-%s' % (backend.__name__, name.replace(' ', '-')))
+                if backend is SqliteCache:
+                    os.mkdir(directory)
+                    cache = SqliteCache(os.path.join(directory, 'cache.sqlite'))
+                else:
+                    cache = FileCache(directory)
+                Measure('%s, %s' % (backend.__name__, name), wrap(cache), directory, bodies, gzipped)
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    Main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+
+'''Measures the memory held by model objects built from a search payload.
+
+Usage: python bench/bench_model_memory.py [pages]
+'''
+
+import gc
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import yelp
+
+
+CITIES = [(u'Brooklyn', u'NY'), (u'San Francisco', u'CA'), (u'Houston', u'TX')]
+CATEGORIES = [[u'Bars', u'bars'], [u'Cocktail Bars', u'cocktailbars'],
+              [u'Jazz & Blues', u'jazzandblues'], [u'Pizza', u'pizza']]
+
+
+def SyntheticBusiness(i):
+    city, state_code = CITIES[i % len(CITIES)]
+    return {'id': u'business-%d' % i,
+            'name': u'Business %d' % i,
+            'rating': 4.5,
+            'review_count': i,
+            'is_closed': False,
+            'is_claimed': True,
+            'phone': u'7185550%03d' % (i % 1000),
+            'display_phone': u'+1-718-555-0%03d' % (i % 1000),
+            'url': u'http://www.yelp.com/biz/business-%d' % i,
+            'categories': [CATEGORIES[i % 4], CATEGORIES[(i + 1) % 4]],
+            'location': {'address': [u'%d Main St' % i],
+                         'city': city,
+                         'state_code': state_code,
+                         'country_code': u'US',
+                         'postal_code': u'11237',
+                         'display_address': [u'%d Main St' % i, city],
+                         'coordinate': {'latitude': 40.7, 'longitude': -73.9}},
+            'reviews': [{'id': u'review-%d' % i,
+                         'excerpt': u'Great place.',
+                         'rating': 5,
+                         'time_created': 1400000000,
+                         'user': {'id': u'user-%d' % i, 'name': u'User %d' % i}}]}
+
+
+def SyntheticPage(page):
+    return json.dumps({'total': 1000,
+                       'businesses': [SyntheticBusiness(page * 20 + i) for i in range(20)]})
+
+
+def ObjectSize(obj):
+    size = sys.getsizeof(obj)
+    if hasattr(obj, '__dict__'):
+        size += sys.getsizeof(obj.__dict__)
+    return size
+
+
+def ModelSizes(results):
+    '''Return a dict of model class name to (count, bytes) for the objects
+    themselves, excluding the attribute values they share with the payload.'''
+    sizes = {}
+
+    def Add(obj):
+        count, total = sizes.get(type(obj).__name__, (0, 0))
+        sizes[type(obj).__name__] = (count + 1, total + ObjectSize(obj))
+
+    for result in results:
+        for business in result.businesses:
+            Add(business)
+            Add(business.location)
+            for review in business.reviews:
+                Add(review)
+                Add(review.user)
+    return sizes
+
+
+def DistinctStrings(results):
+    '''Return the bytes held by distinct city, state and category strings.'''
+    seen = {}
+    for result in results:
+        for business in result.businesses:
+            values = [business.location.city, business.location.state_code,
+                      business.location.country_code]
+            for category in business.categories:
+                values.extend(category)
+            for value in values:
+                seen[id(value)] = sys.getsizeof(value)
+    return len(seen), sum(seen.values())
+
+
+def Main():
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    api = yelp.Api(consumer_key='key', consumer_secret='secret',
+                   access_token_key='token', access_token_secret='token-secret',
+                   cache=None)
+    payloads = [SyntheticPage(page) for page in range(pages)]
+    gc.collect()
+    results = [api._ParseSearch(payload) for payload in payloads]
+
+    total = 0
+    for name, (count, size) in sorted(ModelSizes(results).items()):
+        total += size
+        print '%-10s %8d objects %6.1f bytes each' % (name, count, float(size) / count)
+    print 'model objects      %10d bytes' % total
+    count, size = DistinctStrings(results)
+    print 'distinct repeated strings %d, %d bytes' % (count, size)
+
+
+if __name__ == '__main__':
+    Main()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+
+'''Times building models from a decoded 20-business search page, eagerly and
+lazily.
+
+Usage: python bench/bench_model_parse.py [iterations]
+'''
+
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import yelp
+from bench_model_memory import SyntheticPage
+
+
+def Main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    data = json.loads(SyntheticPage(0))
+
+    def Eager():
+        yelp.SearchResultSet.NewFromJsonDict(data)
+
+    def Lazy():
+        yelp.SearchResultSet.NewFromJsonDict(data, lazy=True)
+
+    def LazyScalars():
+        # What most callers read: a few top-level fields of every business
+        for business in yelp.SearchResultSet.NewFromJsonDict(data, lazy=True):
+            business.id, business.name, business.rating
+
+    def LazyEverything():
+        for business in yelp.SearchResultSet.NewFromJsonDict(data, lazy=True):
+            business.location, business.reviews
+
+    for name, function in [('eager', Eager),
+                           ('lazy', Lazy),
+                           ('lazy, read id/name/rating', LazyScalars),
+                           ('lazy, read every nested object', LazyEverything)]:
+        seconds = min(timeit.repeat(function, number=iterations, repeat=3))
+        print '%-32s %8.1f us per page' % (name, seconds / iterations * 1e6)
+
+
+if __name__ == '__main__':
+    Main()
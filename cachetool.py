@@ -0,0 +1,144 @@
+'''Moving a FileCache between hosts and filling it before traffic arrives.
+
+  yelp-cache export cache.tar.gz
+  yelp-cache import cache.tar.gz --max-age 86400
+  yelp-cache prewarm --ids ids.txt --searches searches.ndjson
+
+The cache directory defaults to the one FileCache uses.  prewarm reads the
+API credentials from the YELP_CONSUMER_KEY, YELP_CONSUMER_SECRET,
+YELP_ACCESS_TOKEN_KEY and YELP_ACCESS_TOKEN_SECRET environment variables.
+'''
+
+import argparse
+import json
+import os
+import sys
+
+import yelp
+from filecache import FileCache
+
+
+# Environment variables holding the credentials prewarm signs requests with
+CREDENTIAL_VARIABLES = (('consumer_key', 'YELP_CONSUMER_KEY'),
+                        ('consumer_secret', 'YELP_CONSUMER_SECRET'),
+                        ('access_token_key', 'YELP_ACCESS_TOKEN_KEY'),
+                        ('access_token_secret', 'YELP_ACCESS_TOKEN_SECRET'))
+
+
+class CacheToolError(Exception):
+    '''Base exception class for cachetool related errors'''
+
+
+def Prewarm(api, business_ids=(), searches=()):
+    '''Fetch businesses and searches through an Api so that its cache holds
+    them.  Requests run concurrently, batch_concurrency at a time, and
+    entries already fresh in the cache are not fetched again.
+
+    Args:
+      api:
+        The yelp.Api whose cache is filled.
+      business_ids:
+        An iterable of business ids.
+      searches:
+        An iterable of dicts, each holding the keyword arguments of one
+        Search call.  Only the page each describes is fetched.
+
+    Returns:
+      A dict of the number of businesses and searches cached, and of errors.
+    '''
+    stats = {'businesses': 0, 'searches': 0, 'errors': 0}
+    for name, results in (('businesses', api.GetBusinesses(business_ids, as_completed=True)),
+                          ('searches', api.SearchMany(searches, as_completed=True))):
+        for result in results:
+            if result.error is None:
+                stats[name] += 1
+            else:
+                stats['errors'] += 1
+    return stats
+
+
+def _ReadLines(path):
+    with open(path) as fp:
+        return [line.strip() for line in fp if line.strip()]
+
+
+def _Export(args):
+    return {'exported': FileCache(args.cache_dir).ExportArchive(
+        args.archive, max_age=args.max_age, compress=not args.no_compress)}
+
+
+def _Import(args):
+    return FileCache(args.cache_dir).ImportArchive(
+        args.archive, max_age=args.max_age, overwrite=args.overwrite)
+
+
+def _Prewarm(args):
+    credentials = {}
+    for name, variable in CREDENTIAL_VARIABLES:
+        credentials[name] = os.getenv(variable)
+        if not credentials[name]:
+            raise CacheToolError('%s is not set' % variable)
+    api = yelp.Api(cache=FileCache(args.cache_dir),
+                   cache_timeout=args.cache_timeout,
+                   batch_concurrency=args.concurrency,
+                   use_gzip_compression=True,
+                   # Nothing reads the results, so skip building models.  Raw
+                   # bodies would skip the check for API errors too.
+                   response_format=yelp.RESPONSE_DICT,
+                   **credentials)
+    if args.host:
+        api.host = args.host
+    business_ids = []
+    searches = []
+    if args.ids:
+        business_ids = _ReadLines(args.ids)
+    if args.searches:
+        searches = [json.loads(line) for line in _ReadLines(args.searches)]
+    try:
+        return Prewarm(api, business_ids, searches)
+    finally:
+        api.Close()
+
+
+def Main(argv=None):
+    '''The yelp-cache command.  Prints the stats of the command run as JSON.'''
+    parser = argparse.ArgumentParser(prog='yelp-cache', description=__doc__.split('\n')[0])
+    parser.add_argument('--cache-dir', help='the FileCache root directory')
+    commands = parser.add_subparsers()
+
+    export = commands.add_parser('export', help='write the cache to an archive')
+    export.add_argument('archive')
+    export.add_argument('--max-age', type=float, help='leave out entries this old, in seconds')
+    export.add_argument('--no-compress', action='store_true', help='do not gzip the archive')
+    export.set_defaults(command=_Export)
+
+    import_ = commands.add_parser('import', help='add the entries of an archive to the cache')
+    import_.add_argument('archive')
+    import_.add_argument('--max-age', type=float, help='skip entries this old, in seconds')
+    import_.add_argument('--overwrite', action='store_true',
+                         help='replace entries even when the cached ones are newer')
+    import_.set_defaults(command=_Import)
+
+    prewarm = commands.add_parser('prewarm', help='fetch businesses and searches into the cache')
+    prewarm.add_argument('--ids', help='a file of business ids, one per line')
+    prewarm.add_argument('--searches',
+                         help='a file of Search keyword arguments, one JSON object per line')
+    prewarm.add_argument('--concurrency', type=int, default=yelp.DEFAULT_BATCH_CONCURRENCY,
+                         help='requests run in parallel')
+    prewarm.add_argument('--cache-timeout', type=float, default=yelp.DEFAULT_CACHE_TIMEOUT,
+                         help='refetch cached entries older than this, in seconds')
+    prewarm.add_argument('--host', help='the API host, e.g. a local FakeYelpServer')
+    prewarm.set_defaults(command=_Prewarm)
+
+    args = parser.parse_args(argv)
+    try:
+        stats = args.command(args)
+    except (CacheToolError, EnvironmentError), error:
+        sys.stderr.write('yelp-cache: %s\n' % error)
+        return 1
+    print json.dumps(stats, sort_keys=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(Main())
@@ -0,0 +1,150 @@
+'''Columnar views of businesses for bulk numeric work.'''
+
+import array
+from collections import OrderedDict
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# Column kinds, named after the array typecode their values are stored as.
+# Missing floats are stored as NaN, missing integers and booleans as -1.
+FLOAT = 'd'
+INT = 'l'
+BOOL = 'b'
+STRING = 'i'
+
+# (column name, kind, path to the value in a business dict or model)
+COLUMNS = [('id', STRING, ('id',)),
+           ('name', STRING, ('name',)),
+           ('rating', FLOAT, ('rating',)),
+           ('review_count', INT, ('review_count',)),
+           ('is_closed', BOOL, ('is_closed',)),
+           ('is_claimed', BOOL, ('is_claimed',)),
+           ('latitude', FLOAT, ('location', 'coordinate', 'latitude')),
+           ('longitude', FLOAT, ('location', 'coordinate', 'longitude')),
+           ('city', STRING, ('location', 'city')),
+           ('state_code', STRING, ('location', 'state_code')),
+           ('country_code', STRING, ('location', 'country_code')),
+           ('postal_code', STRING, ('location', 'postal_code')),
+           ('category', STRING, ('categories', 0, 1))]
+
+_MISSING = {FLOAT: float('nan'), INT: -1, BOOL: -1}
+
+
+class DictionaryColumn(object):
+    '''A column of strings stored as integer codes into a dictionary of the
+    distinct values.  A code of -1 stands for a missing value.'''
+
+    def __init__(self, codes=None, dictionary=None):
+        self.codes = codes
+        self.dictionary = dictionary
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, index):
+        code = self.codes[index]
+        if code < 0:
+            return None
+        return self.dictionary[code]
+
+    def Decode(self):
+        '''Return the column as a list of strings.'''
+        return [self[index] for index in xrange(len(self.codes))]
+
+
+class Table(object):
+    '''Named columns of equal length, one row per business.
+
+    Attributes:
+      columns:
+        An OrderedDict of column name to an array.array, a numpy array or a
+        DictionaryColumn.
+    '''
+
+    def __init__(self, columns=None):
+        self.columns = columns
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __len__(self):
+        if not self.columns:
+            return 0
+        return len(next(iter(self.columns.values())))
+
+    def Names(self):
+        return list(self.columns)
+
+
+def FromJsonDicts(businesses, use_numpy=False):
+    '''Build a Table in a single pass over decoded business dicts.
+
+    Args:
+      businesses:
+        An iterable of business dicts, e.g. the "businesses" of a decoded
+        search response, or of Business objects.
+      use_numpy:
+        If True, numeric columns and dictionary codes are numpy arrays
+        rather than array.array instances.  Requires numpy.
+
+    Returns:
+      A Table.
+    '''
+    if use_numpy and numpy is None:
+        raise ImportError('use_numpy requires numpy to be installed')
+
+    values = [array.array(kind) for _, kind, _ in COLUMNS]
+    dictionaries = [{} for _ in COLUMNS]
+    for business in businesses:
+        for index, (_, kind, path) in enumerate(COLUMNS):
+            value = _Lookup(business, path)
+            if kind == STRING:
+                if value is None:
+                    value = -1
+                else:
+                    value = dictionaries[index].setdefault(value, len(dictionaries[index]))
+            elif value is None:
+                value = _MISSING[kind]
+            values[index].append(value)
+
+    columns = OrderedDict()
+    for index, (name, kind, _) in enumerate(COLUMNS):
+        column = values[index]
+        if use_numpy:
+            column = numpy.frombuffer(column, dtype=kind)
+        if kind == STRING:
+            dictionary = [None] * len(dictionaries[index])
+            for value, code in dictionaries[index].iteritems():
+                dictionary[code] = value
+            column = DictionaryColumn(codes=column, dictionary=dictionary)
+        columns[name] = column
+    return Table(columns=columns)
+
+
+def FromBusinesses(businesses, use_numpy=False):
+    '''Build a Table from Business objects.
+
+    Lazily built businesses are read straight from the dicts they wrap, so
+    their nested models are never materialized.
+    '''
+    return FromJsonDicts((getattr(business, '_data', None) or business
+                          for business in businesses), use_numpy=use_numpy)
+
+
+def _Lookup(value, path):
+    for step in path:
+        if value is None:
+            return None
+        if isinstance(value, dict):
+            value = value.get(step)
+        elif isinstance(step, int):
+            if len(value) <= step:
+                return None
+            value = value[step]
+        else:
+            value = getattr(value, step, None)
+    return value
@@ -0,0 +1,227 @@
+'''Transparent compression of cached response bodies.'''
+
+import threading
+import time
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# zlib compression level; 6 is zlib's own default
+DEFAULT_LEVEL = 6
+
+# Bodies shorter than this are stored uncompressed
+DEFAULT_MIN_SIZE = 128
+
+# Size, in bytes, of dictionaries built by TrainDictionary
+DEFAULT_DICTIONARY_SIZE = 16 * 1024
+
+# The first byte of every stored entry says how the rest is encoded
+_RAW = '\x00'
+_ZLIB = '\x01'
+_GZIP = '\x02'
+_ZSTD = '\x03'
+
+
+class CompressedCacheError(Exception):
+    '''Base exception class for CompressedCache related errors'''
+
+
+def TrainDictionary(samples, size=DEFAULT_DICTIONARY_SIZE):
+    '''Build a zstd dictionary from sample response bodies.
+
+    Small JSON bodies share most of their keys and structure, which a
+    dictionary lets zstd avoid storing in every entry.  Requires the
+    zstandard package.
+
+    Args:
+      samples:
+        A list of response bodies, ideally a few hundred or more.
+      size:
+        The size of the dictionary, in bytes.
+
+    Returns:
+      The dictionary as a string, to be passed to CompressedCache and
+      persisted alongside the cache it was used with.
+    '''
+    if zstandard is None:
+        raise ImportError('TrainDictionary requires zstandard to be installed')
+    return zstandard.train_dictionary(size, list(samples)).as_bytes()
+
+
+class CompressedCache(object):
+    '''Compresses entries on their way into another cache, such as a
+    FileCache or SqliteCache, and decompresses them on the way out.
+
+    Bodies are compressed with zlib, or with zstd when a dictionary is
+    given.  Bodies the server sent gzipped are stored exactly as received
+    through SetGzipped, which the Api uses when it is available, so they
+    are never decompressed and compressed again.  Entries that fail to
+    decode, e.g. ones written with a different dictionary, read as misses.
+    '''
+
+    def __init__(self,
+                 cache,
+                 level=DEFAULT_LEVEL,
+                 dictionary=None,
+                 min_size=DEFAULT_MIN_SIZE):
+        '''
+        Args:
+          cache:
+            The cache entries are stored in.
+          level:
+            The compression level.
+          dictionary:
+            A dictionary returned by TrainDictionary.  If set, entries are
+            compressed with zstd, which requires the zstandard package.
+          min_size:
+            Bodies shorter than this are stored uncompressed.
+        '''
+        if dictionary is not None and zstandard is None:
+            raise ImportError('dictionary requires zstandard to be installed')
+        self.cache = cache
+        self.level = level
+        self.min_size = min_size
+        if dictionary is None:
+            self._dictionary = None
+        else:
+            self._dictionary = zstandard.ZstdCompressionDict(dictionary)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._bytes_in = 0
+        self._bytes_stored = 0
+
+    def Get(self, key):
+        return self._Decode(self.cache.Get(key))
+
+    def Set(self, key, data, cached_time=None):
+        self._Store(key, self._Encode(data), len(data), cached_time)
+
+    def SetGzipped(self, key, gzipped_data, size=None):
+        '''Store a body as the gzip stream it was received as.
+
+        Args:
+          key:
+            The cache key.
+          gzipped_data:
+            The gzip-encoded body.
+          size:
+            The decoded length of the body, used for GetStats only.
+        '''
+        self._Store(key, _GZIP + gzipped_data, size or len(gzipped_data), None)
+
+    def Remove(self, key):
+        self.cache.Remove(key)
+
+    def GetCachedTime(self, key):
+        return self.cache.GetCachedTime(key)
+
+    def GetIfFresh(self, key, max_age):
+        '''Return a (data, age) tuple for key, or None if it is missing or at
+        least max_age seconds old.  A max_age of None accepts any age.'''
+        get_if_fresh = getattr(self.cache, 'GetIfFresh', None)
+        if get_if_fresh is not None:
+            entry = get_if_fresh(key, max_age)
+        else:
+            entry = None
+            cached_time = self.cache.GetCachedTime(key)
+            if cached_time is not None:
+                age = time.time() - cached_time
+                if max_age is None or age < max_age:
+                    entry = self.cache.Get(key), age
+        if entry is None:
+            return None
+        data = self._Decode(entry[0])
+        if data is None:
+            return None
+        return data, entry[1]
+
+    def GetManyIfFresh(self, keys, max_age):
+        '''Look up many keys, in one call to the wrapped cache when it
+        supports GetManyIfFresh, like MemcachedCache.
+
+        Returns:
+          A dict of key to a (data, age) tuple for each key that is present
+          and less than max_age seconds old.
+        '''
+        get_many_if_fresh = getattr(self.cache, 'GetManyIfFresh', None)
+        fresh = {}
+        if get_many_if_fresh is None:
+            for key in keys:
+                entry = self.GetIfFresh(key, max_age)
+                if entry is not None:
+                    fresh[key] = entry
+            return fresh
+        for key, (stored, age) in get_many_if_fresh(keys, max_age).iteritems():
+            data = self._Decode(stored)
+            if data is not None:
+                fresh[key] = data, age
+        return fresh
+
+    def SetCacheTimeout(self, cache_timeout):
+        '''Passed on to the wrapped cache if it expires entries itself,
+        like MemcachedCache.'''
+        set_cache_timeout = getattr(self.cache, 'SetCacheTimeout', None)
+        if set_cache_timeout is not None:
+            set_cache_timeout(cache_timeout)
+
+    def GetStats(self):
+        '''Return the bytes given to Set and the bytes actually stored.'''
+        with self._lock:
+            return {'bytes_in': self._bytes_in,
+                    'bytes_stored': self._bytes_stored}
+
+    def _Store(self, key, stored, size, cached_time):
+        if cached_time is None:
+            self.cache.Set(key, stored)
+        else:
+            self.cache.Set(key, stored, cached_time=cached_time)
+        with self._lock:
+            self._bytes_in += size
+            self._bytes_stored += len(stored)
+
+    def _Encode(self, data):
+        if len(data) < self.min_size:
+            return _RAW + data
+        if self._dictionary is not None:
+            encoded = _ZSTD + self._GetZstd()[0].compress(data)
+        else:
+            encoded = _ZLIB + zlib.compress(data, self.level)
+        if len(encoded) > len(data):
+            return _RAW + data
+        return encoded
+
+    def _Decode(self, stored):
+        if not stored:
+            return None
+        encoding, encoded = stored[0], stored[1:]
+        try:
+            if encoding == _RAW:
+                return encoded
+            if encoding == _ZLIB:
+                return zlib.decompress(encoded)
+            if encoding == _GZIP:
+                return zlib.decompress(encoded, 16 + zlib.MAX_WBITS)
+            if encoding == _ZSTD and self._dictionary is not None:
+                return self._GetZstd()[1].decompress(encoded)
+        except zlib.error:
+            return None
+        except Exception, e:
+            if zstandard is not None and isinstance(e, zstandard.ZstdError):
+                return None
+            raise
+        # Written by something else, e.g. before compression was enabled
+        return None
+
+    def _GetZstd(self):
+        # zstd contexts are not thread-safe, so each thread keeps its own
+        # pair, built once since loading the dictionary is not cheap.
+        contexts = getattr(self._local, 'zstd', None)
+        if contexts is None:
+            contexts = self._local.zstd = (
+                zstandard.ZstdCompressor(level=self.level, dict_data=self._dictionary),
+                zstandard.ZstdDecompressor(dict_data=self._dictionary))
+        return contexts
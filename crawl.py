@@ -0,0 +1,384 @@
+'''Harvesting every business in a region with a pool of processes.'''
+
+import Queue
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+from collections import deque
+
+import yelp
+
+
+# Tiles are not split below this size, in degrees, about 55m
+DEFAULT_MIN_TILE_SIZE = 0.0005
+
+# Business ids fetched per task
+DEFAULT_CHUNK_SIZE = 20
+
+# Time, in seconds, between checkpoints
+DEFAULT_CHECKPOINT_INTERVAL = 30
+
+# Times a tile or business is tried before it is given up on
+DEFAULT_MAX_ATTEMPTS = 3
+
+# Time, in seconds, between checks that no worker process has died while
+# waiting for a task to finish
+WORKER_CHECK_INTERVAL = 1
+
+# Version of the checkpoint file format
+CHECKPOINT_VERSION = 1
+
+
+class CrawlError(Exception):
+    '''Base exception class for crawl related errors'''
+
+
+class Tile(object):
+    '''A rectangle of latitude and longitude, optionally restricted to a
+    category, searched with a bounds query.'''
+
+    __slots__ = ['south', 'west', 'north', 'east', 'category']
+
+    def __init__(self, south, west, north, east, category=None):
+        self.south = south
+        self.west = west
+        self.north = north
+        self.east = east
+        self.category = category
+
+    def __eq__(self, other):
+        return isinstance(other, Tile) and self.ToList() == other.ToList()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(tuple(self.ToList()))
+
+    def __repr__(self):
+        return 'Tile(%r, %r, %r, %r, category=%r)' % tuple(self.ToList())
+
+    def Size(self):
+        '''Return the longer side of the tile, in degrees.'''
+        return max(self.north - self.south, self.east - self.west)
+
+    def Split(self):
+        '''Return the four quadrants of the tile.'''
+        latitude = (self.south + self.north) / 2.0
+        longitude = (self.west + self.east) / 2.0
+        return [Tile(self.south, self.west, latitude, longitude, self.category),
+                Tile(self.south, longitude, latitude, self.east, self.category),
+                Tile(latitude, self.west, self.north, longitude, self.category),
+                Tile(latitude, longitude, self.north, self.east, self.category)]
+
+    def GetSearchParams(self):
+        '''Return the Search keyword arguments restricting it to the tile.'''
+        params = {'bounds': ((self.south, self.west), (self.north, self.east))}
+        if self.category:
+            params['category_filter'] = self.category
+        return params
+
+    def ToList(self):
+        return [self.south, self.west, self.north, self.east, self.category]
+
+    @staticmethod
+    def FromList(values):
+        return Tile(*values)
+
+
+def TileRegion(south, west, north, east, tile_size, categories=None):
+    '''Cover a region with square tiles.
+
+    Args:
+      south, west, north, east:
+        The region's edges, in degrees.
+      tile_size:
+        The side of a tile, in degrees.  Tiles holding more results than a
+        search can page through are split further while crawling, so this
+        only needs to be small enough to keep the number of splits down.
+      categories:
+        If given, a list of category filters; every tile is searched once
+        per category.
+
+    Returns:
+      A list of Tiles.
+    '''
+    tiles = []
+    for category in categories or [None]:
+        latitude = south
+        while latitude < north:
+            longitude = west
+            while longitude < east:
+                tiles.append(Tile(latitude, longitude,
+                                  min(latitude + tile_size, north),
+                                  min(longitude + tile_size, east),
+                                  category))
+                longitude += tile_size
+            latitude += tile_size
+    return tiles
+
+
+class Crawler(object):
+    '''Searches every tile of a region, then fetches each business found.
+
+    Searches and business fetches run on a pool of worker processes, each
+    with its own Api.  The parent process owns the work queue and the set
+    of business ids seen, so every business is fetched once however many
+    tiles it appears in.  A tile whose search total exceeds what a search
+    can page through is split into four, down to min_tile_size.
+
+    Progress is checkpointed to a file every checkpoint_interval seconds
+    and when the crawl stops, even when interrupted.  A Crawler created
+    with the same checkpoint_path carries on from there: finished tiles
+    are not searched again and businesses already returned are not
+    fetched again.  Work that was in flight is redone.
+    '''
+
+    def __init__(self,
+                 api_factory,
+                 tiles,
+                 checkpoint_path=None,
+                 processes=None,
+                 search_params=None,
+                 min_tile_size=DEFAULT_MIN_TILE_SIZE,
+                 result_cap=yelp.SEARCH_RESULT_CAP,
+                 chunk_size=DEFAULT_CHUNK_SIZE,
+                 checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL,
+                 max_attempts=DEFAULT_MAX_ATTEMPTS):
+        '''
+        Args:
+          api_factory:
+            A function, called once in each worker process, returning the
+            Api that process uses.
+          tiles:
+            The Tiles to search, e.g. from TileRegion.  Ignored when
+            resuming from a checkpoint.
+          checkpoint_path:
+            The file progress is saved to, or None to not checkpoint.
+          processes:
+            The number of worker processes.  Defaults to the CPU count.
+          search_params:
+            Further Search keyword arguments for every tile, e.g. a term.
+          min_tile_size:
+            Tiles are not split below this size, in degrees.
+          result_cap:
+            Tiles whose search total exceeds this are split.
+          chunk_size:
+            The number of business ids fetched per task.
+          checkpoint_interval:
+            Time, in seconds, between checkpoints.
+          max_attempts:
+            Times a tile search or business fetch is tried before it is
+            given up on and recorded in failures.
+        '''
+        self.api_factory = api_factory
+        self.checkpoint_path = checkpoint_path
+        self.processes = processes or multiprocessing.cpu_count()
+        self.search_params = search_params or {}
+        self.min_tile_size = min_tile_size
+        self.result_cap = result_cap
+        self.chunk_size = chunk_size
+        self.checkpoint_interval = checkpoint_interval
+        self.max_attempts = max_attempts
+        self.failures = []
+        self._tiles = deque(tiles)
+        self._ids = deque()
+        self._seen = set()
+        self._attempts = {}
+        self._stats = {'searches': 0,
+                       'splits': 0,
+                       'businesses': 0,
+                       'duplicates': 0,
+                       'errors': 0}
+        if checkpoint_path is not None and os.path.exists(checkpoint_path):
+            self._LoadCheckpoint()
+
+    def Run(self):
+        '''Crawl, yielding the decoded dict of each business as it is
+        fetched.  Stopping iteration early stops the crawl.  Raises
+        CrawlError if a worker process dies.'''
+        pool = multiprocessing.Pool(self.processes, _InitWorker, (self.api_factory,))
+        finished = Queue.Queue()
+        workers = set(process.pid for process in pool._pool)
+        in_flight = {}
+        # Businesses of the chunk being yielded, saved to the checkpoint if
+        # the caller stops partway through it
+        unyielded = deque()
+        next_task = 0
+        last_checkpoint = time.time()
+        try:
+            while self._tiles or self._ids or in_flight:
+                # Keep every worker busy, preferring businesses so that the
+                # queue of ids stays short
+                while len(in_flight) < 2 * self.processes and (self._tiles or self._ids):
+                    if self._ids:
+                        task = ('ids', [self._ids.popleft()
+                                        for _ in xrange(min(self.chunk_size, len(self._ids)))])
+                        function, args = _FetchBusinesses, (task[1],)
+                    else:
+                        task = ('tile', self._tiles.popleft())
+                        function, args = _SearchTile, (task[1].ToList(), self.search_params,
+                                                       self._CanSplit(task[1]), self.result_cap)
+                    in_flight[next_task] = task
+                    pool.apply_async(function, args,
+                                     callback=lambda outcome, number=next_task:
+                                         finished.put((number, outcome)))
+                    next_task += 1
+
+                number, (outcome, errors) = self._WaitForTask(pool, finished, workers)
+                kind, work = in_flight.pop(number)
+                for failed, error in errors:
+                    self._Retry(kind, failed, error)
+                if kind == 'tile':
+                    if outcome is not None:
+                        self._HandleSearch(work, outcome)
+                else:
+                    unyielded.extend(outcome)
+                    while unyielded:
+                        business = unyielded.popleft()
+                        self._stats['businesses'] += 1
+                        yield business
+
+                if self.checkpoint_path is not None and \
+                   time.time() - last_checkpoint >= self.checkpoint_interval:
+                    self._SaveCheckpoint(in_flight.values())
+                    last_checkpoint = time.time()
+        finally:
+            pool.terminate()
+            pool.join()
+            self._ids.extendleft(reversed([business['id'] for business in unyielded]))
+            if self.checkpoint_path is not None:
+                self._SaveCheckpoint(in_flight.values())
+
+    def GetStats(self):
+        '''Return a dict of search, split, business, duplicate and error
+        counters, and the amount of work still queued.'''
+        stats = dict(self._stats)
+        stats['tiles_queued'] = len(self._tiles)
+        stats['ids_queued'] = len(self._ids)
+        stats['seen'] = len(self._seen)
+        return stats
+
+    def _WaitForTask(self, pool, finished, workers):
+        # A short timeout keeps the wait interruptible by Ctrl-C.  The pool
+        # replaces a worker that dies, but the task it was running never
+        # finishes, so a changed set of workers ends the crawl; the
+        # checkpoint keeps that task to be redone on resume.
+        while True:
+            try:
+                return finished.get(timeout=WORKER_CHECK_INTERVAL)
+            except Queue.Empty:
+                if any(not process.is_alive() for process in pool._pool) or \
+                   set(process.pid for process in pool._pool) != workers:
+                    raise CrawlError('A worker process died')
+
+    def _CanSplit(self, tile):
+        return tile.Size() / 2.0 >= self.min_tile_size
+
+    def _HandleSearch(self, tile, outcome):
+        self._stats['searches'] += 1
+        total, ids = outcome
+        if ids is None:
+            self._stats['splits'] += 1
+            self._tiles.extend(tile.Split())
+            return
+        for id in ids:
+            if id in self._seen:
+                self._stats['duplicates'] += 1
+            else:
+                self._seen.add(id)
+                self._ids.append(id)
+
+    def _Retry(self, kind, work, error):
+        # Failed work goes to the back of the queue, so a bad tile or id
+        # cannot stall the crawl, until it runs out of attempts.
+        self._stats['errors'] += 1
+        if kind == 'tile':
+            key = ('tile',) + tuple(work.ToList())
+        else:
+            key = work
+        attempts = self._attempts.get(key, 0) + 1
+        if attempts >= self.max_attempts:
+            self._attempts.pop(key, None)
+            if kind == 'tile':
+                work = work.ToList()
+            self.failures.append([kind, work, error])
+        elif kind == 'tile':
+            self._attempts[key] = attempts
+            self._tiles.append(work)
+        else:
+            self._attempts[key] = attempts
+            self._ids.append(work)
+
+    def _LoadCheckpoint(self):
+        with open(self.checkpoint_path) as fp:
+            state = json.load(fp)
+        if state.get('version') != CHECKPOINT_VERSION:
+            raise CrawlError('Unsupported checkpoint version %r in %s' %
+                             (state.get('version'), self.checkpoint_path))
+        self._tiles = deque(Tile.FromList(values) for values in state['tiles'])
+        self._ids = deque(state['ids'])
+        self._seen = set(state['seen'])
+        self._stats.update(state['stats'])
+        self.failures = state['failures']
+
+    def _SaveCheckpoint(self, in_flight):
+        tiles = [tile.ToList() for tile in self._tiles]
+        ids = list(self._ids)
+        for kind, work in in_flight:
+            if kind == 'tile':
+                tiles.append(work.ToList())
+            else:
+                ids.extend(work)
+        state = {'version': CHECKPOINT_VERSION,
+                 'tiles': tiles,
+                 'ids': ids,
+                 'seen': list(self._seen),
+                 'stats': self._stats,
+                 'failures': self.failures}
+        directory = os.path.dirname(os.path.abspath(self.checkpoint_path))
+        temp_fd, temp_path = tempfile.mkstemp(dir=directory)
+        temp_fp = os.fdopen(temp_fd, 'w')
+        json.dump(state, temp_fp)
+        temp_fp.close()
+        os.rename(temp_path, self.checkpoint_path)
+
+
+# The Api of a worker process, built by _InitWorker
+_worker_api = None
+
+
+def _InitWorker(api_factory):
+    global _worker_api
+    _worker_api = api_factory()
+    # Plain dicts are cheaper to send back to the parent than models
+    _worker_api.SetResponseFormat(yelp.RESPONSE_DICT)
+
+
+def _SearchTile(tile, search_params, can_split, result_cap):
+    # Returns ((total, ids), errors), with ids None if the tile must be split
+    try:
+        params = dict(search_params, **Tile.FromList(tile).GetSearchParams())
+        page = _worker_api.Search(offset=0, limit=yelp.SEARCH_PAGE_SIZE, **params)
+        total = page.get('total', 0)
+        if total > result_cap and can_split:
+            return (total, None), []
+        ids = [business['id'] for business in page.get('businesses', [])]
+        if len(ids) < total:
+            ids.extend(business['id'] for business in
+                       _worker_api.IterSearch(offset=len(ids), **params))
+        return (total, ids), []
+    except Exception, error:
+        return None, [(Tile.FromList(tile), repr(error))]
+
+
+def _FetchBusinesses(ids):
+    # Returns (businesses, errors), with an (id, error) pair for each failure
+    try:
+        results = _worker_api.GetBusinesses(ids)
+    except Exception, error:
+        return [], [(id, repr(error)) for id in ids]
+    return ([result.result for result in results if result.error is None],
+            [(result.request, repr(result.error)) for result in results if result.error is not None])
@@ -0,0 +1,246 @@
+'''Streaming export of businesses to newline-delimited JSON or CSV files.'''
+
+import csv
+import gzip
+import json
+from collections import OrderedDict
+
+from columns import _Lookup
+
+
+FORMAT_NDJSON = 'ndjson'
+FORMAT_CSV = 'csv'
+
+# Bytes buffered in memory before they are written to disk
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+
+
+def _Join(separator):
+    def Join(values):
+        if not values:
+            return None
+        return separator.join(values)
+    return Join
+
+
+def _Aliases(categories):
+    if not categories:
+        return None
+    return ','.join(category[1] for category in categories if len(category) > 1)
+
+
+# (field name, path to the value in a business dict or model, function
+# applied to the value or None).  The first review, the only one the
+# business API returns, is flattened along with its user.
+FIELDS = [('id', ('id',), None),
+          ('name', ('name',), None),
+          ('rating', ('rating',), None),
+          ('review_count', ('review_count',), None),
+          ('is_closed', ('is_closed',), None),
+          ('is_claimed', ('is_claimed',), None),
+          ('phone', ('phone',), None),
+          ('url', ('url',), None),
+          ('categories', ('categories',), _Aliases),
+          ('snippet_text', ('snippet_text',), None),
+          ('deals', ('deals',), None),
+          ('location_address', ('location', 'address'), _Join(', ')),
+          ('location_city', ('location', 'city'), None),
+          ('location_state_code', ('location', 'state_code'), None),
+          ('location_postal_code', ('location', 'postal_code'), None),
+          ('location_country_code', ('location', 'country_code'), None),
+          ('location_neighborhoods', ('location', 'neighborhoods'), _Join(', ')),
+          ('location_latitude', ('location', 'coordinate', 'latitude'), None),
+          ('location_longitude', ('location', 'coordinate', 'longitude'), None),
+          ('review_id', ('reviews', 0, 'id'), None),
+          ('review_rating', ('reviews', 0, 'rating'), None),
+          ('review_excerpt', ('reviews', 0, 'excerpt'), None),
+          ('review_time_created', ('reviews', 0, 'time_created'), None),
+          ('review_user_id', ('reviews', 0, 'user', 'id'), None),
+          ('review_user_name', ('reviews', 0, 'user', 'name'), None)]
+
+
+class ExportError(Exception):
+    '''Base exception class for export related errors'''
+
+
+def FlattenBusiness(business):
+    '''Return an OrderedDict of FIELDS for a Business or decoded business
+    dict.  Lazily built businesses are read from the dicts they wrap.'''
+    business = getattr(business, '_data', None) or business
+    flat = OrderedDict()
+    for name, path, transform in FIELDS:
+        value = _Lookup(business, path)
+        if transform is not None:
+            value = transform(value)
+        flat[name] = value
+    return flat
+
+
+def IterBusinesses(items):
+    '''Yield the businesses in an iterable of Business objects, decoded
+    business dicts, SearchResultSets, decoded search responses, or the raw
+    bodies of business or search responses.
+
+    Raises ExportError on a response holding an API error, rather than
+    exporting it as a business.'''
+    for item in items:
+        if isinstance(item, basestring):
+            item = json.loads(item)
+        if isinstance(item, dict):
+            if 'error' in item:
+                raise ExportError('Response holds an API error: %r' % (item['error'],))
+            if 'businesses' in item:
+                for business in item['businesses']:
+                    yield business
+            else:
+                yield item
+        elif hasattr(item, 'businesses'):
+            # A lazy SearchResultSet's dicts are exported without building models
+            data = getattr(item, '_data', None)
+            if data is not None:
+                for business in data.get('businesses', []):
+                    yield business
+            else:
+                for business in item.businesses:
+                    yield business
+        else:
+            yield item
+
+
+class Exporter(object):
+    '''Writes businesses to one or more files as they arrive, one record
+    per line, so memory use does not grow with the number exported.
+
+    Usage:
+      with Exporter('businesses-%03d.ndjson.gz', compress=True,
+                    max_bytes=256 * 1024 * 1024) as exporter:
+          exporter.WriteMany(crawler.Run())
+      print exporter.paths
+    '''
+
+    def __init__(self,
+                 path,
+                 format=FORMAT_NDJSON,
+                 compress=False,
+                 max_bytes=None,
+                 buffer_size=DEFAULT_BUFFER_SIZE):
+        '''
+        Args:
+          path:
+            The file to write.  With max_bytes it must hold a %d, replaced
+            by the number of each file, starting from 0.
+          format:
+            FORMAT_NDJSON or FORMAT_CSV.  CSV files each start with a header
+            row, and list values such as deals are written as JSON.
+          compress:
+            If True, files are gzip compressed.
+          max_bytes:
+            Start a new file once one holds this many bytes.  Compressed
+            files are measured before compression, as zlib only writes out
+            its output in blocks, so they end up smaller on disk.  Records
+            are never split across files.
+          buffer_size:
+            Bytes buffered before they are written to disk.
+        '''
+        if format not in (FORMAT_NDJSON, FORMAT_CSV):
+            raise ExportError('Unknown format %r' % (format,))
+        if max_bytes is not None and '%' not in path:
+            raise ExportError('Rotating files needs a %%d in the path, not %r' % (path,))
+        self.path = path
+        self.format = format
+        self.compress = compress
+        self.max_bytes = max_bytes
+        self.buffer_size = buffer_size
+        self.paths = []
+        self.count = 0
+        self._file = None
+        self._stream = None
+        self._writer = None
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.Close()
+
+    def Write(self, item):
+        '''Write every business in an item, of any kind IterBusinesses takes.
+
+        Returns:
+          The number of businesses written.
+        '''
+        return self.WriteMany([item])
+
+    def WriteMany(self, items):
+        '''Write every business in an iterable, consuming it lazily.
+
+        Returns:
+          The number of businesses written.
+        '''
+        if self._closed:
+            # Reopening the path would truncate what was already exported
+            raise ExportError('Exporter to %s is closed' % self.path)
+        written = 0
+        for business in IterBusinesses(items):
+            if self._stream is None:
+                self._Open()
+            flat = FlattenBusiness(business)
+            if self._writer is None:
+                self._stream.write(json.dumps(flat, separators=(',', ':')) + '\n')
+            else:
+                self._writer.writerow([_CsvValue(value) for value in flat.itervalues()])
+            written += 1
+            if self.max_bytes is not None and self._stream.size >= self.max_bytes:
+                self._CloseFile()
+        self.count += written
+        return written
+
+    def Close(self):
+        '''Flush and close the current file.  Nothing more can be written.'''
+        self._CloseFile()
+        self._closed = True
+
+    def _Open(self):
+        if self.max_bytes is None:
+            path = self.path
+        else:
+            path = self.path % len(self.paths)
+        self._file = open(path, 'wb', self.buffer_size)
+        if self.compress:
+            self._stream = _CountingStream(gzip.GzipFile(fileobj=self._file, mode='wb'))
+        else:
+            self._stream = _CountingStream(self._file)
+        if self.format == FORMAT_CSV:
+            self._writer = csv.writer(self._stream)
+            self._writer.writerow([name for name, _, _ in FIELDS])
+        self.paths.append(path)
+
+    def _CloseFile(self):
+        if self._stream is not None:
+            if self._stream.stream is not self._file:
+                self._stream.stream.close()
+            self._file.close()
+        self._file = self._stream = self._writer = None
+
+
+class _CountingStream(object):
+    '''Counts the bytes written to a file, before any compression.'''
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.size = 0
+
+    def write(self, data):
+        self.stream.write(data)
+        self.size += len(data)
+
+
+def _CsvValue(value):
+    if value is None:
+        return ''
+    if isinstance(value, (list, dict)):
+        return json.dumps(value)
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return value
@@ -1,34 +1,115 @@
 import os
+import re
+import tarfile
 import tempfile
+import threading
+import time
+from collections import OrderedDict
 try:
     from hashlib import md5
 except ImportError:
     from md5 import md5
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
 
 class FileCacheError(Exception):
     '''Base exception class for FileCache related errors'''
 
 
+def GetUsername():
+    '''Attempt to find the username in a cross-platform fashion.'''
+    try:
+        return os.getenv('USER') or \
+               os.getenv('LOGNAME') or \
+               os.getenv('USERNAME') or \
+               os.getlogin() or \
+               'nobody'
+    except (AttributeError, IOError, OSError):
+        return 'nobody'
+
+
 class FileCache(object):
 
     DEPTH = 3
 
-    def __init__(self, root_directory=None):
+    # Name of the file, in the root directory, persisting the entry index
+    INDEX_FILE = 'index'
+
+    # Writes appended to INDEX_FILE since the last Sweep, beyond the number
+    # of entries indexed, after which a write runs Sweep to compact it
+    COMPACT_SLACK = 1000
+
+    _HASHED_KEY = re.compile('^[0-9a-f]{32}$')
+
+    def __init__(self,
+                 root_directory=None,
+                 max_entries=None,
+                 max_bytes=None,
+                 max_age=None,
+                 sweep_interval=None):
+        '''
+        Args:
+          root_directory:
+            Where entries are stored.  Defaults to a per-user directory
+            under the system temporary directory.
+          max_entries:
+            The most entries kept, or None for no limit.
+          max_bytes:
+            The most bytes of data kept, or None for no limit.
+          max_age:
+            Time, in seconds, after which Sweep removes an entry, or None.
+          sweep_interval:
+            If set, Sweep runs on a background thread this often, in seconds.
+
+        When any limit is set, an index of entry sizes and write times is
+        kept in memory, so that size accounting never needs to walk the
+        directory tree after the first run.  Every write and removal, by any
+        FileCache on the same directory, is appended to INDEX_FILE, and
+        Sweep merges in those made by other processes and compacts the
+        file.  Caches without limits append to INDEX_FILE only if it
+        existed when they were created.  Entries beyond max_entries or
+        max_bytes are evicted least recently used first as soon as they are
+        written.
+        '''
         self._InitializeRootDirectory(root_directory)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._index = None
+        self._bytes = 0
+        self._appended = 0
+        self._lock = threading.Lock()
+        self._sweeper = None
+        if max_entries is not None or max_bytes is not None or max_age is not None:
+            self._LoadIndex()
+        # Checked once rather than on every write, as most caches have no limits
+        self._journal = self._index is not None or os.path.exists(self._GetIndexPath())
+        if sweep_interval:
+            self.StartSweeper(sweep_interval)
 
     def Get(self, key):
         path = self._GetPath(key)
         if os.path.exists(path):
+            self._Touch(path)
             return open(path).read()
         else:
             return None
 
-    def Set(self, key, data):
-        path = self._GetPath(key)
+    def Set(self, key, data, cached_time=None):
+        self._Write(self._GetPath(key), data, cached_time)
+
+    def _Write(self, path, data, cached_time=None):
         directory = os.path.dirname(path)
         if not os.path.exists(directory):
-            os.makedirs(directory)
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # Another writer may have created it in the meantime
+                pass
         if not os.path.isdir(directory):
             raise FileCacheError('%s exists but is not a directory' %
                                   directory)
@@ -39,9 +120,33 @@ class FileCache(object):
         if not path.startswith(self._root_directory):
             raise FileCacheError('%s does not appear to live under %s' %
                                 (path, self._root_directory))
-        if os.path.exists(path):
-            os.remove(path)
-        os.rename(temp_path, path)
+        if cached_time is None:
+            cached_time = time.time()
+        else:
+            os.utime(temp_path, (cached_time, cached_time))
+        hashed_key = os.path.basename(path)
+        evicted = []
+        # The file is replaced under the lock too, so _RemoveFiles never
+        # removes a file newer than the index entry it checked
+        with self._lock:
+            try:
+                os.rename(temp_path, path)
+            except OSError:
+                # Windows will not rename over an existing file
+                if os.path.exists(path):
+                    os.remove(path)
+                os.rename(temp_path, path)
+            if self._index is not None:
+                self._Forget(hashed_key)
+                self._index[hashed_key] = (len(data), cached_time)
+                self._bytes += len(data)
+                evicted = self._PopOverflow()
+        self._AppendIndex('%s %d %r\n' % (hashed_key, len(data), cached_time))
+        self._RemoveFiles(evicted)
+        if self._index is not None:
+            self._appended += 1
+            if self._appended > len(self._index) + FileCache.COMPACT_SLACK:
+                self.Sweep()
 
     def Remove(self, key):
         path = self._GetPath(key)
@@ -50,6 +155,10 @@ class FileCache(object):
                                 (path, self._root_directory))
         if os.path.exists(path):
             os.remove(path)
+        if self._index is not None:
+            with self._lock:
+                self._Forget(os.path.basename(path))
+        self._AppendIndex('%s -\n' % os.path.basename(path))
 
     def GetCachedTime(self, key):
         path = self._GetPath(key)
@@ -58,19 +167,338 @@ class FileCache(object):
         else:
             return None
 
-    def _GetUsername(self):
-        '''Attempt to find the username in a cross-platform fashion.'''
+    def GetIfFresh(self, key, max_age):
+        '''Return the data cached under key along with its age, in seconds,
+        as a (data, age) tuple, or None if it is missing or at least max_age
+        seconds old.  A max_age of None accepts entries of any age.
+
+        Unlike calling GetCachedTime and then Get, this opens the file once,
+        so the data and age always describe the same write.
+        '''
+        path = self._GetPath(key)
+        try:
+            fp = open(path)
+        except IOError:
+            return None
+        try:
+            age = time.time() - os.fstat(fp.fileno()).st_mtime
+            if max_age is not None and age >= max_age:
+                return None
+            self._Touch(path)
+            return fp.read(), age
+        finally:
+            fp.close()
+
+    def Sweep(self):
+        '''Merge in the writes and removals other processes appended to
+        INDEX_FILE, remove entries older than max_age, enforce the size
+        limits and compact INDEX_FILE.'''
+        if self._index is None:
+            return
+        # The index file is locked so that no other process appends to it
+        # between reading and replacing it
+        fd = os.open(self._GetIndexPath(), os.O_RDWR | os.O_CREAT, 0644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            with os.fdopen(os.dup(fd)) as fp:
+                on_disk = self._ReadIndex(fp)
+            with self._lock:
+                self._MergeIndex(on_disk)
+                expired = []
+                if self.max_age is not None:
+                    expired_before = time.time() - self.max_age
+                    expired = [hashed_key for hashed_key, (_, mtime) in self._index.iteritems()
+                               if mtime < expired_before]
+                    for hashed_key in expired:
+                        self._Forget(hashed_key)
+                expired.extend(self._PopOverflow())
+                self._SaveIndex()
+                self._appended = 0
+        finally:
+            os.close(fd)
+        # Files are removed without holding the lock, so that reads and
+        # writes carry on meanwhile
+        self._RemoveFiles(expired, journal=False)
+
+    def StartSweeper(self, interval):
+        '''Run Sweep every interval seconds on a daemon thread.'''
+        if self._index is None:
+            raise FileCacheError('Sweeping needs max_entries, max_bytes or max_age')
+        self.StopSweeper()
+        self._sweeper = _Sweeper(self, interval)
+        self._sweeper.start()
+
+    def StopSweeper(self):
+        '''Stop the background sweeper, if running.'''
+        if self._sweeper is not None:
+            self._sweeper.Stop()
+            self._sweeper = None
+
+    def GetStats(self):
+        '''Return the number of entries and bytes tracked by the index.'''
+        if self._index is None:
+            return None
+        with self._lock:
+            return {'entries': len(self._index), 'bytes': self._bytes}
+
+    def ExportArchive(self, path, max_age=None, compress=True):
+        '''Write every entry to a tar archive, e.g. to seed the cache of
+        another host with ImportArchive.
+
+        Entries keep their write times, to the microsecond, so
+        GetCachedTime and GetIfFresh see the same ages after an import.
+
+        Args:
+          path:
+            The archive to write.
+          max_age:
+            If set, entries at least this old, in seconds, are left out.
+          compress:
+            If True, the archive is gzip compressed.
+
+        Returns:
+          The number of entries exported.
+        '''
+        if compress:
+            mode = 'w:gz'
+        else:
+            mode = 'w'
+        exported = 0
+        now = time.time()
+        archive = tarfile.open(path, mode, format=tarfile.PAX_FORMAT)
         try:
-            return os.getenv('USER') or \
-                   os.getenv('LOGNAME') or \
-                   os.getenv('USERNAME') or \
-                   os.getlogin() or \
-                   'nobody'
-        except (AttributeError, IOError, OSError):
-            return 'nobody'
+            for hashed_key, entry_path in self._IterFiles():
+                try:
+                    fp = open(entry_path, 'rb')
+                except IOError:
+                    # Removed since the walk, e.g. by another process
+                    continue
+                try:
+                    stat = os.fstat(fp.fileno())
+                    if max_age is not None and now - stat.st_mtime >= max_age:
+                        continue
+                    info = tarfile.TarInfo(os.path.join(self._GetPrefix(hashed_key), hashed_key))
+                    info.size = stat.st_size
+                    info.mtime = stat.st_mtime
+                    # tarfile itself would round the time to 12 digits
+                    info.pax_headers = {u'mtime': unicode(repr(stat.st_mtime))}
+                    info.mode = 0644
+                    archive.addfile(info, fp)
+                    exported += 1
+                finally:
+                    fp.close()
+        finally:
+            archive.close()
+        return exported
+
+    def ImportArchive(self, path, max_age=None, overwrite=False):
+        '''Add the entries of an archive written by ExportArchive.
+
+        Args:
+          path:
+            The archive to read, compressed or not.
+          max_age:
+            If set, entries at least this old, in seconds, are skipped.
+          overwrite:
+            If False, entries are skipped when the cache already holds a
+            write of the same key at least as recent.
+
+        Returns:
+          A dict of the number of entries imported and skipped.
+        '''
+        stats = {'imported': 0, 'skipped': 0}
+        now = time.time()
+        archive = tarfile.open(path, 'r:*')
+        try:
+            for info in archive:
+                hashed_key = os.path.basename(info.name)
+                # Members are never extracted by name, so an archive cannot
+                # write outside the root directory
+                if not info.isfile() or not FileCache._HASHED_KEY.match(hashed_key):
+                    continue
+                entry_path = self._GetPathForHashedKey(hashed_key)
+                if max_age is not None and now - info.mtime >= max_age:
+                    stats['skipped'] += 1
+                    continue
+                if not overwrite:
+                    try:
+                        if os.path.getmtime(entry_path) >= info.mtime:
+                            stats['skipped'] += 1
+                            continue
+                    except OSError:
+                        pass
+                self._Write(entry_path, archive.extractfile(info).read(), info.mtime)
+                stats['imported'] += 1
+        finally:
+            archive.close()
+        return stats
+
+    def _Touch(self, path):
+        # Marks an entry as most recently used.
+        if self._index is not None:
+            hashed_key = os.path.basename(path)
+            with self._lock:
+                entry = self._index.pop(hashed_key, None)
+                if entry is not None:
+                    self._index[hashed_key] = entry
+
+    def _Forget(self, hashed_key):
+        # Must be called with the lock held.
+        entry = self._index.pop(hashed_key, None)
+        if entry is not None:
+            self._bytes -= entry[0]
+
+    def _PopOverflow(self):
+        # Must be called with the lock held.  Drops the least recently used
+        # entries beyond the limits from the index and returns their hashed
+        # keys, for _RemoveFiles.
+        evicted = []
+        while self._index and \
+              ((self.max_entries is not None and len(self._index) > self.max_entries) or
+               (self.max_bytes is not None and self._bytes > self.max_bytes)):
+            evicted.append(next(iter(self._index)))
+            self._Forget(evicted[-1])
+        return evicted
+
+    def _RemoveFiles(self, hashed_keys, journal=True):
+        # Must be called without the lock held.  Keys written again since
+        # they were dropped from the index are skipped.  The index file is
+        # locked first, as in Sweep, so that a removal is journalled before
+        # any write of the same key that follows it.
+        for hashed_key in hashed_keys:
+            fd = None
+            if journal:
+                fd = self._LockIndex()
+            try:
+                with self._lock:
+                    if self._index is not None and hashed_key in self._index:
+                        continue
+                    try:
+                        os.remove(self._GetPathForHashedKey(hashed_key))
+                    except OSError:
+                        # Already removed, e.g. by another process
+                        pass
+                if fd is not None:
+                    os.write(fd, '%s -\n' % hashed_key)
+            finally:
+                if fd is not None:
+                    os.close(fd)
+
+    def _AppendIndex(self, line):
+        fd = self._LockIndex()
+        if fd is not None:
+            try:
+                os.write(fd, line)
+            finally:
+                os.close(fd)
+
+    def _LockIndex(self):
+        # Returns a descriptor of INDEX_FILE open for appending and locked
+        # against Sweep, or None if it is not kept.  Caches without limits
+        # only keep an existing index file up to date, for those sharing the
+        # directory that have limits.
+        if not self._journal:
+            return None
+        flags = os.O_WRONLY | os.O_APPEND
+        if self._index is not None:
+            flags |= os.O_CREAT
+        while True:
+            try:
+                fd = os.open(self._GetIndexPath(), flags, 0644)
+            except OSError:
+                return None
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                if os.fstat(fd).st_nlink == 0:
+                    # Replaced by a Sweep while waiting for the lock
+                    os.close(fd)
+                    continue
+            return fd
+
+    def _GetIndexPath(self):
+        return os.path.join(self._root_directory, FileCache.INDEX_FILE)
+
+    def _LoadIndex(self):
+        try:
+            fp = open(self._GetIndexPath())
+        except IOError:
+            self._index = self._BuildIndex()
+            self._SaveIndex()
+        else:
+            try:
+                self._index = self._ReadIndex(fp)
+            finally:
+                fp.close()
+        self._bytes = sum(size for size, _ in self._index.itervalues())
+
+    def _ReadIndex(self, fp):
+        # Entries are listed least recently written first as
+        # "<hashed key> <size> <mtime>" lines, and removals as
+        # "<hashed key> -" lines.
+        index = OrderedDict()
+        for line in fp:
+            fields = line.split()
+            if len(fields) == 2 and fields[1] == '-':
+                index.pop(fields[0], None)
+            elif len(fields) == 3:
+                try:
+                    entry = (int(fields[1]), float(fields[2]))
+                except ValueError:
+                    # Cut short by a crash
+                    continue
+                index.pop(fields[0], None)
+                index[fields[0]] = entry
+        return index
+
+    def _MergeIndex(self, on_disk):
+        # Must be called with the lock held.  The file records the writes
+        # of every process.  Entries this process knows of keep its least
+        # recently used order, after those only other processes wrote.
+        merged = OrderedDict((hashed_key, entry) for hashed_key, entry in on_disk.iteritems()
+                             if hashed_key not in self._index)
+        for hashed_key in self._index:
+            if hashed_key in on_disk:
+                merged[hashed_key] = on_disk[hashed_key]
+        self._index = merged
+        self._bytes = sum(size for size, _ in merged.itervalues())
+
+    def _BuildIndex(self):
+        # Walks the tree once, for caches written before an index existed.
+        entries = []
+        for hashed_key, path in self._IterFiles():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, hashed_key, stat.st_size))
+        entries.sort()
+        return OrderedDict((filename, (size, mtime)) for mtime, filename, size in entries)
+
+    def _IterFiles(self):
+        # Yields (hashed key, path) for every entry on disk.
+        for directory, _, filenames in os.walk(self._root_directory):
+            for filename in filenames:
+                if FileCache._HASHED_KEY.match(filename):
+                    yield filename, os.path.join(directory, filename)
+
+    def _SaveIndex(self):
+        # Must be called with the lock held.
+        temp_fd, temp_path = tempfile.mkstemp(dir=self._root_directory)
+        temp_fp = os.fdopen(temp_fd, 'w')
+        for hashed_key, (size, mtime) in self._index.iteritems():
+            temp_fp.write('%s %d %r\n' % (hashed_key, size, mtime))
+        temp_fp.close()
+        try:
+            os.rename(temp_path, self._GetIndexPath())
+        except OSError:
+            # Windows will not rename over an existing file
+            if os.path.exists(self._GetIndexPath()):
+                os.remove(self._GetIndexPath())
+            os.rename(temp_path, self._GetIndexPath())
 
     def _GetTmpCachePath(self):
-        username = self._GetUsername()
+        username = GetUsername()
         cache_directory = 'python.cache_' + username
         return os.path.join(tempfile.gettempdir(), cache_directory)
 
@@ -91,9 +519,34 @@ class FileCache(object):
         except TypeError:
             hashed_key = md5.new(key).hexdigest()
 
+        return self._GetPathForHashedKey(hashed_key)
+
+    def _GetPathForHashedKey(self, hashed_key):
         return os.path.join(self._root_directory,
                             self._GetPrefix(hashed_key),
                             hashed_key)
 
     def _GetPrefix(self, hashed_key):
         return os.path.sep.join(hashed_key[0:FileCache.DEPTH])
+
+
+class _Sweeper(threading.Thread):
+    '''Calls FileCache.Sweep periodically until stopped.'''
+
+    def __init__(self, cache, interval):
+        threading.Thread.__init__(self, name='FileCache sweeper')
+        self.daemon = True
+        self._cache = cache
+        self._interval = interval
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self._interval):
+            try:
+                self._cache.Sweep()
+            except (IOError, OSError):
+                # Try again on the next pass
+                pass
+
+    def Stop(self):
+        self._stopped.set()
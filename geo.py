@@ -0,0 +1,310 @@
+'''Spatial indexing of businesses gathered from many searches.'''
+
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# Mean radius of the earth, in meters.
+EARTH_RADIUS = 6371008.8
+
+# Side of a grid cell in degrees of latitude, about 1.1km.
+DEFAULT_CELL_SIZE = 0.01
+
+_METERS_PER_DEGREE = math.pi * EARTH_RADIUS / 180
+
+
+def Haversine(latitude, longitude, latitudes, longitudes):
+    '''Return the great-circle distances, in meters, from one point to each
+    of a sequence of points.
+
+    With numpy installed the computation is vectorized and a numpy array is
+    returned, otherwise a list.
+    '''
+    if numpy is not None:
+        latitudes = numpy.radians(numpy.asarray(latitudes, dtype=float))
+        longitudes = numpy.radians(numpy.asarray(longitudes, dtype=float))
+        latitude, longitude = math.radians(latitude), math.radians(longitude)
+        a = numpy.sin((latitudes - latitude) / 2) ** 2 + \
+            math.cos(latitude) * numpy.cos(latitudes) * numpy.sin((longitudes - longitude) / 2) ** 2
+        return 2 * EARTH_RADIUS * numpy.arcsin(numpy.sqrt(numpy.minimum(a, 1.0)))
+    return [_Haversine(latitude, longitude, other_latitude, other_longitude)
+            for other_latitude, other_longitude in zip(latitudes, longitudes)]
+
+
+def _HaversineMatrix(latitudes, longitudes, other_latitudes, other_longitudes):
+    # Distances from each of a sequence of points, as rows, to each of
+    # another, as columns.  Needs numpy.
+    latitudes = numpy.radians(numpy.asarray(latitudes, dtype=float))[:, numpy.newaxis]
+    longitudes = numpy.radians(numpy.asarray(longitudes, dtype=float))[:, numpy.newaxis]
+    other_latitudes = numpy.radians(numpy.asarray(other_latitudes, dtype=float))
+    other_longitudes = numpy.radians(numpy.asarray(other_longitudes, dtype=float))
+    a = numpy.sin((other_latitudes - latitudes) / 2) ** 2 + \
+        numpy.cos(latitudes) * numpy.cos(other_latitudes) * \
+        numpy.sin((other_longitudes - longitudes) / 2) ** 2
+    return 2 * EARTH_RADIUS * numpy.arcsin(numpy.sqrt(numpy.minimum(a, 1.0)))
+
+
+def _Haversine(latitude, longitude, other_latitude, other_longitude):
+    latitude, longitude = math.radians(latitude), math.radians(longitude)
+    other_latitude, other_longitude = math.radians(other_latitude), math.radians(other_longitude)
+    a = math.sin((other_latitude - latitude) / 2) ** 2 + \
+        math.cos(latitude) * math.cos(other_latitude) * math.sin((other_longitude - longitude) / 2) ** 2
+    return 2 * EARTH_RADIUS * math.asin(math.sqrt(min(a, 1.0)))
+
+
+class SpatialIndex(object):
+    '''A uniform grid over the coordinates of businesses, deduplicated by id.
+
+    Businesses may be Business objects or decoded business dicts; those
+    without a coordinate are skipped.  Queries return (business, meters)
+    pairs sorted by distance.
+    '''
+
+    def __init__(self, cell_size=DEFAULT_CELL_SIZE):
+        '''
+        Args:
+          cell_size:
+            Side of a grid cell, in degrees.  Queries are fastest when it is
+            close to the typical query radius.
+        '''
+        self.cell_size = cell_size
+        self._ids = {}
+        self._businesses = []
+        self._latitudes = []
+        self._longitudes = []
+        self._cells = {}
+        self._bounds = None
+        self._arrays = None
+        self.duplicates = 0
+
+    def __len__(self):
+        return len(self._businesses)
+
+    def __contains__(self, id):
+        return id in self._ids
+
+    def Get(self, id):
+        '''Return the business indexed under id, or None.'''
+        index = self._ids.get(id)
+        if index is None:
+            return None
+        return self._businesses[index]
+
+    def Add(self, business):
+        '''Index a business.
+
+        Returns:
+          True if it was added, False if a business with the same id was
+          already indexed or it has no coordinate.
+        '''
+        id = _Get(business, 'id')
+        if id in self._ids:
+            self.duplicates += 1
+            return False
+        coordinate = _Get(_Get(business, 'location'), 'coordinate') or {}
+        latitude = coordinate.get('latitude')
+        longitude = coordinate.get('longitude')
+        if latitude is None or longitude is None:
+            return False
+
+        index = len(self._businesses)
+        self._ids[id] = index
+        self._businesses.append(business)
+        self._latitudes.append(latitude)
+        self._longitudes.append(longitude)
+        cell = self._Cell(latitude, longitude)
+        self._cells.setdefault(cell, []).append(index)
+        if self._bounds is None:
+            self._bounds = cell + cell
+        else:
+            self._bounds = (min(self._bounds[0], cell[0]), min(self._bounds[1], cell[1]),
+                            max(self._bounds[2], cell[0]), max(self._bounds[3], cell[1]))
+        self._arrays = None
+        return True
+
+    def AddMany(self, businesses):
+        '''Index an iterable of businesses, or of SearchResultSets.
+
+        Returns:
+          The number of businesses added.
+        '''
+        added = 0
+        for business in businesses:
+            if hasattr(business, 'businesses'):
+                added += self.AddMany(business.businesses)
+            elif self.Add(business):
+                added += 1
+        return added
+
+    def QueryRadius(self, latitude, longitude, radius):
+        '''Return the businesses within radius meters of a point.'''
+        candidates = self._Candidates(latitude, longitude, self._Rings(latitude, radius))
+        return [match for match in self._Measure(latitude, longitude, candidates)
+                if match[1] <= radius]
+
+    def QueryRadiusMany(self, latitudes, longitudes, radius):
+        '''Run QueryRadius for each point of two parallel sequences.
+
+        With numpy installed, points in the same grid cell share a single
+        search for candidates, and their distances to those candidates are
+        computed together as one matrix.
+        '''
+        if numpy is None:
+            return [self.QueryRadius(latitude, longitude, radius)
+                    for latitude, longitude in zip(latitudes, longitudes)]
+        results = [None] * len(latitudes)
+        for points in self._GroupByCell(latitudes, longitudes):
+            rings = max(self._Rings(latitudes[i], radius) for i in points)
+            candidates = self._Candidates(latitudes[points[0]], longitudes[points[0]], rings)
+            for i, (indexes, distances) in zip(points, self._MeasureMany(
+                    [latitudes[i] for i in points], [longitudes[i] for i in points], candidates)):
+                within = distances <= radius
+                results[i] = self._Matches(indexes[within], distances[within])
+        return results
+
+    def KNearest(self, latitude, longitude, k):
+        '''Return the k businesses nearest to a point.
+
+        Grid rings around the point are searched outwards until the k-th
+        nearest candidate is closer than any unsearched cell can be.
+        '''
+        if not self._businesses or k <= 0:
+            return []
+        rings = 0
+        max_rings = self._MaxRings(latitude, longitude)
+        while True:
+            candidates = self._Candidates(latitude, longitude, rings)
+            if len(candidates) >= k or rings >= max_rings:
+                matches = self._Measure(latitude, longitude, candidates)[:k]
+                if rings >= max_rings or \
+                   (len(matches) == k and matches[-1][1] <= self._Covered(latitude, rings)):
+                    return matches
+            rings += 1
+
+    def KNearestMany(self, latitudes, longitudes, k):
+        '''Run KNearest for each point of two parallel sequences.
+
+        With numpy installed, points in the same grid cell search their
+        rings together, measuring the candidates of each ring for all the
+        points still unanswered as one matrix of distances.
+        '''
+        if numpy is None or not self._businesses or k <= 0:
+            return [self.KNearest(latitude, longitude, k)
+                    for latitude, longitude in zip(latitudes, longitudes)]
+        results = [None] * len(latitudes)
+        for points in self._GroupByCell(latitudes, longitudes):
+            latitude, longitude = latitudes[points[0]], longitudes[points[0]]
+            rings = 0
+            max_rings = self._MaxRings(latitude, longitude)
+            while points:
+                candidates = self._Candidates(latitude, longitude, rings)
+                if len(candidates) >= k or rings >= max_rings:
+                    unanswered = []
+                    for i, (indexes, distances) in zip(points, self._MeasureMany(
+                            [latitudes[i] for i in points], [longitudes[i] for i in points],
+                            candidates)):
+                        indexes, distances = indexes[:k], distances[:k]
+                        if rings >= max_rings or (len(distances) == k and
+                                                  distances[-1] <= self._Covered(latitudes[i], rings)):
+                            results[i] = self._Matches(indexes, distances)
+                        else:
+                            unanswered.append(i)
+                    points = unanswered
+                rings += 1
+        return results
+
+    def _Cell(self, latitude, longitude):
+        return (int(math.floor(latitude / self.cell_size)),
+                int(math.floor(longitude / self.cell_size)))
+
+    def _Rings(self, latitude, radius):
+        # Cells to search around a point to cover radius meters, allowing for
+        # degrees of longitude shrinking away from the equator.
+        degrees = float(radius) / _METERS_PER_DEGREE
+        shrink = max(math.cos(math.radians(min(abs(latitude) + degrees, 90))), 1e-6)
+        return int(math.ceil(degrees / shrink / self.cell_size))
+
+    def _Covered(self, latitude, rings):
+        # Meters from a point within which everything lies in the cells
+        # searched by rings around it
+        return rings * self.cell_size * _METERS_PER_DEGREE * \
+            max(math.cos(math.radians(min(abs(latitude) + rings * self.cell_size, 90))), 0)
+
+    def _GroupByCell(self, latitudes, longitudes):
+        # Positions of the points of two parallel sequences, grouped by cell
+        groups = {}
+        for i, (latitude, longitude) in enumerate(zip(latitudes, longitudes)):
+            groups.setdefault(self._Cell(latitude, longitude), []).append(i)
+        return groups.values()
+
+    def _MaxRings(self, latitude, longitude):
+        # Rings needed to reach every occupied cell
+        row, column = self._Cell(latitude, longitude)
+        min_row, min_column, max_row, max_column = self._bounds
+        return max(row - min_row, max_row - row, column - min_column, max_column - column, 0)
+
+    def _Candidates(self, latitude, longitude, rings):
+        row, column = self._Cell(latitude, longitude)
+        if (2 * rings + 1) ** 2 > len(self._cells):
+            # Cheaper to walk the occupied cells than the empty ones
+            candidates = []
+            for (other_row, other_column), indexes in self._cells.iteritems():
+                if abs(other_row - row) <= rings and abs(other_column - column) <= rings:
+                    candidates.extend(indexes)
+            return candidates
+        candidates = []
+        for other_row in xrange(row - rings, row + rings + 1):
+            for other_column in xrange(column - rings, column + rings + 1):
+                candidates.extend(self._cells.get((other_row, other_column), ()))
+        return candidates
+
+    def _MeasureMany(self, latitudes, longitudes, candidates):
+        # Returns, for each point, the indexes of the candidates and their
+        # distances as arrays sorted by distance.  Needs numpy.
+        candidates = numpy.array(candidates, dtype=int)
+        if not len(candidates):
+            return [(candidates, numpy.zeros(0))] * len(latitudes)
+        all_latitudes, all_longitudes = self._Arrays()
+        distances = _HaversineMatrix(latitudes, longitudes,
+                                     all_latitudes[candidates], all_longitudes[candidates])
+        orders = numpy.argsort(distances, axis=1, kind='mergesort')
+        return [(candidates[order], row[order]) for row, order in zip(distances, orders)]
+
+    def _Matches(self, indexes, distances):
+        return [(self._businesses[i], float(distance)) for i, distance in zip(indexes, distances)]
+
+    def _Arrays(self):
+        if self._arrays is None:
+            self._arrays = (numpy.array(self._latitudes, dtype=float),
+                            numpy.array(self._longitudes, dtype=float))
+        return self._arrays
+
+    def _Measure(self, latitude, longitude, candidates):
+        if not candidates:
+            return []
+        if numpy is not None:
+            self._Arrays()
+            candidates = numpy.array(candidates)
+            distances = Haversine(latitude, longitude,
+                                  self._arrays[0][candidates],
+                                  self._arrays[1][candidates])
+            order = numpy.argsort(distances, kind='mergesort')
+            return [(self._businesses[candidates[i]], float(distances[i])) for i in order]
+        distances = Haversine(latitude, longitude,
+                              [self._latitudes[i] for i in candidates],
+                              [self._longitudes[i] for i in candidates])
+        return sorted(((self._businesses[i], distance)
+                       for i, distance in zip(candidates, distances)),
+                      key=lambda match: match[1])
+
+
+def _Get(business, name):
+    if business is None:
+        return None
+    if isinstance(business, dict):
+        return business.get(name)
+    return getattr(business, name, None)
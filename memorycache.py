@@ -0,0 +1,251 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class MemoryCache(object):
+    '''A thread-safe, in-process LRU cache with the FileCache interface.
+
+    Entries are evicted least recently used first once the cache holds more
+    than max_entries entries or max_bytes bytes of data, and are dropped
+    once they are older than their ttl.
+    '''
+
+    def __init__(self, max_entries=None, max_bytes=None, ttl=None):
+        '''
+        Args:
+          max_entries:
+            The maximum number of entries kept, or None for no limit.
+          max_bytes:
+            The maximum total length of the cached data, or None for no limit.
+          ttl:
+            Time, in seconds, entries are kept by default, or None to keep
+            them until evicted.
+        '''
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+
+    def Get(self, key):
+        with self._lock:
+            entry = self._Lookup(key)
+            if entry is None:
+                return None
+            return entry[0]
+
+    def Set(self, key, data, cached_time=None, ttl=None):
+        '''Store data under key.
+
+        Args:
+          key:
+            The cache key.
+          data:
+            The string to store.
+          cached_time:
+            The time the data was originally fetched, as reported back by
+            GetCachedTime.  Defaults to now.
+          ttl:
+            Overrides the default ttl for this entry.
+        '''
+        now = time.time()
+        if cached_time is None:
+            cached_time = now
+        if ttl is None:
+            ttl = self.ttl
+        if ttl is None:
+            expires = None
+        else:
+            expires = now + ttl
+        size = len(data)
+
+        with self._lock:
+            self._Discard(key)
+            if self.max_bytes is not None and size > self.max_bytes:
+                return
+            self._entries[key] = (data, cached_time, expires)
+            self._bytes += size
+            while (self.max_entries is not None and len(self._entries) > self.max_entries) or \
+                  (self.max_bytes is not None and self._bytes > self.max_bytes):
+                _, (evicted, _, _) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self._evictions += 1
+
+    def Remove(self, key):
+        with self._lock:
+            self._Discard(key)
+
+    def GetCachedTime(self, key):
+        '''Return the time key was cached, or None.
+
+        This is the first call made for every two-call cache lookup, so it
+        is where hits and misses are counted for those.
+        '''
+        with self._lock:
+            entry = self._Lookup(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+            return entry[1]
+
+    def GetIfFresh(self, key, max_age):
+        '''Return a (data, age) tuple for key, or None if it is missing or at
+        least max_age seconds old.  A max_age of None accepts any age.'''
+        with self._lock:
+            entry = self._Lookup(key)
+            if entry is not None:
+                age = time.time() - entry[1]
+                if max_age is None or age < max_age:
+                    self._hits += 1
+                    return entry[0], age
+            self._misses += 1
+            return None
+
+    def Clear(self):
+        '''Remove every entry.'''
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def GetStats(self):
+        '''Return a dict of hit, miss, eviction and expiration counters along
+        with the current number of entries and bytes held.'''
+        with self._lock:
+            return {'hits': self._hits,
+                    'misses': self._misses,
+                    'evictions': self._evictions,
+                    'expirations': self._expirations,
+                    'entries': len(self._entries),
+                    'bytes': self._bytes}
+
+    def _Lookup(self, key):
+        # Must be called with the lock held.  Marks the entry as most
+        # recently used.
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+        expires = entry[2]
+        if expires is not None and time.time() >= expires:
+            self._bytes -= len(entry[0])
+            self._expirations += 1
+            return None
+        self._entries[key] = entry
+        return entry
+
+    def _Discard(self, key):
+        # Must be called with the lock held.
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry[0])
+
+
+class TieredCache(object):
+    '''Layers a fast cache, usually a MemoryCache, in front of a slower one
+    such as a FileCache.
+
+    Writes go to both tiers.  Reads are served from the front tier when
+    possible; entries only found in the back tier are copied forward with
+    their original cached time so freshness checks are unaffected.
+    '''
+
+    def __init__(self, front, back):
+        '''
+        Args:
+          front:
+            A cache whose Set accepts a cached_time keyword, like MemoryCache.
+          back:
+            An instance that supports the same API as the FileCache.
+        '''
+        self.front = front
+        self.back = back
+
+    def Get(self, key):
+        data = self.front.Get(key)
+        if data is None:
+            data = self.back.Get(key)
+            if data is not None:
+                self.front.Set(key, data,
+                               cached_time=self.back.GetCachedTime(key))
+        return data
+
+    def Set(self, key, data):
+        self.back.Set(key, data)
+        self.front.Set(key, data)
+
+    def Remove(self, key):
+        self.front.Remove(key)
+        self.back.Remove(key)
+
+    def GetIfFresh(self, key, max_age):
+        entry = self.front.GetIfFresh(key, max_age)
+        if entry is not None:
+            return entry
+        get_if_fresh = getattr(self.back, 'GetIfFresh', None)
+        if get_if_fresh is not None:
+            entry = get_if_fresh(key, max_age)
+        else:
+            cached_time = self.back.GetCachedTime(key)
+            if cached_time is not None:
+                age = time.time() - cached_time
+                if max_age is None or age < max_age:
+                    entry = self.back.Get(key), age
+        return self._CopyForward(key, entry)
+
+    def GetManyIfFresh(self, keys, max_age):
+        '''Look up many keys, those missing from the front tier in one call
+        to the back tier when it supports GetManyIfFresh, like
+        MemcachedCache.
+
+        Returns:
+          A dict of key to a (data, age) tuple for each key that is present
+          and less than max_age seconds old.
+        '''
+        fresh = {}
+        missing = []
+        for key in keys:
+            entry = self.front.GetIfFresh(key, max_age)
+            if entry is None:
+                missing.append(key)
+            else:
+                fresh[key] = entry
+        get_many_if_fresh = getattr(self.back, 'GetManyIfFresh', None)
+        if get_many_if_fresh is None:
+            entries = [(key, self.GetIfFresh(key, max_age)) for key in missing]
+        elif missing:
+            entries = [(key, self._CopyForward(key, entry))
+                       for key, entry in get_many_if_fresh(missing, max_age).iteritems()]
+        else:
+            entries = []
+        for key, entry in entries:
+            if entry is not None:
+                fresh[key] = entry
+        return fresh
+
+    def SetCacheTimeout(self, cache_timeout):
+        '''Passed on to the tiers that expire entries themselves, like
+        MemcachedCache.'''
+        for tier in (self.front, self.back):
+            set_cache_timeout = getattr(tier, 'SetCacheTimeout', None)
+            if set_cache_timeout is not None:
+                set_cache_timeout(cache_timeout)
+
+    def _CopyForward(self, key, entry):
+        # Returns a back tier entry after copying it to the front tier
+        if entry is not None and entry[0] is not None:
+            data, age = entry
+            self.front.Set(key, data, cached_time=time.time() - age)
+            return entry
+        return None
+
+    def GetCachedTime(self, key):
+        cached_time = self.front.GetCachedTime(key)
+        if cached_time is None:
+            cached_time = self.back.GetCachedTime(key)
+        return cached_time
@@ -0,0 +1,134 @@
+'''Counters and latency histograms collected from Api hooks.'''
+
+import bisect
+import threading
+
+import yelp
+
+
+# Upper bounds, in seconds, of the latency histogram buckets: four per
+# doubling from 1 microsecond to about 2 minutes, so estimated percentiles
+# are within about 10% of the true value.
+BUCKETS = [1e-6 * 2 ** (i / 4.0) for i in xrange(108)]
+
+# Percentiles reported for each latency histogram
+PERCENTILES = (0.5, 0.95, 0.99)
+
+# Api events counted, and the counter each is added to
+COUNTED_EVENTS = {yelp.EVENT_BEFORE_REQUEST: 'requests',
+                  yelp.EVENT_CACHE_HIT: 'cache_hits',
+                  yelp.EVENT_CACHE_MISS: 'cache_misses',
+                  yelp.EVENT_ERROR: 'errors'}
+
+
+class Histogram(object):
+    '''A fixed-size histogram of durations, in seconds.'''
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def Add(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def Percentile(self, fraction):
+        '''Estimate a percentile, interpolating within its bucket.'''
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = BUCKETS[index - 1] if index else 0.0
+                upper = BUCKETS[index] if index < len(BUCKETS) else BUCKETS[-1]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return BUCKETS[-1]
+
+
+class MetricsCollector(object):
+    '''Counts requests, responses by status, cache hits and misses and
+    errors, and keeps a latency histogram per phase of a call, for any
+    number of Api instances.
+
+    Usage:
+      metrics = MetricsCollector()
+      metrics.Register(yelp_api)
+      ...
+      print metrics.AsDict()
+      print metrics.PrometheusText()
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._registered = []
+        self.Reset()
+
+    def Register(self, api):
+        '''Start collecting from an Api.'''
+        for event in yelp.EVENTS:
+            api.AddHook(event, self._OnEvent)
+        self._registered.append(api)
+
+    def Unregister(self, api):
+        '''Stop collecting from an Api.'''
+        for event in yelp.EVENTS:
+            api.RemoveHook(event, self._OnEvent)
+        self._registered.remove(api)
+
+    def Reset(self):
+        with self._lock:
+            self._counters = dict((name, 0) for name in COUNTED_EVENTS.itervalues())
+            self._responses = {}
+            self._histograms = {}
+
+    def AsDict(self):
+        '''Return the counters, the responses by status, and the count, sum
+        and percentiles of each latency histogram, as a dict.'''
+        with self._lock:
+            latency = {}
+            for phase, histogram in self._histograms.iteritems():
+                summary = {'count': histogram.count, 'sum': histogram.sum}
+                for fraction in PERCENTILES:
+                    summary['p%d' % (fraction * 100)] = histogram.Percentile(fraction)
+                latency[phase] = summary
+            return {'counters': dict(self._counters),
+                    'responses': dict(self._responses),
+                    'latency': latency}
+
+    def PrometheusText(self, prefix='yelp_'):
+        '''Return the metrics in the Prometheus text exposition format, with
+        the latency histograms as summaries.'''
+        lines = []
+        metrics = self.AsDict()
+        for name, value in sorted(metrics['counters'].iteritems()):
+            lines.append('# TYPE %s%s_total counter' % (prefix, name))
+            lines.append('%s%s_total %d' % (prefix, name, value))
+        lines.append('# TYPE %sresponses_total counter' % prefix)
+        for status, value in sorted(metrics['responses'].iteritems()):
+            lines.append('%sresponses_total{status="%s"} %d' % (prefix, status, value))
+        if metrics['latency']:
+            lines.append('# TYPE %sphase_seconds summary' % prefix)
+        for phase, summary in sorted(metrics['latency'].iteritems()):
+            for fraction in PERCENTILES:
+                lines.append('%sphase_seconds{phase="%s",quantile="%s"} %.9f' % (
+                    prefix, phase, fraction, summary['p%d' % (fraction * 100)]))
+            lines.append('%sphase_seconds_sum{phase="%s"} %.9f' % (prefix, phase, summary['sum']))
+            lines.append('%sphase_seconds_count{phase="%s"} %d' % (prefix, phase, summary['count']))
+        return '\n'.join(lines) + '\n'
+
+    def _OnEvent(self, event, data):
+        with self._lock:
+            if event == yelp.EVENT_PHASE:
+                histogram = self._histograms.get(data['phase'])
+                if histogram is None:
+                    histogram = self._histograms[data['phase']] = Histogram()
+                histogram.Add(data['seconds'])
+            elif event == yelp.EVENT_AFTER_RESPONSE:
+                status = str(data['status'])
+                self._responses[status] = self._responses.get(status, 0) + 1
+            else:
+                self._counters[COUNTED_EVENTS[event]] += 1
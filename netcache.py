@@ -0,0 +1,329 @@
+'''A cache shared between hosts, spoken to over the memcached text protocol.'''
+
+import SocketServer
+import os
+import socket
+import struct
+import threading
+import time
+
+try:
+    from hashlib import md5
+except ImportError:
+    from md5 import md5
+
+
+# Socket timeout, in seconds, for talking to a cache server
+DEFAULT_TIMEOUT = 2
+
+# memcached reads expiry times beyond 30 days as absolute timestamps
+MAX_RELATIVE_TTL = 30 * 24 * 60 * 60
+
+# Stored values start with the time they were cached
+_CACHED_TIME = struct.Struct('!d')
+
+
+class NetCacheError(Exception):
+    '''Base exception class for MemcachedCache related errors'''
+
+
+class MemcachedCache(object):
+    '''A cache with the FileCache interface kept on memcached servers.
+
+    Every worker pointed at the same servers shares one cache, so a response
+    fetched on one host is reused on all of them.  Entries are expired by the
+    servers themselves: unless a ttl is given, the Api sets it to its cache
+    timeout plus any stale-while-revalidate window through SetCacheTimeout.
+
+    Keys are spread across the servers by hash.  GetManyIfFresh fetches many
+    keys with one pipelined command per server, which the Api uses for the
+    cache lookups of GetBusinesses and SearchMany.
+
+    The cache is best effort: a server that cannot be reached reads as a
+    miss and drops writes, and the failure is counted in GetStats.
+    '''
+
+    def __init__(self, servers=None, ttl=None, timeout=DEFAULT_TIMEOUT):
+        '''
+        Args:
+          servers:
+            A list of "host:port" strings.  Defaults to a local memcached.
+          ttl:
+            Time, in seconds, entries are kept.  If None, the Api using the
+            cache sets it, and until then entries are kept until evicted.
+          timeout:
+            Socket timeout, in seconds.
+        '''
+        self.servers = [self._ParseServer(server) for server in servers or ['127.0.0.1:11211']]
+        self.ttl = ttl
+        self.timeout = timeout
+        self._api_ttl = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._errors = 0
+
+    def SetCacheTimeout(self, cache_timeout):
+        '''Called by the Api with the longest time, in seconds, it may still
+        serve an entry.  Ignored when the cache was given a ttl.'''
+        self._api_ttl = cache_timeout
+
+    def Get(self, key):
+        entry = self._GetMany([key]).get(key)
+        if entry is None:
+            return None
+        return entry[0]
+
+    def Set(self, key, data, cached_time=None):
+        '''Store data under key.
+
+        Args:
+          key:
+            The cache key.
+          data:
+            The string to store.
+          cached_time:
+            The time the data was originally fetched, as reported back by
+            GetCachedTime.  Defaults to now.
+        '''
+        if cached_time is None:
+            cached_time = time.time()
+        ttl = self.ttl
+        if ttl is None:
+            ttl = self._api_ttl
+        if ttl is None:
+            expires = 0
+        else:
+            # The server counts from now, not from when the data was fetched
+            expires = int(ttl - (time.time() - cached_time)) + 1
+            if expires <= 0:
+                return
+            if expires > MAX_RELATIVE_TTL:
+                expires = int(time.time()) + expires
+        hashed_key = self._HashKey(key)
+        value = _CACHED_TIME.pack(cached_time) + data
+        self._Call(self._GetServer(hashed_key),
+                   'set %s 0 %d %d\r\n%s\r\n' % (hashed_key, expires, len(value), value),
+                   lambda connection: connection.ReadLine())
+
+    def Remove(self, key):
+        hashed_key = self._HashKey(key)
+        self._Call(self._GetServer(hashed_key), 'delete %s\r\n' % hashed_key,
+                   lambda connection: connection.ReadLine())
+
+    def GetCachedTime(self, key):
+        entry = self._GetMany([key]).get(key)
+        if entry is None:
+            return None
+        return entry[1]
+
+    def GetIfFresh(self, key, max_age):
+        '''Return a (data, age) tuple for key, or None if it is missing or at
+        least max_age seconds old.  A max_age of None accepts any age.'''
+        return self.GetManyIfFresh([key], max_age).get(key)
+
+    def GetManyIfFresh(self, keys, max_age):
+        '''Look up many keys with one round trip per server.
+
+        Returns:
+          A dict of key to a (data, age) tuple for each key that is present
+          and less than max_age seconds old.
+        '''
+        now = time.time()
+        fresh = {}
+        for key, (data, cached_time) in self._GetMany(keys).iteritems():
+            age = now - cached_time
+            if max_age is None or age < max_age:
+                fresh[key] = data, age
+        return fresh
+
+    def GetStats(self):
+        '''Return the number of failed server calls.'''
+        with self._lock:
+            return {'errors': self._errors}
+
+    def Close(self):
+        '''Close the calling thread's connections.'''
+        for connection in getattr(self._local, 'connections', {}).values():
+            connection.Close()
+        self._local.connections = {}
+
+    def _GetMany(self, keys):
+        # Returns a dict of key to (data, cached_time)
+        by_server = {}
+        for key in keys:
+            hashed_key = self._HashKey(key)
+            by_server.setdefault(self._GetServer(hashed_key), {})[hashed_key] = key
+        entries = {}
+        for server, hashed_keys in by_server.iteritems():
+            values = self._Call(server, 'get %s\r\n' % ' '.join(hashed_keys), _ReadValues)
+            for hashed_key, value in (values or {}).iteritems():
+                if hashed_key in hashed_keys and len(value) >= _CACHED_TIME.size:
+                    cached_time, = _CACHED_TIME.unpack_from(value)
+                    entries[hashed_keys[hashed_key]] = value[_CACHED_TIME.size:], cached_time
+        return entries
+
+    def _Call(self, server, command, read):
+        try:
+            connection = self._GetConnection(server)
+            connection.Send(command)
+            return read(connection)
+        except (socket.error, NetCacheError):
+            connection = self._local.connections.pop(server, None)
+            if connection is not None:
+                connection.Close()
+            with self._lock:
+                self._errors += 1
+            return None
+
+    def _GetConnection(self, server):
+        # Sockets must not be shared across threads, nor survive a fork.
+        if getattr(self._local, 'pid', None) != os.getpid():
+            self._local.connections = {}
+            self._local.pid = os.getpid()
+        connection = self._local.connections.get(server)
+        if connection is None:
+            connection = self._local.connections[server] = _Connection(server, self.timeout)
+        return connection
+
+    def _GetServer(self, hashed_key):
+        return self.servers[int(hashed_key[:8], 16) % len(self.servers)]
+
+    def _HashKey(self, key):
+        # memcached keys are limited to 250 bytes without whitespace
+        return md5(key).hexdigest()
+
+    def _ParseServer(self, server):
+        host, _, port = server.rpartition(':')
+        if not host:
+            raise NetCacheError('Server %r must be "host:port"' % (server,))
+        return host, int(port)
+
+
+class _Connection(object):
+    '''A buffered socket to one memcached server.'''
+
+    def __init__(self, server, timeout):
+        self._socket = socket.create_connection(server, timeout)
+        self._buffer = ''
+
+    def Send(self, data):
+        self._socket.sendall(data)
+
+    def ReadLine(self):
+        while '\r\n' not in self._buffer:
+            self._Fill()
+        line, self._buffer = self._buffer.split('\r\n', 1)
+        if line.startswith(('ERROR', 'CLIENT_ERROR', 'SERVER_ERROR')):
+            raise NetCacheError(line)
+        return line
+
+    def Read(self, size):
+        while len(self._buffer) < size:
+            self._Fill()
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def Close(self):
+        self._socket.close()
+
+    def _Fill(self):
+        data = self._socket.recv(65536)
+        if not data:
+            raise NetCacheError('Connection closed by server')
+        self._buffer += data
+
+
+def _ReadValues(connection):
+    # Reads the VALUE lines of a get response up to END
+    values = {}
+    while True:
+        line = connection.ReadLine()
+        if line == 'END':
+            return values
+        _, hashed_key, _, size = line.split()[:4]
+        values[hashed_key] = connection.Read(int(size) + 2)[:-2]
+
+
+class StandInServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    '''An in-process server for the get, set and delete memcached commands,
+    for testing MemcachedCache without a real memcached.
+
+    Attributes:
+      commands:
+        The command names received, in order.
+    '''
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address=('127.0.0.1', 0)):
+        SocketServer.TCPServer.__init__(self, address, _StandInHandler)
+        self.commands = []
+        self._values = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def address(self):
+        return '%s:%d' % self.server_address
+
+    def Start(self):
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def Stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def Get(self, key):
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires and time.time() >= expires:
+                del self._values[key]
+                return None
+            return value
+
+    def Set(self, key, value, expires):
+        if 0 < expires <= MAX_RELATIVE_TTL:
+            expires += time.time()
+        with self._lock:
+            self._values[key] = value, expires
+
+    def Delete(self, key):
+        with self._lock:
+            return self._values.pop(key, None) is not None
+
+
+class _StandInHandler(SocketServer.StreamRequestHandler):
+
+    def handle(self):
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            words = line.split()
+            if not words:
+                self.wfile.write('ERROR\r\n')
+                continue
+            self.server.commands.append(words[0])
+            if words[0] == 'get':
+                for key in words[1:]:
+                    value = self.server.Get(key)
+                    if value is not None:
+                        self.wfile.write('VALUE %s 0 %d\r\n%s\r\n' % (key, len(value), value))
+                self.wfile.write('END\r\n')
+            elif words[0] == 'set' and len(words) >= 5:
+                value = self.rfile.read(int(words[4]) + 2)[:-2]
+                self.server.Set(words[1], value, int(words[3]))
+                self.wfile.write('STORED\r\n')
+            elif words[0] == 'delete' and len(words) >= 2:
+                if self.server.Delete(words[1]):
+                    self.wfile.write('DELETED\r\n')
+                else:
+                    self.wfile.write('NOT_FOUND\r\n')
+            else:
+                self.wfile.write('ERROR\r\n')
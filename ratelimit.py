@@ -0,0 +1,143 @@
+'''Client-side rate limiting of requests to the Yelp API.'''
+
+import os
+import struct
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class RateLimitError(Exception):
+    '''Base exception class for rate limiting related errors'''
+
+
+class _Bucket(object):
+    '''Blocking acquisition and wait accounting on top of TryAcquire.'''
+
+    def __init__(self, rate, capacity=None):
+        '''
+        Args:
+          rate:
+            Tokens added per second, i.e. the sustained requests per second.
+          capacity:
+            The most tokens the bucket holds, i.e. the largest burst.
+            Defaults to rate, and is at least 1.
+        '''
+        if rate <= 0:
+            raise RateLimitError('rate must be positive, not %r' % (rate,))
+        self.rate = float(rate)
+        self.capacity = float(max(capacity or rate, 1))
+        self._stats_lock = threading.Lock()
+        self.acquired = 0
+        self.waits = 0
+        self.wait_time = 0.0
+
+    def Acquire(self, tokens=1):
+        '''Take tokens from the bucket, sleeping until they are available.
+
+        Returns:
+          The time, in seconds, spent waiting.
+        '''
+        waited = 0.0
+        while True:
+            wait = self.TryAcquire(tokens)
+            if not wait:
+                break
+            time.sleep(wait)
+            waited += wait
+        with self._stats_lock:
+            self.acquired += 1
+            if waited:
+                self.waits += 1
+                self.wait_time += waited
+        return waited
+
+    def GetStats(self):
+        '''Return a dict of acquisition and waiting counters.'''
+        with self._stats_lock:
+            return {'acquired': self.acquired,
+                    'waits': self.waits,
+                    'wait_time': self.wait_time}
+
+    def _Refill(self, available, last, now, tokens):
+        # Returns the new token count and the time to wait, 0 if the tokens
+        # were taken.
+        available = min(self.capacity, available + (now - last) * self.rate)
+        if available >= tokens:
+            return available - tokens, 0
+        return available, (tokens - available) / self.rate
+
+
+class TokenBucket(_Bucket):
+    '''A token bucket shared by the threads of one process.'''
+
+    def __init__(self, rate, capacity=None):
+        _Bucket.__init__(self, rate, capacity)
+        self._available = self.capacity
+        self._last = time.time()
+        self._lock = threading.Lock()
+
+    def TryAcquire(self, tokens=1):
+        '''Take tokens if available without blocking.
+
+        Returns:
+          0 if the tokens were taken, otherwise the time, in seconds, until
+          they will be.
+        '''
+        with self._lock:
+            now = time.time()
+            self._available, wait = self._Refill(self._available, self._last, now, tokens)
+            self._last = now
+            return wait
+
+
+class FileTokenBucket(_Bucket):
+    '''A token bucket shared by every process on a host.
+
+    Its state lives in a small file that is locked with flock while it is
+    updated, so each process may create its own FileTokenBucket on the same
+    path.  Only available where fcntl is.
+    '''
+
+    _STATE = struct.Struct('dd')
+
+    def __init__(self, path, rate, capacity=None):
+        if fcntl is None:
+            raise RateLimitError('FileTokenBucket requires fcntl')
+        _Bucket.__init__(self, rate, capacity)
+        self.path = path
+
+    def TryAcquire(self, tokens=1):
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            state = os.read(fd, self._STATE.size)
+            now = time.time()
+            if len(state) == self._STATE.size:
+                available, last = self._STATE.unpack(state)
+            else:
+                available, last = self.capacity, now
+            available, wait = self._Refill(available, last, now, tokens)
+            os.lseek(fd, 0, os.SEEK_SET)
+            os.write(fd, self._STATE.pack(available, now))
+            return wait
+        finally:
+            os.close(fd)
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def GetTokenBucket(key, rate, capacity=None):
+    '''Return the process-wide TokenBucket for key, e.g. a consumer key,
+    creating it on first use.'''
+    with _buckets_lock:
+        bucket = _buckets.get(key)
+        if bucket is None:
+            bucket = _buckets[key] = TokenBucket(rate, capacity)
+        return bucket
@@ -0,0 +1,191 @@
+'''Incremental refresh of known businesses, with a feed of what changed.'''
+
+import json
+import os
+import tempfile
+import time
+
+try:
+    from hashlib import md5
+except ImportError:
+    from md5 import md5
+
+
+# Fields compared to decide whether a business changed
+CHANGE_FIELDS = ('rating', 'review_count', 'is_closed', 'deals')
+
+# Time, in seconds, after which a business is due for a refresh
+DEFAULT_REFRESH_TTL = 24 * 60 * 60
+
+# Version of the state file format
+STATE_VERSION = 1
+
+
+class RefreshError(Exception):
+    '''Base exception class for refresh related errors'''
+
+
+class Change(object):
+    '''A business whose tracked fields differ from its previous refresh.
+
+    Attributes:
+      id:
+        The business id.
+      business:
+        The freshly fetched Business, or decoded dict.
+      changes:
+        A dict of field name to an (old, new) tuple of values.
+    '''
+
+    def __init__(self, id=None, business=None, changes=None):
+        self.id = id
+        self.business = business
+        self.changes = changes or {}
+
+    def AsDict(self):
+        '''Return the change as a dict, e.g. for one line of an NDJSON feed.'''
+        return {'id': self.id,
+                'changes': dict((name, {'old': old, 'new': new})
+                                for name, (old, new) in self.changes.iteritems())}
+
+
+class Refresher(object):
+    '''Keeps a set of businesses up to date, refetching only those due.
+
+    For each tracked business the state records the values of the fields
+    being watched, a fingerprint of them, when it was last refreshed and
+    how often a refresh found it changed.  Refresh fetches only businesses
+    refreshed more than ttl seconds ago, bypassing the cache, most overdue
+    and most changeable first, and yields a Change for each whose watched
+    fields now differ.  Businesses seen for the first time only record a
+    baseline.
+
+    The state is saved to state_path, if given, after every Refresh.
+    '''
+
+    def __init__(self,
+                 api,
+                 state_path=None,
+                 ttl=DEFAULT_REFRESH_TTL,
+                 fields=CHANGE_FIELDS):
+        '''
+        Args:
+          api:
+            The yelp.Api to fetch with.
+          state_path:
+            The file the state is loaded from and saved to, or None to keep
+            it in memory only.
+          ttl:
+            Time, in seconds, after which a business is due for a refresh.
+          fields:
+            The business fields compared between refreshes.
+        '''
+        self.api = api
+        self.state_path = state_path
+        self.ttl = ttl
+        self.fields = tuple(fields)
+        # id -> [fingerprint, values, refreshed time, checks, changes]
+        self._entries = {}
+        self._errors = 0
+        if state_path is not None and os.path.exists(state_path):
+            self._Load()
+
+    def Track(self, ids):
+        '''Start tracking business ids.  New ids are due immediately.'''
+        for id in ids:
+            if id not in self._entries:
+                self._entries[id] = [None, None, 0, 0, 0]
+
+    def Untrack(self, ids):
+        '''Stop tracking business ids.'''
+        for id in ids:
+            self._entries.pop(id, None)
+
+    def GetDue(self, now=None):
+        '''Return the ids due for a refresh, in the order Refresh takes them.
+
+        A business is ranked by how overdue it is, as a multiple of the
+        ttl, times the share of its past refreshes that found a change.  The
+        share is smoothed so that rarely checked businesses are neither
+        ignored nor favoured.
+        '''
+        if now is None:
+            now = time.time()
+        due = []
+        for id, (_, _, refreshed, checks, changes) in self._entries.iteritems():
+            age = now - refreshed
+            if age >= self.ttl:
+                overdue = age / self.ttl if self.ttl else age
+                due.append((overdue * (changes + 1.0) / (checks + 2.0), id))
+        due.sort(reverse=True)
+        return [id for _, id in due]
+
+    def Refresh(self, limit=None):
+        '''Refetch the businesses due, yielding a Change for each that changed.
+
+        Args:
+          limit:
+            The most businesses to refetch, or None for all that are due.
+        '''
+        ids = self.GetDue()
+        if limit is not None:
+            ids = ids[:limit]
+        try:
+            for result in self.api.GetBusinesses(ids, as_completed=True, no_cache=True):
+                if result.error is not None:
+                    # Stays due, so the next Refresh tries again
+                    self._errors += 1
+                    continue
+                change = self._Update(result.request, result.result)
+                if change is not None:
+                    yield change
+        finally:
+            if self.state_path is not None:
+                self._Save()
+
+    def GetStats(self):
+        '''Return the number of tracked and due businesses and of errors.'''
+        return {'tracked': len(self._entries),
+                'due': len(self.GetDue()),
+                'errors': self._errors}
+
+    def _Update(self, id, business):
+        entry = self._entries.get(id)
+        if entry is None:
+            # Untracked while being fetched
+            return None
+        values = dict((name, _Get(business, name)) for name in self.fields)
+        fingerprint = md5(json.dumps(values, sort_keys=True)).hexdigest()
+        old_fingerprint, old_values = entry[0], entry[1]
+        entry[0], entry[1], entry[2] = fingerprint, values, time.time()
+        if old_fingerprint is None:
+            return None
+        entry[3] += 1
+        if fingerprint == old_fingerprint:
+            return None
+        entry[4] += 1
+        changes = dict((name, (old_values.get(name), values[name])) for name in self.fields
+                       if old_values.get(name) != values[name])
+        return Change(id=id, business=business, changes=changes)
+
+    def _Load(self):
+        with open(self.state_path) as fp:
+            state = json.load(fp)
+        if state.get('version') != STATE_VERSION:
+            raise RefreshError('Unsupported state version %r in %s' %
+                               (state.get('version'), self.state_path))
+        self._entries = state['businesses']
+
+    def _Save(self):
+        directory = os.path.dirname(os.path.abspath(self.state_path))
+        temp_fd, temp_path = tempfile.mkstemp(dir=directory)
+        temp_fp = os.fdopen(temp_fd, 'w')
+        json.dump({'version': STATE_VERSION, 'businesses': self._entries}, temp_fp)
+        temp_fp.close()
+        os.rename(temp_path, self.state_path)
+
+
+def _Get(business, name):
+    if isinstance(business, dict):
+        return business.get(name)
+    return getattr(business, name, None)
@@ -0,0 +1,293 @@
+'''Recording of real Yelp API responses and replay from a local fake server.
+
+Record once against the real API, with credentials:
+
+  recorder = RecordingTransport()
+  yelp_api = yelp.Api(..., transport=recorder)
+  yelp_api.GetBusiness('yelp-san-francisco')
+  recorder.archive.Save('fixtures.json')
+
+Then replay without credentials or network access:
+
+  server = FakeYelpServer(Archive.Load('fixtures.json'), latency=0.05)
+  server.Start()
+  yelp_api = yelp.Api(consumer_key='key', ...)
+  yelp_api.host = server.host
+'''
+
+import BaseHTTPServer
+import SocketServer
+import base64
+import collections
+import json
+import random
+import threading
+import time
+import urllib
+import urlparse
+import zlib
+
+from transport import PooledTransport
+
+
+# Version of the archive file format
+ARCHIVE_VERSION = 1
+
+# Paths of the most recent requests a FakeYelpServer keeps
+DEFAULT_REQUEST_LOG_SIZE = 1000
+
+
+class ReplayError(Exception):
+    '''Base exception class for record and replay related errors'''
+
+
+def RequestKey(method, url):
+    '''Return the key a request is archived under: the method, path and
+    query, with the OAuth parameters that differ on every request removed
+    and the remaining parameters sorted.'''
+    parts = urlparse.urlsplit(url)
+    query = [(name, value) for name, value in urlparse.parse_qsl(parts.query, keep_blank_values=True)
+             if not name.startswith('oauth_')]
+    path = parts.path or '/'
+    if query:
+        path += '?' + urllib.urlencode(sorted(query))
+    return '%s %s' % (method, path)
+
+
+class Archive(object):
+    '''Recorded responses, keyed by RequestKey.'''
+
+    def __init__(self, responses=None):
+        '''
+        Args:
+          responses:
+            A dict of request key to a (status, headers, body) tuple.
+        '''
+        self.responses = responses or {}
+        self._lock = threading.Lock()
+
+    def Add(self, method, url, status, headers, body):
+        with self._lock:
+            self.responses[RequestKey(method, url)] = (status, headers, body)
+
+    def Lookup(self, method, url):
+        '''Return the (status, headers, body) recorded for a request, or None.'''
+        return self.responses.get(RequestKey(method, url))
+
+    def Save(self, path):
+        '''Write the archive to a JSON file.'''
+        entries = []
+        with self._lock:
+            for key, (status, headers, body) in sorted(self.responses.iteritems()):
+                entry = {'request': key, 'status': status, 'headers': headers}
+                try:
+                    entry['body'] = body.decode('utf-8')
+                except UnicodeDecodeError:
+                    entry['body'] = base64.b64encode(body)
+                    entry['encoding'] = 'base64'
+                entries.append(entry)
+        with open(path, 'w') as fp:
+            json.dump({'version': ARCHIVE_VERSION, 'responses': entries}, fp, indent=1)
+
+    @staticmethod
+    def Load(path):
+        '''Read an archive written by Save.'''
+        with open(path) as fp:
+            data = json.load(fp)
+        if data.get('version') != ARCHIVE_VERSION:
+            raise ReplayError('Unsupported archive version %r in %s' % (data.get('version'), path))
+        responses = {}
+        for entry in data['responses']:
+            if entry.get('encoding') == 'base64':
+                body = base64.b64decode(entry['body'])
+            else:
+                body = entry['body'].encode('utf-8')
+            headers = dict((str(name), str(value)) for name, value in entry['headers'].iteritems())
+            responses[str(entry['request'])] = (entry['status'], headers, body)
+        return Archive(responses)
+
+
+class RecordingTransport(object):
+    '''A transport that passes requests to another and records every
+    response in an Archive.'''
+
+    # Response headers worth replaying
+    RECORDED_HEADERS = ('content-type', 'retry-after')
+
+    def __init__(self, transport=None, archive=None):
+        '''
+        Args:
+          transport:
+            The transport that makes the requests.  Defaults to a new
+            PooledTransport.
+          archive:
+            The Archive to add to.  Defaults to a new, empty one.
+        '''
+        self.transport = transport or PooledTransport()
+        if archive is None:
+            archive = Archive()
+        self.archive = archive
+
+    def Fetch(self, url, post_data=None, headers=None):
+        response = self.transport.Fetch(url, post_data, headers)
+        if post_data is None:
+            method = 'GET'
+        else:
+            method = 'POST'
+        recorded_headers = dict((name, value) for name, value in response.headers.iteritems()
+                                if name in self.RECORDED_HEADERS)
+        self.archive.Add(method, url, response.status, recorded_headers, response.body)
+        return response
+
+    def Close(self):
+        self.transport.Close()
+
+
+class FakeYelpServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    '''A local HTTP server standing in for the Yelp API.
+
+    Requests are answered from an Archive, ignoring their OAuth parameters,
+    then from the responses dict, and otherwise with a 404 error.  Latency
+    and errors can be injected to exercise timeouts and retries.
+
+    Attributes:
+      responses:
+        A dict of path, without the query, to a (status, body) tuple or to
+        a function taking a dict of query parameters and returning one.
+      requests:
+        A deque of the paths, with the query, of the most recent requests
+        served, oldest first.
+      request_count:
+        The number of requests served.
+      connections:
+        The number of connections accepted.
+    '''
+
+    daemon_threads = True
+
+    # The default backlog of 5 drops connections when a batch opens many at
+    # once, which shows up as one second SYN retransmits in the latencies
+    request_queue_size = 128
+
+    def __init__(self,
+                 archive=None,
+                 latency=0,
+                 jitter=0,
+                 error_rate=0,
+                 error_status=503,
+                 seed=None,
+                 address=('127.0.0.1', 0),
+                 request_log_size=DEFAULT_REQUEST_LOG_SIZE):
+        '''
+        Args:
+          archive:
+            An Archive of recorded responses.
+          latency:
+            Time, in seconds, every response is delayed by.
+          jitter:
+            A further delay, in seconds, chosen uniformly at random up to
+            this much per response.
+          error_rate:
+            The fraction of requests answered with error_status instead.
+          error_status:
+            The HTTP status of injected errors.
+          seed:
+            Seeds the random choices, for repeatable runs.
+          address:
+            The (host, port) to listen on.  By default an unused port on
+            the loopback interface.
+          request_log_size:
+            The number of request paths kept in requests, so that long
+            benchmark runs do not grow without bound.  None keeps them all.
+        '''
+        BaseHTTPServer.HTTPServer.__init__(self, address, _FakeYelpHandler)
+        self.archive = archive or Archive()
+        self.responses = {}
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.requests = collections.deque(maxlen=request_log_size)
+        self.request_count = 0
+        self.connections = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def host(self):
+        '''The value to set Api.host to.'''
+        return '%s:%d' % self.server_address
+
+    def Start(self):
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def Stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def Respond(self, method, path):
+        '''Return the (delay, status, headers, body) to answer a request with.'''
+        with self._lock:
+            self.requests.append(path)
+            self.request_count += 1
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            failed = self._random.random() < self.error_rate
+        if failed:
+            return delay, self.error_status, {}, json.dumps(
+                {'error': {'id': 'INJECTED_ERROR', 'text': 'Injected by FakeYelpServer'}})
+        recorded = self.archive.Lookup(method, path)
+        if recorded is not None:
+            return (delay,) + recorded
+        response = self.responses.get(path.split('?', 1)[0])
+        if callable(response):
+            query = urlparse.parse_qsl(urlparse.urlsplit(path).query)
+            response = response(dict(query))
+        if response is None:
+            response = 404, json.dumps({'error': {'id': 'NOT_RECORDED', 'text': path}})
+        status, body = response
+        return delay, status, {}, body
+
+
+class _FakeYelpHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    # Write each response in as few segments as possible, and send them
+    # without waiting on the client's delayed ACKs
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        with self.server._lock:
+            self.server.connections += 1
+
+    def do_GET(self):
+        self._Respond('GET')
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self._Respond('POST')
+
+    def _Respond(self, method):
+        delay, status, headers, body = self.server.Respond(method, self.path)
+        if delay:
+            time.sleep(delay)
+        headers = dict(headers)
+        headers.setdefault('content-type', 'application/json')
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            body = compressor.compress(body) + compressor.flush()
+            headers['content-encoding'] = 'gzip'
+        self.send_response(status)
+        for name, value in headers.iteritems():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
@@ -11,7 +11,7 @@ __version__ = '0.5.7'
 METADATA = dict(
   name = "python-yelp-v2",
   version = __version__,
-  py_modules = ['yelp', 'filecache'],
+  py_modules = ['yelp', 'asyncyelp', 'cachetool', 'columns', 'compressedcache', 'crawl', 'export', 'filecache', 'geo', 'memorycache', 'metrics', 'netcache', 'ratelimit', 'refresh', 'replay', 'sqlitecache', 'transport'],
   author='Matthew Conlen',
   author_email='github@mathisonian.com',
   description='A Python wrapper around the Yelp API v2',
@@ -23,6 +23,8 @@ METADATA = dict(
 # Extra package metadata to be used only if setuptools is installed
 SETUPTOOLS_METADATA = dict(
   install_requires = ['setuptools', 'oauth2'],
+  extras_require = {'numpy': ['numpy'], 'zstd': ['zstandard']},
+  entry_points = {'console_scripts': ['yelp-cache = cachetool:Main']},
   include_package_data = True
 )
 
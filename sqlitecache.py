@@ -0,0 +1,138 @@
+'''A cache with the FileCache interface kept in a single SQLite database.'''
+
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from filecache import GetUsername
+
+
+class SqliteCacheError(Exception):
+    '''Base exception class for SqliteCache related errors'''
+
+
+class SqliteCache(object):
+    '''Stores every entry as a row of one SQLite database file.
+
+    Compared to FileCache, a write is a single small transaction rather than
+    a temporary file, a rename and possibly a directory, and the cache uses
+    one file however many entries it holds.  The database is opened in WAL
+    mode so readers never block the writer, and SQLite's own locking makes
+    it safe to share between the threads and processes of one host.  Each
+    thread, and each process after a fork, opens its own connection.
+    '''
+
+    # Seconds a connection waits for another process's write lock
+    DEFAULT_BUSY_TIMEOUT = 30
+
+    def __init__(self, path=None, busy_timeout=DEFAULT_BUSY_TIMEOUT):
+        '''
+        Args:
+          path:
+            The database file.  Defaults to python.cache_<user>.sqlite under
+            the system temporary directory.
+          busy_timeout:
+            Seconds to wait for a lock held by another connection.
+        '''
+        if path is None:
+            path = os.path.join(tempfile.gettempdir(),
+                                'python.cache_%s.sqlite' % GetUsername())
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._Connect().execute('CREATE TABLE IF NOT EXISTS cache ('
+                                'key TEXT PRIMARY KEY, '
+                                'data BLOB NOT NULL, '
+                                'cached_time REAL NOT NULL)')
+
+    def Get(self, key):
+        row = self._Connect().execute('SELECT data FROM cache WHERE key = ?',
+                                      (key,)).fetchone()
+        if row is None:
+            return None
+        return str(row[0])
+
+    def Set(self, key, data, cached_time=None):
+        '''Store data under key.
+
+        Args:
+          key:
+            The cache key.
+          data:
+            The string to store.
+          cached_time:
+            The time the data was originally fetched, as reported back by
+            GetCachedTime.  Defaults to now.
+        '''
+        if cached_time is None:
+            cached_time = time.time()
+        connection = self._Connect()
+        with connection:
+            connection.execute('INSERT OR REPLACE INTO cache (key, data, cached_time) '
+                               'VALUES (?, ?, ?)',
+                               (key, sqlite3.Binary(data), cached_time))
+
+    def Remove(self, key):
+        connection = self._Connect()
+        with connection:
+            connection.execute('DELETE FROM cache WHERE key = ?', (key,))
+
+    def GetCachedTime(self, key):
+        row = self._Connect().execute('SELECT cached_time FROM cache WHERE key = ?',
+                                      (key,)).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    def GetIfFresh(self, key, max_age):
+        '''Return a (data, age) tuple for key, or None if it is missing or at
+        least max_age seconds old.  A max_age of None accepts any age.'''
+        row = self._Connect().execute('SELECT data, cached_time FROM cache WHERE key = ?',
+                                      (key,)).fetchone()
+        if row is None:
+            return None
+        age = time.time() - row[1]
+        if max_age is not None and age >= max_age:
+            return None
+        return str(row[0]), age
+
+    def Expire(self, max_age):
+        '''Remove entries at least max_age seconds old.
+
+        Returns:
+          The number of entries removed.
+        '''
+        connection = self._Connect()
+        with connection:
+            return connection.execute('DELETE FROM cache WHERE cached_time <= ?',
+                                      (time.time() - max_age,)).rowcount
+
+    def __len__(self):
+        return self._Connect().execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+
+    def Close(self):
+        '''Close the calling thread's connection.'''
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def _Connect(self):
+        # Connections must not be shared across threads, nor survive a fork.
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None and self._local.pid == os.getpid():
+            return connection
+        try:
+            connection = sqlite3.connect(self.path, timeout=self.busy_timeout)
+            # Keys are byte strings, like the URLs they are built from
+            connection.text_factory = str
+            connection.execute('PRAGMA journal_mode=WAL')
+            # Durable enough for a cache, and commits skip an fsync
+            connection.execute('PRAGMA synchronous=NORMAL')
+        except sqlite3.Error, e:
+            raise SqliteCacheError('Cannot open cache database %s: %s' % (self.path, e))
+        self._local.connection = connection
+        self._local.pid = os.getpid()
+        return connection
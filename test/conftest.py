@@ -1,4 +1,13 @@
 import pytest
+import yelp
+from replay import FakeYelpServer
+
+
+def business(id, **fields):
+    '''A decoded business holding what models need, plus fields.'''
+    data = {'id': id, 'name': id.title(), 'location': {'city': 'Brooklyn'}}
+    data.update(fields)
+    return data
 
 
 def pytest_addoption(parser):
@@ -25,3 +34,26 @@ def token_secret(request):
     return request.config.getoption("--token-secret")
 
 
+@pytest.fixture
+def yelp_server():
+    server = FakeYelpServer()
+    server.Start()
+    yield server
+    server.Stop()
+
+
+@pytest.fixture
+def make_client(yelp_server):
+    '''A function returning a client of yelp_server.  It takes the arguments
+    of yelp.Api, with cache defaulting to None, and api_class, e.g.
+    AsyncApi.'''
+    def MakeClient(api_class=yelp.Api, cache=None, **kwargs):
+        client = api_class(consumer_key='key',
+                           consumer_secret='secret',
+                           access_token_key='token',
+                           access_token_secret='token-secret',
+                           cache=cache,
+                           **kwargs)
+        client.host = yelp_server.host
+        return client
+    return MakeClient
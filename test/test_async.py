@@ -0,0 +1,125 @@
+import json
+import time
+
+import pytest
+import ratelimit
+import yelp
+from asyncyelp import AsyncApi
+from conftest import business
+from filecache import FileCache
+
+
+class TestAsyncApi(object):
+
+
+    def test_get_business(self, yelp_server, make_client, tmpdir):
+        ids = ['b%d' % i for i in range(30)]
+        for id in ids:
+            yelp_server.responses['/v2/business/' + id] = (200, json.dumps(business(id)))
+        client = make_client(AsyncApi, cache=FileCache(str(tmpdir)), max_in_flight=5,
+                             use_gzip_compression=True)
+
+        futures = [client.GetBusiness(id) for id in ids]
+        assert client.Wait(futures)
+        assert [future.Result().id for future in futures] == ids
+        assert yelp_server.request_count == 30
+        assert all('oauth_signature=' in path for path in yelp_server.requests)
+
+        # Cache hits complete immediately
+        future = client.GetBusiness('b0')
+        assert future.Done()
+        assert future.Result().name == 'B0'
+        assert yelp_server.request_count == 30
+
+
+    def test_stale_while_revalidate(self, yelp_server, make_client, tmpdir):
+        yelp_server.responses['/v2/business/b0'] = (200, json.dumps(business('fresh')))
+        client = make_client(AsyncApi, cache=FileCache(str(tmpdir)), cache_timeout=60,
+                             stale_while_revalidate=3600)
+        client._cache.Set(client.GetBusinessCacheKey('b0'), json.dumps(business('stale')),
+                          cached_time=time.time() - 90)
+
+        future = client.GetBusiness('b0')
+        assert future.Done()
+        assert future.Result().name == 'Stale'
+        deadline = time.time() + 5
+        while client.GetBusiness('b0').Result().name != 'Fresh' and time.time() < deadline:
+            time.sleep(0.01)
+        assert client.GetBusiness('b0').Result().name == 'Fresh'
+
+
+    def test_throttled_wait_sleeps(self, yelp_server, make_client, tmpdir):
+        class CountingBucket(ratelimit.TokenBucket):
+            calls = 0
+
+            def TryAcquire(self, tokens=1):
+                CountingBucket.calls += 1
+                return ratelimit.TokenBucket.TryAcquire(self, tokens)
+
+        for id in ('b0', 'b1', 'b2'):
+            yelp_server.responses['/v2/business/' + id] = (200, json.dumps(business(id)))
+        client = make_client(AsyncApi, cache=FileCache(str(tmpdir)),
+                             rate_limiter=CountingBucket(rate=20, capacity=1))
+
+        futures = [client.GetBusiness(id) for id in ('b0', 'b1', 'b2')]
+        assert client.Wait(futures, timeout=5)
+        assert [future.Result().id for future in futures] == ['b0', 'b1', 'b2']
+        assert CountingBucket.calls < 20
+
+
+    def test_errors(self, yelp_server, make_client, tmpdir):
+        yelp_server.responses['/v2/search'] = (200, json.dumps(
+            {'total': 1, 'businesses': [business('bar')]}))
+        client = make_client(AsyncApi, cache=FileCache(str(tmpdir)))
+
+        missing = client.GetBusiness('missing')
+        search = client.Search(term='bar', location='bushwick')
+        no_location = client.Search(term='bar')
+
+        assert search.Result().businesses[0].id == 'bar'
+        assert isinstance(missing.Error(), Exception)
+        with pytest.raises(Exception):
+            no_location.Result()
+
+
+    def test_connection_refused(self, make_client, tmpdir):
+        client = make_client(AsyncApi, cache=FileCache(str(tmpdir)))
+        client.host = '127.0.0.1:1'
+
+        future = client.GetBusiness('b0')
+        assert client.Wait()
+        assert future.Error() is not None
+
+
+    def test_hooks(self, yelp_server, make_client, tmpdir):
+        yelp_server.responses['/v2/business/bar'] = (200, json.dumps(business('bar')))
+        client = make_client(AsyncApi, cache=FileCache(str(tmpdir)))
+        events = []
+        for event in yelp.EVENTS:
+            client.AddHook(event, lambda event, data: events.append(
+                (event, data.get('phase'), data.get('status'))))
+
+        client.GetBusiness('bar').Result()
+        client.GetBusiness('bar').Result()
+        client.GetBusiness('missing').Error()
+
+        assert events[:6] == [(yelp.EVENT_PHASE, yelp.PHASE_CACHE_LOOKUP, None),
+                              (yelp.EVENT_CACHE_MISS, None, None),
+                              (yelp.EVENT_PHASE, yelp.PHASE_SIGN, None),
+                              (yelp.EVENT_BEFORE_REQUEST, None, None),
+                              (yelp.EVENT_PHASE, yelp.PHASE_NETWORK, 200),
+                              (yelp.EVENT_AFTER_RESPONSE, None, 200)]
+        assert (yelp.EVENT_CACHE_HIT, None, None) in events
+        assert (yelp.EVENT_AFTER_RESPONSE, None, 404) in events
+        assert events[-1][0] == yelp.EVENT_ERROR
+
+
+    def test_connection_refused_hook(self, make_client, tmpdir):
+        client = make_client(AsyncApi, cache=FileCache(str(tmpdir)))
+        client.host = '127.0.0.1:1'
+        errors = []
+        client.AddHook(yelp.EVENT_ERROR, lambda event, data: errors.append(data['error']))
+
+        future = client.GetBusiness('b0')
+        assert client.Wait()
+        assert errors == [future.Error()]
@@ -0,0 +1,42 @@
+import json
+
+from conftest import business
+from filecache import FileCache
+
+
+class TestBatch(object):
+
+
+    def test_get_businesses(self, yelp_server, make_client, tmpdir):
+        ids = ['b%d' % i for i in range(20)]
+        for id in ids:
+            yelp_server.responses['/v2/business/' + id] = (200, json.dumps(business(id)))
+        client = make_client(cache=FileCache(str(tmpdir)), batch_concurrency=4)
+
+        results = client.GetBusinesses(ids + ['missing'])
+        assert [result.index for result in results] == range(21)
+        assert [result.result.id for result in results[:20]] == ids
+        assert results[20].result is None
+        assert isinstance(results[20].error, Exception)
+        assert yelp_server.request_count == 21
+
+        # Cache hits are served without another request
+        results = list(client.GetBusinesses(ids, as_completed=True))
+        assert sorted(result.result.id for result in results) == sorted(ids)
+        assert yelp_server.request_count == 21
+        client.Close()
+
+
+    def test_search_many(self, yelp_server, make_client, tmpdir):
+        yelp_server.responses['/v2/search'] = (200, json.dumps(
+            {'total': 1, 'businesses': [business('bar')]}))
+        client = make_client(cache=FileCache(str(tmpdir)), batch_concurrency=4)
+
+        results = client.SearchMany([{'term': 'bar', 'location': 'bushwick'},
+                                     {'term': 'bar'}])
+        assert results[0].result.total == 1
+        assert results[0].result.businesses[0].id == 'bar'
+        assert results[1].result is None
+        assert 'Location parameter is required' in str(results[1].error)
+        assert yelp_server.request_count == 1
+        client.Close()
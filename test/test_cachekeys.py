@@ -0,0 +1,78 @@
+import yelp
+
+
+class TestCacheKeys(object):
+
+
+    def make_client(self, **kwargs):
+        return yelp.Api(consumer_key='key',
+                        consumer_secret='secret',
+                        access_token_key='token',
+                        access_token_secret='token-secret',
+                        cache=None,
+                        **kwargs)
+
+
+    def test_canonical_search_params(self):
+        params = yelp.canonical_search_params({'term': u'  caf\xe9   bar ',
+                                               'location': 'New  York ',
+                                               'deals_filter': True,
+                                               'limit': 20,
+                                               'offset': None,
+                                               'cll': '40.7127837,-74.0059413'})
+        assert params == [('cll', '40.712784,-74.005941'),
+                          ('deals_filter', 'true'),
+                          ('limit', '20'),
+                          ('location', 'new york'),
+                          ('term', 'caf\xc3\xa9 bar')]
+
+
+    def test_sequences(self):
+        params = yelp.canonical_search_params({'category_filter': [u'bars', 'caf\xc3\xa9s'],
+                                               'radius_filter': (1000,)})
+        assert params == [('category_filter', 'bars,caf\xc3\xa9s'),
+                          ('radius_filter', '1000')]
+        assert params == yelp.canonical_search_params({'category_filter': u'bars,caf\xe9s',
+                                                       'radius_filter': 1000})
+
+
+    def test_unicode_location(self):
+        params = yelp.canonical_search_params({'location': u'M\xfcnchen'})
+        assert params == [('location', 'm\xc3\xbcnchen')]
+        assert params == yelp.canonical_search_params({'location': u'M\xdcNCHEN'})
+        assert params == yelp.canonical_search_params({'location': 'M\xc3\x9cNCHEN'})
+
+
+    def test_whole_floats(self):
+        params = yelp.canonical_search_params({'radius_filter': 1000.0, 'limit': 20})
+        assert params == yelp.canonical_search_params({'radius_filter': 1000, 'limit': 20.0})
+        assert params == [('limit', '20'), ('radius_filter', '1000')]
+        assert yelp.canonical_search_params({'radius_filter': [1000.0]}) == \
+            [('radius_filter', '1000')]
+        assert yelp.canonical_search_params({'radius_filter': 1000.5}) == \
+            [('radius_filter', '1000.5')]
+
+
+    def test_coordinates(self):
+        assert yelp.canonical_search_params({'ll': (40.7, -74.0000001)}) == \
+            [('ll', '40.7,-74')]
+        assert yelp.canonical_search_params({'bounds': ((1.123, 2), (3, 4.5))}, 1) == \
+            [('bounds', '1.1,2|3,4.5')]
+        assert yelp.canonical_search_params({'ll': '1.23456789,2'}, None) == \
+            [('ll', '1.23456789,2')]
+
+
+    def test_equivalent_searches_share_keys(self):
+        client = self.make_client(coordinate_precision=3)
+        key = client.GetSearchCacheKey(term='bar', location='Bushwick',
+                                       cll='40.69441,-73.91934')
+        assert key == client.GetSearchCacheKey(cll='40.6944,-73.9193',
+                                               location=' bushwick', term='bar')
+        assert key != client.GetSearchCacheKey(term='bar', location='Williamsburg')
+        assert key.startswith('key:http://api.yelp.com/v2/search?')
+
+
+    def test_business_key(self):
+        client = self.make_client()
+        assert client.GetBusinessCacheKey(u'red-cat-jazz-caf\xe9-houston-3') == \
+            client.GetBusinessCacheKey('red-cat-jazz-caf%C3%A9-houston-3')
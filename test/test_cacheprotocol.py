@@ -0,0 +1,47 @@
+import json
+import time
+
+import pytest
+
+from conftest import business
+
+
+BUSINESS = business('post-no-bills-brooklyn', name='Post No Bills')
+
+
+class TwoCallCache(object):
+    '''A third-party style cache without GetIfFresh.'''
+
+    def __init__(self):
+        self.entries = {}
+
+    def Get(self, key):
+        return self.entries.get(key, (None, None))[0]
+
+    def Set(self, key, data):
+        self.entries[key] = (data, time.time())
+
+    def GetCachedTime(self, key):
+        return self.entries.get(key, (None, None))[1]
+
+
+class TestCacheProtocol(object):
+
+
+    @pytest.fixture(autouse=True)
+    def serve(self, yelp_server):
+        yelp_server.responses['/v2/business/post-no-bills-brooklyn'] = (200, json.dumps(BUSINESS))
+
+
+    def test_two_call_cache(self, yelp_server, make_client):
+        client = make_client(cache=TwoCallCache())
+        client.GetBusiness('post-no-bills-brooklyn')
+        client.GetBusiness('post-no-bills-brooklyn')
+        assert yelp_server.request_count == 1
+
+
+    def test_no_cache(self, yelp_server, make_client):
+        client = make_client()
+        client.GetBusiness('post-no-bills-brooklyn')
+        client.GetBusiness('post-no-bills-brooklyn')
+        assert yelp_server.request_count == 2
@@ -0,0 +1,51 @@
+import json
+
+import cachetool
+from conftest import business
+from filecache import FileCache
+
+
+def serve(yelp_server):
+    for id in ('a', 'b'):
+        yelp_server.responses['/v2/business/' + id] = (
+            200, json.dumps(business(id, name='Business')))
+    yelp_server.responses['/v2/search'] = lambda query: (
+        200, json.dumps({'total': 1, 'businesses': [{'id': query['term'], 'location': {}}]}))
+
+
+class TestCacheTool(object):
+
+
+    def test_prewarm(self, yelp_server, make_client, tmpdir):
+        serve(yelp_server)
+        client = make_client(cache=FileCache(str(tmpdir)), cache_timeout=3600)
+        stats = cachetool.Prewarm(client, ['a', 'b', 'missing'],
+                                  [{'term': 'bar', 'location': 'Brooklyn'}])
+        assert stats == {'businesses': 2, 'searches': 1, 'errors': 1}
+        requests = yelp_server.request_count
+
+        assert client.GetBusiness('a').name == 'Business'
+        assert client.Search(term='bar', location='Brooklyn').businesses[0].id == 'bar'
+        assert yelp_server.request_count == requests
+
+
+    def test_command_line(self, yelp_server, tmpdir, monkeypatch, capsys):
+        serve(yelp_server)
+        for name, variable in cachetool.CREDENTIAL_VARIABLES:
+            monkeypatch.setenv(variable, name)
+        tmpdir.join('ids.txt').write('a\nmissing\nb\n\n')
+        source = str(tmpdir.join('source'))
+        archive = str(tmpdir.join('cache.tar.gz'))
+
+        assert cachetool.Main(['--cache-dir', source, 'prewarm', '--host', yelp_server.host,
+                               '--ids', str(tmpdir.join('ids.txt'))]) == 0
+        assert cachetool.Main(['--cache-dir', source, 'export', archive]) == 0
+        assert cachetool.Main(['--cache-dir', str(tmpdir.join('target')), 'import', archive]) == 0
+        output = [json.loads(line) for line in capsys.readouterr()[0].splitlines()]
+        assert output == [{'businesses': 2, 'searches': 0, 'errors': 1},
+                          {'exported': 2},
+                          {'imported': 2, 'skipped': 0}]
+
+        monkeypatch.delenv('YELP_CONSUMER_KEY')
+        assert cachetool.Main(['--cache-dir', source, 'prewarm']) == 1
+        assert 'YELP_CONSUMER_KEY' in capsys.readouterr()[1]
@@ -0,0 +1,52 @@
+import json
+import os
+import threading
+import time
+
+from conftest import business
+from filecache import FileCache
+
+
+BUSINESS = business('post-no-bills-brooklyn', name='Post No Bills', location={})
+
+
+class TestCoalescing(object):
+
+
+    def test_single_flight(self, yelp_server, make_client):
+        yelp_server.responses['/v2/business/post-no-bills-brooklyn'] = (200, json.dumps(BUSINESS))
+        yelp_server.latency = 0.2
+        client = make_client()
+        names = []
+
+        def fetch():
+            names.append(client.GetBusiness('post-no-bills-brooklyn').name)
+
+        threads = [threading.Thread(target=fetch) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert names == ['Post No Bills'] * 8
+        assert yelp_server.request_count == 1
+
+
+    def test_stale_while_revalidate(self, yelp_server, make_client, tmpdir):
+        yelp_server.responses['/v2/business/post-no-bills-brooklyn'] = (200, json.dumps(BUSINESS))
+        cache = FileCache(str(tmpdir))
+        client = make_client(cache=cache, stale_while_revalidate=3600)
+        key = client._GetCacheKey(client._GetBusinessUrl('post-no-bills-brooklyn'))
+        cache.Set(key, json.dumps(dict(BUSINESS, name='Stale')))
+        stale_time = time.time() - 120
+        os.utime(cache._GetPath(key), (stale_time, stale_time))
+
+        assert client.GetBusiness('post-no-bills-brooklyn').name == 'Stale'
+        for _ in range(50):
+            if cache.GetCachedTime(key) > stale_time:
+                break
+            time.sleep(0.05)
+
+        assert client.GetBusiness('post-no-bills-brooklyn').name == 'Post No Bills'
+        assert yelp_server.request_count == 1
+        client.Close()
@@ -0,0 +1,60 @@
+import math
+
+import pytest
+import columns
+import yelp
+
+
+def business(i, rating, city):
+    return {'id': u'b%d' % i,
+            'rating': rating,
+            'review_count': i * 10,
+            'is_closed': False,
+            'categories': [[u'Bars', u'bars']],
+            'location': {'city': city,
+                         'coordinate': {'latitude': 40.0 + i, 'longitude': -73.0}}}
+
+
+DATA = {'total': 3,
+        'businesses': [business(0, 4.5, u'Brooklyn'),
+                       business(1, 3.0, u'Queens'),
+                       {'id': u'b2', 'location': {'city': u'Brooklyn'}}]}
+
+
+class TestColumns(object):
+
+
+    def check(self, table):
+        assert len(table) == 3
+        assert list(table['rating'][:2]) == [4.5, 3.0]
+        assert math.isnan(table['rating'][2])
+        assert list(table['review_count']) == [0, 10, -1]
+        assert list(table['is_closed']) == [0, 0, -1]
+        assert table['city'].dictionary == [u'Brooklyn', u'Queens']
+        assert list(table['city'].codes) == [0, 1, 0]
+        assert table['category'].Decode() == [u'bars', u'bars', None]
+        assert table['latitude'][1] == 41.0
+
+
+    def test_search_result_set(self):
+        self.check(yelp.SearchResultSet.NewFromJsonDict(DATA).ToColumns())
+
+
+    def test_lazy_search_result_set(self):
+        result = yelp.SearchResultSet.NewFromJsonDict(DATA, lazy=True)
+        self.check(result.ToColumns())
+        assert result._businesses is yelp._NOT_LOADED
+
+
+    def test_businesses(self):
+        businesses = [yelp.Business.NewFromJsonDict(data) for data in DATA['businesses']]
+        self.check(columns.FromBusinesses(businesses))
+
+
+    def test_numpy(self):
+        numpy = pytest.importorskip('numpy')
+        table = columns.FromJsonDicts(DATA['businesses'], use_numpy=True)
+        self.check(table)
+        assert isinstance(table['rating'], numpy.ndarray)
+        assert table['rating'].dtype == numpy.float64
+        assert numpy.nanmean(table['rating']) == 3.75
@@ -0,0 +1,60 @@
+import json
+
+import pytest
+
+from compressedcache import CompressedCache, TrainDictionary
+from memorycache import MemoryCache
+
+
+def body(i):
+    return json.dumps({'id': 'business-%d' % i,
+                       'name': 'Business %d' % i,
+                       'location': {'city': 'Brooklyn', 'state_code': 'NY'},
+                       'categories': [['Bars', 'bars']] * 5,
+                       'snippet_text': 'Great beer and a friendly crowd. ' * 10})
+
+
+class TestCompressedCache(object):
+
+
+    def test_round_trip(self):
+        back = MemoryCache()
+        cache = CompressedCache(back)
+        cache.Set('big', body(0))
+        cache.Set('small', '{}')
+
+        assert cache.Get('big') == body(0)
+        assert cache.GetIfFresh('big', 60)[0] == body(0)
+        assert len(back.Get('big')) < len(body(0))
+        assert cache.Get('small') == '{}'
+        assert cache.Get('missing') is None
+        stats = cache.GetStats()
+        assert stats['bytes_stored'] < stats['bytes_in']
+
+        back.Set('legacy', body(0))
+        assert cache.Get('legacy') is None
+
+
+    def test_stores_gzipped_response(self, yelp_server, make_client):
+        yelp_server.responses['/v2/business/business-0'] = (200, body(0))
+        back = MemoryCache()
+        client = make_client(cache=CompressedCache(back), use_gzip_compression=True)
+
+        assert client.GetBusiness('business-0').name == 'Business 0'
+        key = client.GetBusinessCacheKey('business-0')
+        assert back.Get(key).startswith('\x02\x1f\x8b')
+        assert client.GetBusiness('business-0').name == 'Business 0'
+        assert yelp_server.request_count == 1
+        client.Close()
+
+
+    def test_dictionary(self):
+        pytest.importorskip('zstandard')
+        dictionary = TrainDictionary([body(i) for i in range(500)], size=4096)
+        back = MemoryCache()
+        cache = CompressedCache(back, dictionary=dictionary)
+        cache.Set('key', body(1000))
+
+        assert cache.Get('key') == body(1000)
+        assert len(back.Get('key')) < len(CompressedCache(MemoryCache())._Encode(body(1000)))
+        assert CompressedCache(back).Get('key') is None
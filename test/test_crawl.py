@@ -0,0 +1,104 @@
+import json
+import os
+import random
+
+import pytest
+import yelp
+from crawl import Crawler, CrawlError, Tile, TileRegion
+
+
+def make_region(yelp_server, count):
+    rng = random.Random(0)
+    points = [('b%d' % i, rng.random(), rng.random()) for i in range(count)]
+
+    def search(query):
+        (south, west), (north, east) = [map(float, point.split(','))
+                                        for point in query['bounds'].split('|')]
+        inside = [id for id, latitude, longitude in points
+                  if south <= latitude < north and west <= longitude < east]
+        offset, limit = int(query['offset']), int(query['limit'])
+        return 200, json.dumps({'total': len(inside),
+                                'businesses': [{'id': id, 'location': {}}
+                                               for id in inside[offset:offset + limit]]})
+    yelp_server.responses['/v2/search'] = search
+    for id, _, _ in points:
+        yelp_server.responses['/v2/business/' + id] = (200, json.dumps({'id': id, 'location': {}}))
+    yelp_server.responses['/v2/business/b7'] = (500, json.dumps({'error': {'id': 'INTERNAL_ERROR'}}))
+    return set(id for id, _, _ in points)
+
+
+class DyingApi(yelp.Api):
+
+    def GetBusinesses(self, ids, as_completed=False, no_cache=False):
+        os._exit(1)
+
+
+def api_factory(host, api_class=yelp.Api):
+    def factory():
+        client = api_class(consumer_key='key',
+                           consumer_secret='secret',
+                           access_token_key='token',
+                           access_token_secret='token-secret',
+                           cache=None,
+                           max_retries=0)
+        client.host = host
+        return client
+    return factory
+
+
+class TestCrawl(object):
+
+
+    def test_tiles(self):
+        tiles = TileRegion(0, 0, 1, 1.5, 0.5, categories=['bars', 'pizza'])
+        assert len(tiles) == 12
+        assert tiles[0] == Tile(0, 0, 0.5, 0.5, 'bars')
+        assert tiles[0].GetSearchParams() == {'bounds': ((0, 0), (0.5, 0.5)),
+                                              'category_filter': 'bars'}
+        assert sum(len(tile.Split()) for tile in tiles[:1]) == 4
+
+
+    def test_crawl(self, yelp_server):
+        ids = make_region(yelp_server, 300)
+        crawler = Crawler(api_factory(yelp_server.host), [Tile(0, 0, 1, 1)],
+                          processes=2, result_cap=100)
+
+        found = [business['id'] for business in crawler.Run()]
+        assert len(found) == len(set(found)) == 299
+        assert set(found) == ids - set(['b7'])
+        stats = crawler.GetStats()
+        assert stats['splits'] >= 1
+        assert stats['errors'] == 3
+        assert crawler.failures[0][:2] == ['ids', 'b7']
+
+
+    def test_resume(self, yelp_server, tmpdir):
+        ids = make_region(yelp_server, 120)
+        path = str(tmpdir.join('crawl.json'))
+        crawler = Crawler(api_factory(yelp_server.host), [Tile(0, 0, 1, 1)],
+                          checkpoint_path=path, processes=2, result_cap=50, chunk_size=5)
+        first = []
+        for business in crawler.Run():
+            first.append(business['id'])
+            # Not a multiple of chunk_size, so the crawl stops mid-chunk
+            if len(first) == 31:
+                break
+
+        resumed = Crawler(api_factory(yelp_server.host), [], checkpoint_path=path, processes=2)
+        second = [business['id'] for business in resumed.Run()]
+
+        assert not set(first) & set(second)
+        assert set(first) | set(second) == ids - set(['b7'])
+        assert resumed.GetStats()['businesses'] == 119
+
+
+    def test_worker_death(self, yelp_server, tmpdir):
+        make_region(yelp_server, 20)
+        path = str(tmpdir.join('crawl.json'))
+        crawler = Crawler(api_factory(yelp_server.host, DyingApi), [Tile(0, 0, 1, 1)],
+                          checkpoint_path=path, processes=2)
+        with pytest.raises(CrawlError):
+            list(crawler.Run())
+
+        with open(path) as fp:
+            assert len(json.load(fp)['ids']) == 20
@@ -0,0 +1,62 @@
+import json
+
+import pytest
+import yelp
+from conftest import business
+from memorycache import MemoryCache
+
+
+BUSINESS = business('post-no-bills-brooklyn', name='Post No Bills', location={})
+
+
+class TestDecoding(object):
+
+
+    @pytest.fixture(autouse=True)
+    def serve(self, yelp_server):
+        yelp_server.responses['/v2/business/post-no-bills-brooklyn'] = (200, json.dumps(BUSINESS))
+
+
+    def test_decoder(self, make_client):
+        decoded = []
+
+        def decoder(body):
+            decoded.append(body)
+            return json.loads(body)
+
+        client = make_client(cache=MemoryCache(), decoder=decoder)
+        assert client.GetBusiness('post-no-bills-brooklyn').name == 'Post No Bills'
+        assert client.GetBusiness('post-no-bills-brooklyn').name == 'Post No Bills'
+        assert len(decoded) == 2
+
+
+    def test_decoded_cache(self, make_client):
+        decoded = []
+
+        def decoder(body):
+            decoded.append(body)
+            return json.loads(body)
+
+        client = make_client(cache=MemoryCache(), decoder=decoder, decoded_cache_size=10)
+        for _ in range(3):
+            assert client.GetBusiness('post-no-bills-brooklyn').name == 'Post No Bills'
+        assert len(decoded) == 1
+
+        # A different body under the same key is decoded again
+        client._cache.Set(client.GetBusinessCacheKey('post-no-bills-brooklyn'),
+                          json.dumps(dict(BUSINESS, name='Renamed')))
+        assert client.GetBusiness('post-no-bills-brooklyn').name == 'Renamed'
+        assert len(decoded) == 2
+
+
+    def test_response_formats(self, make_client):
+        client = make_client(cache=MemoryCache(), response_format=yelp.RESPONSE_RAW)
+        assert json.loads(client.GetBusiness('post-no-bills-brooklyn')) == BUSINESS
+
+        client.SetResponseFormat(yelp.RESPONSE_DICT)
+        assert client.GetBusiness('post-no-bills-brooklyn') == BUSINESS
+        with pytest.raises(Exception):
+            client.GetBusiness('missing')
+
+        with pytest.raises(ValueError):
+            client.SetResponseFormat('xml')
@@ -0,0 +1,121 @@
+import csv
+import gzip
+import json
+import os
+
+import pytest
+import export
+import yelp
+
+
+def business(i):
+    return {'id': u'caf\xe9-%d' % i,
+            'name': u'Caf\xe9 %d' % i,
+            'rating': 4.5,
+            'review_count': i,
+            'categories': [[u'Coffee & Tea', u'coffee'], [u'Bakeries', u'bakeries']],
+            'deals': [{'id': u'd%d' % i, 'title': u'Half off'}],
+            'location': {'address': [u'1 Main St', u'Unit 2'],
+                         'city': u'Brooklyn',
+                         'coordinate': {'latitude': 40.5, 'longitude': -73.9}},
+            'reviews': [{'id': u'r%d' % i,
+                         'rating': 5,
+                         'excerpt': u'Great, "strong" coffee',
+                         'user': {'id': u'u%d' % i, 'name': u'Ann'}}]}
+
+
+SEARCH = {'total': 2, 'businesses': [business(0), business(1)]}
+
+
+class TestExport(object):
+
+
+    def test_flatten(self):
+        for value in [business(3),
+                      yelp.Business.NewFromJsonDict(business(3)),
+                      yelp.Business.NewFromJsonDict(business(3), lazy=True)]:
+            flat = export.FlattenBusiness(value)
+            assert flat.keys() == [name for name, _, _ in export.FIELDS]
+            assert flat['categories'] == u'coffee,bakeries'
+            assert flat['location_address'] == u'1 Main St, Unit 2'
+            assert flat['location_latitude'] == 40.5
+            assert flat['review_user_name'] == u'Ann'
+            assert flat['phone'] is None
+
+
+    def test_ndjson(self, tmpdir):
+        path = str(tmpdir.join('out.ndjson'))
+        with export.Exporter(path) as exporter:
+            assert exporter.Write(json.dumps(SEARCH)) == 2
+            assert exporter.Write(yelp.SearchResultSet.NewFromJsonDict(SEARCH, lazy=True)) == 2
+            assert exporter.WriteMany(business(i) for i in xrange(2, 5)) == 3
+        assert exporter.count == 7
+        with open(path) as fp:
+            rows = [json.loads(line) for line in fp]
+        assert [row['id'] for row in rows] == [u'caf\xe9-%d' % i for i in [0, 1, 0, 1, 2, 3, 4]]
+        assert rows[0]['deals'] == [{'id': u'd0', 'title': u'Half off'}]
+
+
+    def test_gzipped_csv(self, tmpdir):
+        path = str(tmpdir.join('out.csv.gz'))
+        with export.Exporter(path, format=export.FORMAT_CSV, compress=True) as exporter:
+            exporter.Write(yelp.Business.NewFromJsonDict(business(0)))
+        rows = list(csv.DictReader(gzip.open(path)))
+        assert len(rows) == 1
+        assert rows[0]['name'].decode('utf-8') == u'Caf\xe9 0'
+        assert rows[0]['review_excerpt'] == 'Great, "strong" coffee'
+        assert rows[0]['phone'] == ''
+        assert json.loads(rows[0]['deals'])[0]['id'] == u'd0'
+
+
+    def test_rotation(self, tmpdir):
+        path = str(tmpdir.join('out-%02d.csv'))
+        exporter = export.Exporter(path, format=export.FORMAT_CSV, max_bytes=1000)
+        exporter.WriteMany(business(i) for i in xrange(20))
+        exporter.Close()
+        assert len(exporter.paths) > 1
+        assert exporter.paths[0] == str(tmpdir.join('out-00.csv'))
+        ids = []
+        for path in exporter.paths:
+            # Every file starts with a header and stays near the limit
+            rows = list(csv.DictReader(open(path)))
+            assert os.path.getsize(path) < 1500
+            ids.extend(row['id'] for row in rows)
+        assert ids == [(u'caf\xe9-%d' % i).encode('utf-8') for i in xrange(20)]
+
+
+    def test_compressed_rotation(self, tmpdir):
+        path = str(tmpdir.join('out-%02d.ndjson.gz'))
+        with export.Exporter(path, compress=True, max_bytes=2000) as exporter:
+            exporter.WriteMany(business(i) for i in xrange(50))
+        assert len(exporter.paths) > 1
+        for path in exporter.paths:
+            assert os.path.getsize(path) < 2000
+            assert len(gzip.open(path).read()) < 3000
+
+
+    def test_closed(self, tmpdir):
+        path = str(tmpdir.join('out.ndjson'))
+        with export.Exporter(path) as exporter:
+            exporter.Write(business(0))
+        with pytest.raises(export.ExportError):
+            exporter.Write(business(1))
+        with open(path) as fp:
+            assert len(fp.readlines()) == 1
+
+
+    def test_errors(self, tmpdir):
+        with pytest.raises(export.ExportError):
+            export.Exporter(str(tmpdir.join('out')), format='xml')
+        with pytest.raises(export.ExportError):
+            export.Exporter(str(tmpdir.join('out')), max_bytes=1000)
+
+
+    def test_api_error(self, tmpdir):
+        path = str(tmpdir.join('out.ndjson'))
+        error = json.dumps({'error': {'id': 'BUSINESS_UNAVAILABLE'}})
+        with export.Exporter(path) as exporter:
+            with pytest.raises(export.ExportError):
+                exporter.WriteMany([business(0), error, business(1)])
+        with open(path) as fp:
+            assert len(fp.readlines()) == 1
@@ -0,0 +1,180 @@
+import os
+import time
+
+from filecache import FileCache
+
+
+class TestFileCacheEviction(object):
+
+
+    def test_max_entries(self, tmpdir):
+        cache = FileCache(root_directory=str(tmpdir), max_entries=2)
+        cache.Set('a', 'aaa')
+        cache.Set('b', 'bbb')
+        assert cache.Get('a') == 'aaa'
+        cache.Set('c', 'ccc')
+
+        assert cache.Get('b') is None
+        assert cache.Get('a') == 'aaa'
+        assert cache.Get('c') == 'ccc'
+        assert cache.GetStats() == {'entries': 2, 'bytes': 6}
+
+
+    def test_max_bytes(self, tmpdir):
+        cache = FileCache(root_directory=str(tmpdir), max_bytes=10)
+        cache.Set('a', 'x' * 6)
+        cache.Set('a', 'x' * 4)
+        cache.Set('b', 'y' * 6)
+        assert cache.GetStats()['bytes'] == 10
+        cache.Set('c', 'z' * 6)
+
+        assert cache.Get('a') is None
+        assert cache.Get('b') is None
+        assert cache.Get('c') == 'z' * 6
+
+
+    def test_sweep_and_index(self, tmpdir):
+        cache = FileCache(root_directory=str(tmpdir))
+        cache.Set('old', 'old', cached_time=time.time() - 120)
+        cache.Set('new', 'new')
+        # Without an index file, the first cache with limits builds one
+        cache = FileCache(root_directory=str(tmpdir), max_age=60)
+        cache.Remove('missing')
+        cache.Sweep()
+
+        assert cache.Get('old') is None
+        assert cache.Get('new') == 'new'
+        assert os.path.exists(os.path.join(str(tmpdir), FileCache.INDEX_FILE))
+
+        reloaded = FileCache(root_directory=str(tmpdir), max_entries=10)
+        assert reloaded.GetStats() == {'entries': 1, 'bytes': 3}
+
+
+    def test_index_survives_restart(self, tmpdir):
+        cache = FileCache(root_directory=str(tmpdir), max_entries=3)
+        cache.Sweep()
+        for key in 'abcde':
+            cache.Set(key, key * 2)
+
+        reloaded = FileCache(root_directory=str(tmpdir), max_entries=3)
+        assert reloaded.GetStats() == {'entries': 3, 'bytes': 6}
+        assert len(list(reloaded._IterFiles())) == 3
+        reloaded.Set('f', 'ff')
+        assert reloaded.Get('c') is None
+        assert reloaded.Get('f') == 'ff'
+
+
+    def test_shared_directory(self, tmpdir):
+        first = FileCache(root_directory=str(tmpdir), max_entries=10)
+        second = FileCache(root_directory=str(tmpdir), max_entries=10)
+        first.Set('a', 'aaa')
+        second.Set('b', 'bbb')
+        second.Remove('a')
+        # Caches without limits keep the index of those with them current
+        FileCache(root_directory=str(tmpdir)).Set('c', 'ccc')
+
+        first.Sweep()
+        assert first.GetStats() == {'entries': 2, 'bytes': 6}
+        second.Sweep()
+        assert FileCache(root_directory=str(tmpdir), max_entries=10).GetStats() == \
+            {'entries': 2, 'bytes': 6}
+
+
+    def test_evicted_key_written_again(self, tmpdir):
+        cache = FileCache(root_directory=str(tmpdir), max_entries=2)
+        cache.Set('a', 'aaa')
+        cache.Set('b', 'bbb')
+        hashed_key = os.path.basename(cache._GetPath('a'))
+        with cache._lock:
+            cache.max_entries = 1
+            evicted = cache._PopOverflow()
+        assert evicted == [hashed_key]
+        # Another thread sets the evicted key before its file is removed
+        cache.max_entries = 2
+        cache.Set('a', 'AAA')
+        cache._RemoveFiles(evicted)
+
+        assert cache.Get('a') == 'AAA'
+        assert hashed_key + ' -\n' not in tmpdir.join(FileCache.INDEX_FILE).read()
+        cache.Sweep()
+        assert FileCache(root_directory=str(tmpdir), max_entries=1).Get('a') == 'AAA'
+
+
+    def test_no_index_file(self, tmpdir, monkeypatch):
+        cache = FileCache(root_directory=str(tmpdir))
+        opened = []
+        os_open = os.open
+        monkeypatch.setattr(os, 'open', lambda path, *args: opened.append(path) or
+                            os_open(path, *args))
+        cache.Set('a', 'aaa')
+        cache.Remove('a')
+        # Unlimited caches look for the index file once, not on every write
+        assert str(tmpdir.join(FileCache.INDEX_FILE)) not in opened
+
+
+    def test_sweeper_thread(self, tmpdir):
+        cache = FileCache(root_directory=str(tmpdir), max_age=0.05, sweep_interval=0.05)
+        cache.Set('a', 'aaa')
+        deadline = time.time() + 5
+        while cache.GetStats()['entries'] and time.time() < deadline:
+            time.sleep(0.05)
+        cache.StopSweeper()
+
+        assert cache.GetStats()['entries'] == 0
+        assert not os.path.exists(cache._GetPath('a'))
+
+
+class TestFileCacheArchive(object):
+
+
+    def test_round_trip(self, tmpdir):
+        source = FileCache(root_directory=str(tmpdir.join('source')))
+        source.Set('a', 'aaa', cached_time=time.time() - 30.123456)
+        source.Set('b', 'bbb')
+        source.Set('old', 'old', cached_time=time.time() - 120)
+        path = str(tmpdir.join('cache.tar.gz'))
+        assert source.ExportArchive(path, max_age=60) == 2
+
+        target = FileCache(root_directory=str(tmpdir.join('target')), max_entries=10)
+        assert target.ImportArchive(path) == {'imported': 2, 'skipped': 0}
+        assert target.Get('a') == 'aaa'
+        # os.utime sets times to the microsecond
+        for key in ('a', 'b'):
+            assert abs(target.GetCachedTime(key) - source.GetCachedTime(key)) < 1e-5
+        assert target.Get('old') is None
+        assert target.GetStats() == {'entries': 2, 'bytes': 6}
+        reloaded = FileCache(root_directory=str(tmpdir.join('target')), max_entries=10)
+        assert reloaded.GetStats() == {'entries': 2, 'bytes': 6}
+
+
+    def test_import_keeps_newer_entries(self, tmpdir):
+        source = FileCache(root_directory=str(tmpdir.join('source')))
+        source.Set('a', 'archived', cached_time=time.time() - 30)
+        source.Set('b', 'archived', cached_time=time.time() - 30)
+        path = str(tmpdir.join('cache.tar'))
+        source.ExportArchive(path, compress=False)
+
+        target = FileCache(root_directory=str(tmpdir.join('target')))
+        target.Set('a', 'local')
+        assert target.ImportArchive(path) == {'imported': 1, 'skipped': 1}
+        assert target.Get('a') == 'local'
+        assert target.Get('b') == 'archived'
+        assert target.ImportArchive(path, max_age=10) == {'imported': 0, 'skipped': 2}
+        target.ImportArchive(path, overwrite=True)
+        assert target.Get('a') == 'archived'
+
+
+class TestFileCacheGetIfFresh(object):
+
+
+    def test_max_age(self, tmpdir):
+        cache = FileCache(str(tmpdir))
+        assert cache.GetIfFresh('a', 60) is None
+        cache.Set('a', 'aaa')
+
+        data, age = cache.GetIfFresh('a', 60)
+        assert data == 'aaa'
+        assert 0 <= age < 60
+        os.utime(cache._GetPath('a'), (1000, 1000))
+        assert cache.GetIfFresh('a', 60) is None
+        assert cache.GetIfFresh('a', None)[0] == 'aaa'
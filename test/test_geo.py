@@ -0,0 +1,75 @@
+import random
+
+import geo
+import pytest
+import yelp
+
+
+def business(id, latitude, longitude):
+    return {'id': id, 'location': {'coordinate': {'latitude': latitude, 'longitude': longitude}}}
+
+
+class TestSpatialIndex(object):
+
+
+    def setup_method(self, method):
+        generator = random.Random(42)
+        self.points = [business('b%d' % i,
+                                40.7 + generator.uniform(-0.1, 0.1),
+                                -73.9 + generator.uniform(-0.1, 0.1))
+                       for i in range(500)]
+        self.index = geo.SpatialIndex(cell_size=0.01)
+        self.index.AddMany(self.points)
+
+
+    def brute_force(self, latitude, longitude):
+        return sorted((geo._Haversine(latitude, longitude,
+                                      point['location']['coordinate']['latitude'],
+                                      point['location']['coordinate']['longitude']), point['id'])
+                      for point in self.points)
+
+
+    def test_radius(self):
+        expected = [id for distance, id in self.brute_force(40.71, -73.91) if distance <= 2000]
+        matches = self.index.QueryRadius(40.71, -73.91, 2000)
+        assert [match[0]['id'] for match in matches] == expected
+        assert matches == self.index.QueryRadiusMany([40.71], [-73.91], 2000)[0]
+
+
+    def test_k_nearest(self):
+        for latitude, longitude in [(40.7, -73.9), (40.9, -73.5), (0, 0)]:
+            expected = [id for distance, id in self.brute_force(latitude, longitude)[:7]]
+            assert [match[0]['id'] for match in self.index.KNearest(latitude, longitude, 7)] == expected
+
+
+    def test_many(self):
+        generator = random.Random(7)
+        latitudes = [40.7 + generator.uniform(-0.15, 0.15) for _ in range(200)] + [40.7, 0]
+        longitudes = [-73.9 + generator.uniform(-0.15, 0.15) for _ in range(200)] + [-73.9, 0]
+        radius_matches = self.index.QueryRadiusMany(latitudes, longitudes, 1500)
+        nearest = self.index.KNearestMany(latitudes, longitudes, 5)
+        for i, (latitude, longitude) in enumerate(zip(latitudes, longitudes)):
+            expected = self.index.QueryRadius(latitude, longitude, 1500)
+            assert [match[0]['id'] for match in radius_matches[i]] == \
+                [match[0]['id'] for match in expected]
+            assert [match[1] for match in radius_matches[i]] == \
+                pytest.approx([match[1] for match in expected])
+            expected = [id for distance, id in self.brute_force(latitude, longitude)[:5]]
+            assert [match[0]['id'] for match in nearest[i]] == expected
+
+
+    def test_dedupe(self):
+        assert self.index.AddMany([yelp.SearchResultSet.NewFromJsonDict(
+            {'businesses': [self.points[0], business('new', 40.7, -73.9)]})]) == 1
+        assert len(self.index) == 501
+        assert self.index.duplicates == 1
+        assert 'new' in self.index
+        assert self.index.Get('new').location.coordinate['latitude'] == 40.7
+
+
+    def test_pure_python(self, monkeypatch):
+        expected = self.index.KNearest(40.7, -73.9, 5)
+        monkeypatch.setattr(geo, 'numpy', None)
+        matches = self.index.KNearest(40.7, -73.9, 5)
+        assert [match[0]['id'] for match in matches] == [match[0]['id'] for match in expected]
+        assert matches[0][1] == pytest.approx(expected[0][1])
@@ -0,0 +1,47 @@
+import json
+
+import yelp
+
+
+def search_responder(total):
+    def respond(query):
+        offset, limit = int(query['offset']), int(query['limit'])
+        assert limit <= yelp.SEARCH_PAGE_SIZE
+        assert offset + limit <= yelp.SEARCH_RESULT_CAP
+        ids = range(offset, min(offset + limit, total))
+        return 200, json.dumps({'total': total,
+                                'businesses': [{'id': 'b%d' % i, 'location': {}} for i in ids]})
+    return respond
+
+
+class TestIterSearch(object):
+
+
+    def test_pages(self, yelp_server, make_client):
+        yelp_server.responses['/v2/search'] = search_responder(47)
+        client = make_client()
+
+        ids = [business.id for business in client.IterSearch(term='bar', location='bushwick')]
+        assert ids == ['b%d' % i for i in range(47)]
+        assert yelp_server.request_count == 3
+        client.Close()
+
+
+    def test_result_cap(self, yelp_server, make_client):
+        yelp_server.responses['/v2/search'] = search_responder(5000)
+        client = make_client()
+
+        businesses = list(client.IterSearch(location='bushwick', offset=970, limit=15))
+        assert len(businesses) == 30
+        assert businesses[-1].id == 'b999'
+        client.Close()
+
+
+    def test_search_result_set(self, yelp_server, make_client):
+        yelp_server.responses['/v2/search'] = search_responder(3)
+        client = make_client()
+
+        results = client.Search(location='bushwick', offset=0, limit=20)
+        assert len(results) == 3
+        assert results[1].id == 'b1'
+        assert [business.id for business in results] == ['b0', 'b1', 'b2']
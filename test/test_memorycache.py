@@ -0,0 +1,78 @@
+import os
+import time
+
+from filecache import FileCache
+from memorycache import MemoryCache, TieredCache
+
+
+class TestMemoryCache(object):
+
+
+    def test_lru_entries(self):
+        cache = MemoryCache(max_entries=2)
+        cache.Set('a', 'aaa')
+        cache.Set('b', 'bbb')
+        assert cache.Get('a') == 'aaa'
+        cache.Set('c', 'ccc')
+
+        assert cache.Get('b') is None
+        assert cache.Get('a') == 'aaa'
+        assert cache.Get('c') == 'ccc'
+        assert cache.GetStats()['evictions'] == 1
+
+
+    def test_max_bytes(self):
+        cache = MemoryCache(max_bytes=10)
+        cache.Set('a', 'x' * 6)
+        cache.Set('b', 'y' * 6)
+        cache.Set('c', 'z' * 11)
+
+        assert cache.Get('a') is None
+        assert cache.Get('b') == 'y' * 6
+        assert cache.Get('c') is None
+        assert cache.GetStats()['bytes'] == 6
+
+
+    def test_ttl(self):
+        cache = MemoryCache(ttl=60)
+        cache.Set('a', 'aaa', ttl=-1)
+        cache.Set('b', 'bbb')
+
+        assert cache.GetCachedTime('a') is None
+        assert cache.GetCachedTime('b') is not None
+        stats = cache.GetStats()
+        assert (stats['hits'], stats['misses'], stats['expirations']) == (1, 1, 1)
+
+
+    def test_tiered(self, tmpdir):
+        back = FileCache(str(tmpdir))
+        back.Set('a', 'aaa')
+        os.utime(back._GetPath('a'), (1000, 1000))
+        front = MemoryCache()
+        cache = TieredCache(front, back)
+
+        assert cache.GetCachedTime('a') == 1000
+        assert cache.Get('a') == 'aaa'
+        assert front.GetCachedTime('a') == 1000
+
+        cache.Set('b', 'bbb')
+        assert front.Get('b') == back.Get('b') == 'bbb'
+        assert cache.GetCachedTime('b') >= time.time() - 60
+
+        cache.Remove('b')
+        assert cache.Get('b') is None
+
+
+class TestGetIfFresh(object):
+
+
+    def test_tiered(self, tmpdir):
+        back = FileCache(str(tmpdir))
+        back.Set('a', 'aaa')
+        front = MemoryCache()
+        cache = TieredCache(front, back)
+
+        assert cache.GetIfFresh('a', 60)[0] == 'aaa'
+        assert front.GetIfFresh('a', 60)[0] == 'aaa'
+        assert front.GetStats()['hits'] == 1
+        assert cache.GetIfFresh('b', 60) is None
@@ -0,0 +1,53 @@
+import json
+
+import yelp
+from conftest import business
+from memorycache import MemoryCache
+from metrics import Histogram, MetricsCollector
+
+
+class TestMetrics(object):
+
+
+    def test_histogram(self):
+        histogram = Histogram()
+        for i in range(1, 1001):
+            histogram.Add(i / 1000.0)
+
+        assert histogram.count == 1000
+        assert abs(histogram.Percentile(0.5) - 0.5) < 0.05
+        assert abs(histogram.Percentile(0.99) - 0.99) < 0.1
+        assert Histogram().Percentile(0.5) is None
+
+
+    def test_collector(self, yelp_server, make_client):
+        yelp_server.responses['/v2/business/b0'] = (200, json.dumps(business('b0')))
+        client = make_client(cache=MemoryCache())
+        metrics = MetricsCollector()
+        metrics.Register(client)
+        events = []
+        client.AddHook(yelp.EVENT_BEFORE_REQUEST, lambda event, data: events.append(data['url']))
+
+        client.GetBusiness('b0')
+        client.GetBusiness('b0')
+        try:
+            client.GetBusiness('missing')
+        except Exception:
+            pass
+
+        result = metrics.AsDict()
+        assert result['counters'] == {'requests': 2, 'cache_hits': 1, 'cache_misses': 2, 'errors': 1}
+        assert result['responses'] == {'200': 1, '404': 1}
+        assert set(result['latency']) == set(['cache_lookup', 'sign', 'network', 'decode', 'build'])
+        assert result['latency']['network']['count'] == 2
+        assert len(events) == 2
+
+        text = metrics.PrometheusText()
+        assert 'yelp_requests_total 2\n' in text
+        assert 'yelp_responses_total{status="404"} 1\n' in text
+        assert 'yelp_phase_seconds_count{phase="network"} 2\n' in text
+
+        metrics.Unregister(client)
+        client.GetBusiness('b0')
+        assert metrics.AsDict()['counters']['cache_hits'] == 1
+        client.Close()
@@ -0,0 +1,94 @@
+import copy
+import json
+import pickle
+
+import yelp
+
+
+def business(i, city=u'Brooklyn'):
+    return {'id': u'b%d' % i,
+            'name': u'Business %d' % i,
+            'rating': 4.5,
+            'categories': [[u'Bars', u'bars']],
+            'location': {'city': city, 'state_code': u'NY',
+                         'coordinate': {'latitude': 40.7, 'longitude': -73.9}},
+            'reviews': [{'id': u'r%d' % i, 'rating': 5,
+                         'user': {'id': u'u%d' % i, 'name': u'User'}}]}
+
+
+class TestModels(object):
+
+
+    def test_slots(self):
+        result = yelp.SearchResultSet.NewFromJsonDict(
+            json.loads(json.dumps({'total': 2, 'businesses': [business(0), business(1)]})))
+        first, second = result.businesses
+
+        for obj in (result, first, first.location, first.reviews[0], first.reviews[0].user):
+            assert not hasattr(obj, '__dict__')
+        assert first.location.city == u'Brooklyn'
+        assert first.reviews[0].user.id == u'u0'
+
+
+    def test_pickle(self):
+        result = yelp.SearchResultSet.NewFromJsonDict({'total': 1, 'businesses': [business(0)]})
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            copy = pickle.loads(pickle.dumps(result, protocol))
+            assert copy.total == 1
+            assert copy.businesses[0].name == u'Business 0'
+            assert copy.businesses[0].location.city == u'Brooklyn'
+            assert copy.businesses[0].reviews[0].user.id == u'u0'
+
+
+    def test_interned(self):
+        first = yelp.Business.NewFromJsonDict(json.loads(json.dumps(business(0))))
+        second = yelp.Business.NewFromJsonDict(json.loads(json.dumps(business(1))))
+
+        assert first.location.city is second.location.city
+        assert first.location.state_code is second.location.state_code
+        assert first.categories[0][0] is second.categories[0][0]
+        assert first.categories == [[u'Bars', u'bars']]
+
+
+    def test_lazy(self):
+        data = {'total': 1, 'businesses': [business(0)]}
+        result = yelp.SearchResultSet.NewFromJsonDict(data, lazy=True)
+        assert result._businesses is yelp._NOT_LOADED
+
+        first = result.businesses[0]
+        assert first.name == u'Business 0'
+        assert first._location is yelp._NOT_LOADED
+        assert first._reviews is yelp._NOT_LOADED
+
+        assert first.location.city == u'Brooklyn'
+        assert first.reviews[0].user.id == u'u0'
+        assert first.location is first.location
+        assert result.businesses[0] is first
+
+
+    def test_copy_lazy(self):
+        data = {'total': 1, 'businesses': [business(0)]}
+        for copy_model in [copy.copy, copy.deepcopy] + \
+                [lambda model, protocol=protocol: pickle.loads(pickle.dumps(model, protocol))
+                 for protocol in range(pickle.HIGHEST_PROTOCOL + 1)]:
+            result = copy_model(yelp.SearchResultSet.NewFromJsonDict(data, lazy=True))
+            assert result._businesses is yelp._NOT_LOADED
+            first = copy_model(result.businesses[0])
+            assert first._location is yelp._NOT_LOADED
+            assert first.location.city == u'Brooklyn'
+            assert first.reviews[0].user.id == u'u0'
+
+
+    def test_lazy_api(self, yelp_server):
+        yelp_server.responses['/v2/business/b0'] = (200, json.dumps(business(0)))
+        client = yelp.Api(consumer_key='key',
+                          consumer_secret='secret',
+                          access_token_key='token',
+                          access_token_secret='token-secret',
+                          cache=None,
+                          lazy_models=True)
+        client.host = yelp_server.host
+
+        result = client.GetBusiness('b0')
+        assert result._location is yelp._NOT_LOADED
+        assert result.location.state_code == u'NY'
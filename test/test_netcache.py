@@ -0,0 +1,100 @@
+import json
+import time
+
+import pytest
+
+from compressedcache import CompressedCache
+from conftest import business
+from memorycache import MemoryCache, TieredCache
+from netcache import MemcachedCache, StandInServer
+
+
+@pytest.fixture
+def memcached():
+    server = StandInServer()
+    server.Start()
+    yield server
+    server.Stop()
+
+
+class TestMemcachedCache(object):
+
+
+    def test_interface(self, memcached):
+        cache = MemcachedCache([memcached.address])
+        assert cache.Get('missing') is None
+
+        cache.Set('key', 'line one\r\nEND\r\n')
+        assert cache.Get('key') == 'line one\r\nEND\r\n'
+        assert time.time() - cache.GetCachedTime('key') < 5
+        assert cache.GetIfFresh('key', 60)[0] == 'line one\r\nEND\r\n'
+        assert cache.GetIfFresh('key', 0) is None
+
+        cache.Remove('key')
+        assert cache.Get('key') is None
+        assert cache.GetStats() == {'errors': 0}
+
+
+    def test_server_ttl(self, memcached):
+        cache = MemcachedCache([memcached.address], ttl=60)
+        cache.Set('old', 'old', cached_time=time.time() - 120)
+        cache.Set('new', 'new')
+
+        assert cache.Get('old') is None
+        assert memcached.Get(cache._HashKey('old')) is None
+        assert memcached.Get(cache._HashKey('new')) is not None
+        assert 0 < memcached._values[cache._HashKey('new')][1] - time.time() <= 61
+
+
+    def test_unreachable(self, memcached):
+        address = memcached.address
+        memcached.Stop()
+        cache = MemcachedCache([address], timeout=0.5)
+        cache.Set('key', 'data')
+
+        assert cache.Get('key') is None
+        assert cache.GetStats()['errors'] == 2
+
+
+    def test_api_batch(self, yelp_server, make_client, memcached):
+        for i in range(5):
+            yelp_server.responses['/v2/business/b%d' % i] = (200, json.dumps(business('b%d' % i)))
+        workers = []
+        for _ in range(2):
+            cache = MemcachedCache([memcached.address])
+            workers.append(make_client(cache=cache, cache_timeout=30, stale_while_revalidate=10))
+        assert cache._api_ttl == 40
+
+        ids = ['b%d' % i for i in range(5)]
+        assert [result.result.id for result in workers[0].GetBusinesses(ids)] == ids
+        del memcached.commands[:]
+        assert [result.result.id for result in workers[1].GetBusinesses(ids)] == ids
+
+        assert yelp_server.request_count == 5
+        assert memcached.commands == ['get']
+        for client in workers:
+            client.Close()
+
+
+    def test_api_wrapped(self, yelp_server, make_client, memcached):
+        for i in range(3):
+            yelp_server.responses['/v2/business/b%d' % i] = (200, json.dumps(business('b%d' % i)))
+        ids = ['b0', 'b1', 'b2']
+        cache = MemcachedCache([memcached.address])
+        for wrapped in [CompressedCache(cache, min_size=0),
+                        TieredCache(MemoryCache(), CompressedCache(cache))]:
+            client = make_client(cache=wrapped, cache_timeout=30)
+            assert cache._api_ttl == 30
+            client.GetBusinesses(ids)
+            del memcached.commands[:]
+            client.InvalidateCacheKey(client.GetBusinessCacheKey('b0'))
+            # Expires on the server rather than never
+            assert 0 < memcached._values[cache._HashKey(client.GetBusinessCacheKey('b1'))][1] - \
+                time.time() <= 31
+
+            del memcached.commands[:]
+            results = client.GetBusinesses(ids)
+            assert [result.result.id for result in results] == ids
+            assert memcached.commands.count('get') <= 1
+            client.Close()
+        assert yelp_server.request_count == 5
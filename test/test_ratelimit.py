@@ -0,0 +1,75 @@
+import json
+import time
+
+import ratelimit
+from conftest import business
+
+
+class TestTokenBucket(object):
+
+
+    def test_burst_then_rate(self):
+        bucket = ratelimit.TokenBucket(rate=50, capacity=5)
+        start = time.time()
+        for _ in range(10):
+            bucket.Acquire()
+        elapsed = time.time() - start
+
+        assert 0.08 <= elapsed < 0.5
+        stats = bucket.GetStats()
+        assert stats['acquired'] == 10
+        assert stats['waits'] >= 4
+        assert stats['wait_time'] > 0
+
+
+    def test_file_bucket(self, tmpdir):
+        path = str(tmpdir.join('bucket'))
+        first = ratelimit.FileTokenBucket(path, rate=1, capacity=2)
+        second = ratelimit.FileTokenBucket(path, rate=1, capacity=2)
+
+        assert first.TryAcquire() == 0
+        assert second.TryAcquire() == 0
+        assert first.TryAcquire() > 0.5
+
+
+    def test_shared_bucket(self):
+        assert ratelimit.GetTokenBucket('consumer', 5) is ratelimit.GetTokenBucket('consumer', 5)
+
+
+class TestRetries(object):
+
+
+    def test_backoff(self, yelp_server, make_client):
+        attempts = []
+
+        def respond(query):
+            attempts.append(query)
+            if len(attempts) < 3:
+                return 503, 'unavailable'
+            return 200, json.dumps(business('b0'))
+
+        yelp_server.responses['/v2/business/b0'] = respond
+        client = make_client(rate_limiter=ratelimit.TokenBucket(rate=100))
+        client.SetRetries(3, backoff=0.01)
+
+        assert client.GetBusiness('b0').id == 'b0'
+        assert len(attempts) == 3
+        # Every attempt is signed afresh
+        assert len(set(query['oauth_nonce'] for query in attempts)) == 3
+        stats = client.GetThrottleStats()
+        assert stats['retries'] == 2
+        assert 0 <= stats['backoff_time'] <= 0.03
+
+
+    def test_give_up(self, yelp_server, make_client):
+        yelp_server.responses['/v2/business/b0'] = (429, json.dumps({'error': {'id': 'EXCEEDED_REQS'}}))
+        client = make_client()
+        client.SetRetries(2, backoff=0.001)
+
+        try:
+            client.GetBusiness('b0')
+        except Exception, error:
+            assert 'EXCEEDED_REQS' in str(error)
+        else:
+            assert False
+        assert yelp_server.request_count == 3
@@ -0,0 +1,49 @@
+import json
+
+from conftest import business
+from memorycache import MemoryCache
+from refresh import Refresher
+
+
+def serve(yelp_server, id, **fields):
+    defaults = {'location': {}, 'rating': 4.0, 'review_count': 10,
+                'is_closed': False, 'name': 'Business'}
+    defaults.update(fields)
+    yelp_server.responses['/v2/business/' + id] = (200, json.dumps(business(id, **defaults)))
+
+
+class TestRefresher(object):
+
+
+    def test_change_feed(self, yelp_server, make_client, tmpdir):
+        for id in ('a', 'b', 'c'):
+            serve(yelp_server, id)
+        client = make_client(cache=MemoryCache())
+        path = str(tmpdir.join('refresh.json'))
+        refresher = Refresher(client, state_path=path, ttl=3600)
+        refresher.Track(['a', 'b', 'c'])
+        assert list(refresher.Refresh()) == []
+        assert refresher.GetDue() == []
+
+        serve(yelp_server, 'a', rating=4.5)
+        serve(yelp_server, 'b', name='Renamed')
+        refresher = Refresher(client, state_path=path, ttl=0)
+        changes = list(refresher.Refresh())
+
+        assert [change.id for change in changes] == ['a']
+        assert changes[0].changes == {'rating': (4.0, 4.5)}
+        assert changes[0].business.rating == 4.5
+        assert changes[0].AsDict() == {'id': 'a', 'changes': {'rating': {'old': 4.0, 'new': 4.5}}}
+        assert yelp_server.request_count == 6
+        assert client.GetBusiness('a').rating == 4.5
+        client.Close()
+
+
+    def test_priority(self, make_client):
+        refresher = Refresher(make_client(cache=MemoryCache()), ttl=100)
+        refresher._entries = {'stable': [None, None, 0, 10, 0],
+                              'volatile': [None, None, 0, 10, 9],
+                              'older': [None, None, -1000, 10, 0],
+                              'fresh': [None, None, 950, 1, 1]}
+
+        assert refresher.GetDue(now=1000) == ['volatile', 'older', 'stable']
@@ -0,0 +1,67 @@
+import json
+
+from conftest import business
+from replay import Archive, FakeYelpServer, RecordingTransport, RequestKey
+
+
+class TestReplay(object):
+
+
+    def test_request_key(self):
+        assert RequestKey('GET', 'http://api.yelp.com/v2/search?term=bar&oauth_nonce=1&location=nyc') == \
+            'GET /v2/search?location=nyc&term=bar'
+
+
+    def test_record_and_replay(self, yelp_server, make_client, tmpdir):
+        yelp_server.responses['/v2/business/b0'] = (200, json.dumps(business('b0')))
+        recorder = RecordingTransport()
+        client = make_client(transport=recorder, use_gzip_compression=True)
+        assert client.GetBusiness('b0').id == 'b0'
+        client.Close()
+        path = str(tmpdir.join('fixtures.json'))
+        recorder.archive.Save(path)
+
+        server = FakeYelpServer(Archive.Load(path))
+        server.Start()
+        try:
+            client = make_client()
+            client.host = server.host
+            assert client.GetBusiness('b0').id == 'b0'
+            assert client.GetBusiness('b0').id == 'b0'
+            assert server.request_count == 2
+            client.Close()
+        finally:
+            server.Stop()
+
+
+    def test_error_injection(self, make_client):
+        server = FakeYelpServer(error_rate=1, error_status=503)
+        server.responses['/v2/business/b0'] = (200, json.dumps(business('b0')))
+        server.Start()
+        try:
+            client = make_client(max_retries=2)
+            client.host = server.host
+            client.SetRetries(2, backoff=0.001)
+            try:
+                client.GetBusiness('b0')
+            except Exception, error:
+                assert 'INJECTED_ERROR' in str(error)
+            else:
+                assert False, 'expected an error'
+            assert server.request_count == 3
+
+            server.error_rate = 0
+            assert client.GetBusiness('b0').id == 'b0'
+            client.Close()
+        finally:
+            server.Stop()
+
+
+    def test_request_log(self):
+        server = FakeYelpServer(request_log_size=2)
+        server.responses['/v2/business/b0'] = (200, json.dumps(business('b0')))
+        for query in ('a', 'b', 'c'):
+            server.Respond('GET', '/v2/business/b0?' + query)
+        assert list(server.requests) == ['/v2/business/b0?b', '/v2/business/b0?c']
+        assert server.request_count == 3
+        server.server_close()
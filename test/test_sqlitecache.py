@@ -0,0 +1,72 @@
+import os
+import threading
+import time
+
+from memorycache import MemoryCache, TieredCache
+from sqlitecache import SqliteCache
+
+
+class TestSqliteCache(object):
+
+
+    def test_interface(self, tmpdir):
+        cache = SqliteCache(str(tmpdir.join('cache.sqlite')))
+        assert cache.Get('missing') is None
+        assert cache.GetCachedTime('missing') is None
+
+        cache.Set('key', '\x1f\x8b\x00binary')
+        assert cache.Get('key') == '\x1f\x8b\x00binary'
+        assert time.time() - cache.GetCachedTime('key') < 5
+        assert cache.GetIfFresh('key', 60)[0] == '\x1f\x8b\x00binary'
+        assert cache.GetIfFresh('key', 0) is None
+
+        cache.Set('key', 'replaced')
+        assert cache.Get('key') == 'replaced'
+        cache.Remove('key')
+        assert cache.Get('key') is None
+        assert len(cache) == 0
+
+
+    def test_expire(self, tmpdir):
+        cache = SqliteCache(str(tmpdir.join('cache.sqlite')))
+        cache.Set('old', 'old', cached_time=time.time() - 120)
+        cache.Set('new', 'new')
+
+        assert cache.Expire(60) == 1
+        assert cache.Get('old') is None
+        assert cache.Get('new') == 'new'
+
+
+    def test_shared(self, tmpdir):
+        path = str(tmpdir.join('cache.sqlite'))
+        cache = SqliteCache(path)
+
+        def write(n):
+            for i in range(50):
+                cache.Set('%d-%d' % (n, i), 'x' * i)
+        threads = [threading.Thread(target=write, args=(n,)) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        pid = os.fork()
+        if pid == 0:
+            SqliteCache(path).Set('child', 'child')
+            cache.Set('forked', 'forked')
+            os._exit(0)
+        os.waitpid(pid, 0)
+
+        assert len(cache) == 202
+        assert cache.Get('child') == 'child'
+        assert cache.Get('forked') == 'forked'
+
+
+    def test_tiered(self, tmpdir):
+        back = SqliteCache(str(tmpdir.join('cache.sqlite')))
+        back.Set('key', 'data', cached_time=time.time() - 30)
+        cache = TieredCache(MemoryCache(), back)
+
+        data, age = cache.GetIfFresh('key', 60)
+        assert data == 'data'
+        assert age >= 30
@@ -0,0 +1,66 @@
+import json
+
+import pytest
+from conftest import business
+from filecache import FileCache
+from transport import PooledTransport
+
+
+BUSINESS = business('post-no-bills-brooklyn', name='Post No Bills')
+
+
+class TestPooledTransport(object):
+
+
+    def test_keep_alive(self, yelp_server):
+        yelp_server.responses['/v2/business/a'] = (200, json.dumps(BUSINESS))
+        transport = PooledTransport()
+
+        for _ in range(3):
+            response = transport.Fetch('http://' + yelp_server.host + '/v2/business/a')
+            assert response.status == 200
+            assert json.loads(response.body)['name'] == 'Post No Bills'
+
+        assert yelp_server.request_count == 3
+        assert yelp_server.connections == 1
+
+
+    def test_idle_timeout(self, yelp_server):
+        yelp_server.responses['/v2/business/a'] = (200, json.dumps(BUSINESS))
+        transport = PooledTransport(idle_timeout=0)
+
+        transport.Fetch('http://' + yelp_server.host + '/v2/business/a')
+        transport.Fetch('http://' + yelp_server.host + '/v2/business/a')
+
+        assert yelp_server.connections == 2
+
+
+    def test_gzip(self, yelp_server):
+        yelp_server.responses['/v2/business/a'] = (200, json.dumps(BUSINESS))
+        transport = PooledTransport()
+
+        response = transport.Fetch('http://' + yelp_server.host + '/v2/business/a',
+                                   headers={'Accept-Encoding': 'gzip'})
+        assert response.headers['content-encoding'] == 'gzip'
+        assert json.loads(response.body)['id'] == 'post-no-bills-brooklyn'
+
+
+    def test_api(self, yelp_server, make_client, tmpdir):
+        yelp_server.responses['/v2/business/post-no-bills-brooklyn'] = (200, json.dumps(BUSINESS))
+        client = make_client(cache=FileCache(str(tmpdir)), use_gzip_compression=True)
+
+        business = client.GetBusiness('post-no-bills-brooklyn')
+        assert business.name == 'Post No Bills'
+        business = client.GetBusiness('post-no-bills-brooklyn')
+        assert business.location.city == 'Brooklyn'
+        assert yelp_server.request_count == 1
+        assert 'oauth_signature=' in yelp_server.requests[0]
+
+
+    def test_api_error_not_cached(self, yelp_server, make_client, tmpdir):
+        client = make_client(cache=FileCache(str(tmpdir)))
+
+        for _ in range(2):
+            with pytest.raises(Exception):
+                client.GetBusiness('missing')
+        assert yelp_server.request_count == 2
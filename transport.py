@@ -0,0 +1,221 @@
+'''HTTP transports used by yelp.Api to talk to the Yelp API.'''
+
+import httplib
+import socket
+import threading
+import time
+import urlparse
+import zlib
+
+
+# Number of idle keep-alive connections kept per host, enough for one per
+# yelp.Api batch worker thread.
+DEFAULT_POOL_SIZE = 8
+
+# Idle connections older than this many seconds are discarded instead of
+# being reused, since the server has most likely closed its end already.
+DEFAULT_IDLE_TIMEOUT = 30
+
+# Socket timeout, in seconds, for connect and read.
+DEFAULT_TIMEOUT = 30
+
+
+class TransportError(Exception):
+    '''Base exception class for transport related errors'''
+
+
+class Response(object):
+    '''The outcome of a single HTTP request.
+
+    Attributes:
+      status:
+        The integer HTTP status code.
+      headers:
+        A dict of lower-cased header names to values.
+      body:
+        The response body, already decompressed.
+      gzipped_body:
+        The body as received if the server gzipped it, otherwise None.
+    '''
+
+    def __init__(self, status=None, headers=None, body=None, gzipped_body=None):
+        self.status = status
+        self.headers = headers or {}
+        self.body = body
+        self.gzipped_body = gzipped_body
+
+
+class HTTPConnectionPool(object):
+    '''A thread-safe pool of keep-alive connections to a single host.'''
+
+    def __init__(self,
+                 host,
+                 port=None,
+                 scheme='http',
+                 maxsize=DEFAULT_POOL_SIZE,
+                 idle_timeout=DEFAULT_IDLE_TIMEOUT,
+                 timeout=DEFAULT_TIMEOUT):
+        if scheme == 'https':
+            self._connection_class = httplib.HTTPSConnection
+        elif scheme == 'http':
+            self._connection_class = httplib.HTTPConnection
+        else:
+            raise TransportError('Unsupported url scheme %s' % scheme)
+        self.host = host
+        self.port = port
+        self.scheme = scheme
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def Request(self, method, path, body=None, headers=None):
+        '''Issue a request, reusing an idle connection when one is available.
+
+        A request that fails on a reused connection is retried once on a
+        fresh connection, since the server may have closed it while idle.
+
+        Returns:
+          A tuple of (status, headers, body) where body is read in full.
+        '''
+        conn, reused = self._GetConnection()
+        try:
+            response = self._Send(conn, method, path, body, headers)
+        except (httplib.HTTPException, socket.error):
+            conn.close()
+            if not reused:
+                raise
+            conn = self._NewConnection()
+            try:
+                response = self._Send(conn, method, path, body, headers)
+            except:
+                conn.close()
+                raise
+        except:
+            conn.close()
+            raise
+
+        status, response_headers, data, will_close = response
+        if will_close:
+            conn.close()
+        else:
+            self._PutConnection(conn)
+        return status, response_headers, data
+
+    def Close(self):
+        '''Close every idle connection held by the pool.'''
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            conn.close()
+
+    def _Send(self, conn, method, path, body, headers):
+        conn.request(method, path, body, headers or {})
+        response = conn.getresponse()
+        data = response.read()
+        response_headers = dict((name.lower(), value)
+                                for name, value in response.getheaders())
+        return response.status, response_headers, data, response.will_close
+
+    def _GetConnection(self):
+        now = time.time()
+        with self._lock:
+            while self._idle:
+                conn, last_used = self._idle.pop()
+                if now - last_used < self.idle_timeout:
+                    return conn, True
+                conn.close()
+        return self._NewConnection(), False
+
+    def _PutConnection(self, conn):
+        with self._lock:
+            if len(self._idle) < self.maxsize:
+                self._idle.append((conn, time.time()))
+                return
+        conn.close()
+
+    def _NewConnection(self):
+        return self._connection_class(self.host, self.port,
+                                      timeout=self.timeout)
+
+
+class PooledTransport(object):
+    '''Fetches urls over per-host pools of persistent connections.
+
+    This is the default transport of yelp.Api.  Anything with a compatible
+    Fetch method may be used in its place, e.g. to direct requests to a
+    local stand-in server in tests.
+    '''
+
+    def __init__(self,
+                 pool_size=DEFAULT_POOL_SIZE,
+                 idle_timeout=DEFAULT_IDLE_TIMEOUT,
+                 timeout=DEFAULT_TIMEOUT):
+        '''
+        Args:
+          pool_size:
+            The maximum number of idle connections kept per host.
+          idle_timeout:
+            Time, in seconds, an idle connection may be kept for reuse.
+          timeout:
+            Socket timeout, in seconds.
+        '''
+        self.pool_size = pool_size
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def Fetch(self, url, post_data=None, headers=None):
+        '''Fetch a URL.
+
+        Args:
+          url:
+            The absolute URL to retrieve, including any query string.
+          post_data:
+            An already encoded request body.  If set, POST will be used.
+          headers:
+            A dict of extra request headers.
+
+        Returns:
+          A Response instance.
+        '''
+        parts = urlparse.urlsplit(url)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        if post_data is None:
+            method = 'GET'
+        else:
+            method = 'POST'
+        pool = self._GetPool(parts.scheme, parts.hostname, parts.port)
+        status, response_headers, body = pool.Request(method, path,
+                                                      post_data, headers)
+        gzipped_body = None
+        if response_headers.get('content-encoding') == 'gzip':
+            gzipped_body = body
+            body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+        return Response(status=status, headers=response_headers, body=body,
+                        gzipped_body=gzipped_body)
+
+    def Close(self):
+        '''Close every idle connection in every pool.'''
+        with self._lock:
+            pools, self._pools = self._pools.values(), {}
+        for pool in pools:
+            pool.Close()
+
+    def _GetPool(self, scheme, host, port):
+        pool_key = (scheme, host, port)
+        with self._lock:
+            pool = self._pools.get(pool_key)
+            if pool is None:
+                pool = HTTPConnectionPool(host,
+                                          port=port,
+                                          scheme=scheme,
+                                          maxsize=self.pool_size,
+                                          idle_timeout=self.idle_timeout,
+                                          timeout=self.timeout)
+                self._pools[pool_key] = pool
+        return pool
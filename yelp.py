@@ -16,10 +16,16 @@ __status__ = "Development"
 
 import oauth2 as oauth
 import json
+import random
+import sys
 import urllib
-import urllib2
+import threading
 import time
+from multiprocessing.pool import ThreadPool
+import columns
 from filecache import FileCache
+from memorycache import MemoryCache
+from transport import PooledTransport
 
 
 # A singleton representing a lazily instantiated FileCache.
@@ -28,6 +34,50 @@ DEFAULT_CACHE = object()
 # cache for 1 minute
 DEFAULT_CACHE_TIMEOUT = 60
 
+# number of requests GetBusinesses and SearchMany run in parallel
+DEFAULT_BATCH_CONCURRENCY = 8
+
+# decimal places search coordinates are rounded to, about 10cm
+DEFAULT_COORDINATE_PRECISION = 6
+
+# formats GetBusiness and Search can return responses in
+RESPONSE_MODEL = 'model'
+RESPONSE_DICT = 'dict'
+RESPONSE_RAW = 'raw'
+
+# the most businesses the API returns per search request
+SEARCH_PAGE_SIZE = 20
+
+# the API does not page past this many results for any one search
+SEARCH_RESULT_CAP = 1000
+
+# times a request answered with a 429 or 5xx status is retried
+DEFAULT_MAX_RETRIES = 3
+
+# base and maximum delay, in seconds, between retries
+DEFAULT_RETRY_BACKOFF = 0.5
+DEFAULT_MAX_RETRY_BACKOFF = 30
+
+# Events reported to hooks registered with Api.AddHook
+EVENT_BEFORE_REQUEST = 'before_request'
+EVENT_AFTER_RESPONSE = 'after_response'
+EVENT_CACHE_HIT = 'cache_hit'
+EVENT_CACHE_MISS = 'cache_miss'
+EVENT_ERROR = 'error'
+EVENT_PHASE = 'phase'
+EVENTS = (EVENT_BEFORE_REQUEST, EVENT_AFTER_RESPONSE, EVENT_CACHE_HIT,
+          EVENT_CACHE_MISS, EVENT_ERROR, EVENT_PHASE)
+
+# Phases timed through EVENT_PHASE
+PHASE_CACHE_LOOKUP = 'cache_lookup'
+PHASE_SIGN = 'sign'
+PHASE_NETWORK = 'network'
+PHASE_DECODE = 'decode'
+PHASE_BUILD = 'build'
+
+# search parameters holding comma separated coordinates
+COORDINATE_PARAMETERS = ('ll', 'cll', 'bounds')
+
 
 def clean_url_component(s):
     if isinstance(s, unicode):
@@ -41,6 +91,111 @@ def clean_url_component(s):
     return s
 
 
+def canonical_search_params(params, coordinate_precision=DEFAULT_COORDINATE_PRECISION):
+    '''Normalize search parameters so equivalent searches share a cache key.
+
+    Parameters are sorted by name and parameters set to None are dropped.
+    String values are utf-8 encoded with runs of whitespace collapsed, and
+    location is lower-cased, non-ASCII letters included.  Booleans become
+    "true"/"false", and floats holding whole numbers are written like ints.
+    Other lists and tuples, e.g. of categories for category_filter, are
+    joined with commas.  Coordinates in ll, cll and bounds, given either as strings or
+    as sequences, are rounded to coordinate_precision decimal places unless
+    it is None.
+
+    Returns:
+      A sorted list of (name, value) string pairs, ready for urlencode.
+    '''
+    canonical = []
+    for name in sorted(params):
+        value = params[name]
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            value = 'true' if value else 'false'
+        elif name in COORDINATE_PARAMETERS:
+            value = _canonical_coordinates(value, coordinate_precision)
+        elif isinstance(value, (float, int, long)):
+            value = _canonical_number(value)
+        else:
+            if isinstance(value, (list, tuple)):
+                value = ','.join(item.encode('utf-8') if isinstance(item, unicode)
+                                 else _canonical_number(item) for item in value)
+            if name == 'location':
+                # str.lower() only folds ASCII letters
+                if not isinstance(value, unicode):
+                    value = value.decode('utf-8', 'replace')
+                value = value.lower()
+            if isinstance(value, unicode):
+                value = value.encode('utf-8')
+            value = ' '.join(value.split())
+        canonical.append((name, value))
+    return canonical
+
+
+def _canonical_number(value):
+    # 1000.0 and 1000 are the same radius_filter
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+class _NotLoaded(object):
+    '''The type of _NOT_LOADED.  Copies and unpickled instances are the
+    singleton itself, so identity checks against it keep working.'''
+
+    __slots__ = ()
+
+    def __reduce__(self):
+        return '_NOT_LOADED'
+
+    def __repr__(self):
+        return '_NOT_LOADED'
+
+
+# A singleton marking a nested model that has not been built from its
+# decoded dict yet.
+_NOT_LOADED = _NotLoaded()
+
+# Strings repeated across many businesses, e.g. city and category names,
+# mapped to a single shared instance.
+_interned = {}
+
+
+def _intern(value):
+    '''Return a shared instance of a string, the builtin intern() only
+    accepting str.  Other values are returned unchanged.'''
+    if isinstance(value, basestring):
+        return _interned.setdefault(value, value)
+    return value
+
+
+def _intern_categories(categories):
+    # categories is a list of [name, alias] pairs
+    if not categories:
+        return categories
+    return [map(_intern, category) for category in categories]
+
+
+def _canonical_coordinates(value, precision):
+    if not isinstance(value, basestring):
+        # e.g. (lat, lng) or ((sw_lat, sw_lng), (ne_lat, ne_lng)) for bounds
+        if value and not isinstance(value[0], (float, int, long)):
+            return '|'.join(_canonical_coordinates(point, precision) for point in value)
+        value = ','.join(str(number) for number in value)
+    points = []
+    for point in value.replace(' ', '').split('|'):
+        numbers = []
+        for number in point.split(','):
+            if precision is not None and number:
+                number = ('%.*f' % (precision, float(number))).rstrip('0').rstrip('.')
+                if number == '-0':
+                    number = '0'
+            numbers.append(number)
+        points.append(','.join(numbers))
+    return '|'.join(points)
+
+
 class Api(object):
     '''
     A python interface to the yelp API v2
@@ -52,7 +207,18 @@ class Api(object):
                  access_token_key=None,
                  access_token_secret=None,
                  cache=DEFAULT_CACHE,
-                 cache_timeout=DEFAULT_CACHE_TIMEOUT
+                 cache_timeout=DEFAULT_CACHE_TIMEOUT,
+                 transport=None,
+                 use_gzip_compression=False,
+                 batch_concurrency=DEFAULT_BATCH_CONCURRENCY,
+                 stale_while_revalidate=0,
+                 coordinate_precision=DEFAULT_COORDINATE_PRECISION,
+                 lazy_models=False,
+                 decoder=None,
+                 response_format=RESPONSE_MODEL,
+                 decoded_cache_size=0,
+                 rate_limiter=None,
+                 max_retries=DEFAULT_MAX_RETRIES
                  ):
 
         self.consumer_key = consumer_key
@@ -60,16 +226,32 @@ class Api(object):
         self.access_token_key = access_token_key
         self.access_token_secret = access_token_secret
         self.host = "api.yelp.com"
-        self.SetCache(cache)
+        self._hooks = {}
         self.SetCacheTimeout(cache_timeout)
+        self.SetStaleWhileRevalidate(stale_while_revalidate)
+        self.SetCache(cache)
+        self.SetCoordinatePrecision(coordinate_precision)
+        self.SetLazyModels(lazy_models)
+        self.SetDecoder(decoder)
+        self.SetResponseFormat(response_format)
+        self.SetDecodedCacheSize(decoded_cache_size)
+        self.SetRateLimiter(rate_limiter)
+        self.SetRetries(max_retries)
+        self._throttle_lock = threading.Lock()
+        self._throttle_stats = {'retries': 0,
+                                'backoff_time': 0.0,
+                                'rate_limit_wait_time': 0.0}
+        self.SetTransport(transport)
+        self._use_gzip = use_gzip_compression
+        self._batch_pool = None
+        self._batch_lock = threading.Lock()
+        self.SetBatchConcurrency(batch_concurrency)
+        self._in_flight_calls = {}
+        self._revalidating = set()
+        self._in_flight_lock = threading.Lock()
 
-        if consumer_key is not None \
-            and consumer_secret is not None \
-            and access_token_key is not None \
-            and access_token_secret is not None:
-
-            self._signature_method_plaintext = oauth.SignatureMethod_PLAINTEXT()
-            self._signature_method_hmac_sha1 = oauth.SignatureMethod_HMAC_SHA1()
+        self._signature_method_plaintext = oauth.SignatureMethod_PLAINTEXT()
+        self._signature_method_hmac_sha1 = oauth.SignatureMethod_HMAC_SHA1()
 
         self._oauth_token = oauth.Token(key=access_token_key, secret=access_token_secret)
         self._oauth_consumer = oauth.Consumer(key=consumer_key, secret=consumer_secret)
@@ -82,6 +264,165 @@ class Api(object):
             Time, in seconds, that responses should be reused.
         '''
         self._cache_timeout = cache_timeout
+        self._SyncCacheTimeout()
+
+    def SetStaleWhileRevalidate(self, stale_while_revalidate):
+        '''Serve expired responses while they are refreshed in the background.
+
+        Args:
+          stale_while_revalidate:
+            Time, in seconds past the cache timeout, during which an expired
+            response is still returned immediately while a single background
+            request refreshes it.  0 disables this.
+        '''
+        self._stale_while_revalidate = stale_while_revalidate
+        self._SyncCacheTimeout()
+
+    def SetCoordinatePrecision(self, coordinate_precision):
+        '''Override the rounding of search coordinates.
+
+        Args:
+          coordinate_precision:
+            The number of decimal places ll, cll and bounds coordinates
+            are rounded to, or None to leave them untouched.
+        '''
+        self._coordinate_precision = coordinate_precision
+
+    def SetLazyModels(self, lazy_models):
+        '''Build nested models only when they are first read.
+
+        Args:
+          lazy_models:
+            If True, a Business only builds its Location and Reviews, and a
+            SearchResultSet its Businesses, on first access.
+        '''
+        self._lazy_models = lazy_models
+
+    def SetDecoder(self, decoder):
+        '''Override the JSON decoder.
+
+        Args:
+          decoder:
+            A function taking a response body and returning the decoded
+            object, e.g. ujson.loads.  If None, json.loads is used.
+        '''
+        if decoder is None:
+            self._decoder = json.loads
+        else:
+            self._decoder = decoder
+
+    def SetResponseFormat(self, response_format):
+        '''Choose what GetBusiness, Search and the batch calls return.
+
+        Args:
+          response_format:
+            RESPONSE_MODEL for Business and SearchResultSet objects,
+            RESPONSE_DICT for the decoded response, or RESPONSE_RAW for the
+            undecoded response body.  Raw bodies are not checked for API
+            errors.
+        '''
+        if response_format not in (RESPONSE_MODEL, RESPONSE_DICT, RESPONSE_RAW):
+            raise ValueError('Unknown response format %r' % (response_format,))
+        self._response_format = response_format
+
+    def SetDecodedCacheSize(self, decoded_cache_size):
+        '''Keep recently decoded responses so cache hits skip decoding.
+
+        Args:
+          decoded_cache_size:
+            The number of decoded responses kept in memory, keyed like the
+            cache entries they were decoded from.  0 disables this.  Decoded
+            objects are shared between calls and must not be modified.
+        '''
+        if decoded_cache_size:
+            self._decoded_cache = MemoryCache(max_entries=decoded_cache_size)
+        else:
+            self._decoded_cache = None
+
+    def SetRateLimiter(self, rate_limiter):
+        '''Throttle requests sent to the API.
+
+        Args:
+          rate_limiter:
+            An instance that supports the same API as ratelimit.TokenBucket,
+            e.g. ratelimit.GetTokenBucket(consumer_key, 5) to share a limit
+            between threads, or a ratelimit.FileTokenBucket to share it
+            between processes.  None disables rate limiting.
+        '''
+        self._rate_limiter = rate_limiter
+
+    def SetRetries(self,
+                   max_retries,
+                   backoff=DEFAULT_RETRY_BACKOFF,
+                   max_backoff=DEFAULT_MAX_RETRY_BACKOFF):
+        '''Override how throttled and failed requests are retried.
+
+        Requests answered with a 429 or 5xx status are retried after a
+        random delay of up to backoff * 2 ** attempt seconds, or after the
+        delay asked for by a Retry-After header.
+
+        Args:
+          max_retries:
+            The number of times a request is retried.  0 disables retries.
+          backoff:
+            The base delay, in seconds.
+          max_backoff:
+            The longest delay, in seconds.
+        '''
+        self._max_retries = max_retries
+        self._retry_backoff = backoff
+        self._max_retry_backoff = max_backoff
+
+    def AddHook(self, event, hook):
+        '''Call hook on every occurrence of event.
+
+        Args:
+          event:
+            One of EVENTS:
+              EVENT_BEFORE_REQUEST: a request is about to be sent
+              EVENT_AFTER_RESPONSE: a response arrived, with its status
+              EVENT_CACHE_HIT, EVENT_CACHE_MISS: the outcome of a cache lookup
+              EVENT_ERROR: a request failed, or returned an API error
+              EVENT_PHASE: a phase of a call, one of the PHASE_* names, ended
+          hook:
+            A function called as hook(event, data), where data is a dict
+            holding, as applicable, the url, key, status, attempt, error,
+            phase and its duration in seconds.  Hooks run in the thread
+            making the call and must be quick and thread-safe.
+
+        With no hooks registered, calls are not timed at all.
+        '''
+        if event not in EVENTS:
+            raise ValueError('Unknown event %r' % (event,))
+        with self._in_flight_lock:
+            hooks = dict(self._hooks)
+            hooks[event] = hooks.get(event, ()) + (hook,)
+            # Replaced rather than mutated, so _Emit needs no lock
+            self._hooks = hooks
+
+    def RemoveHook(self, event, hook):
+        '''Stop calling a hook added with AddHook.'''
+        with self._in_flight_lock:
+            hooks = dict(self._hooks)
+            remaining = tuple(other for other in hooks.get(event, ()) if other != hook)
+            if remaining:
+                hooks[event] = remaining
+            else:
+                hooks.pop(event, None)
+            self._hooks = hooks
+
+    def _Emit(self, event, **data):
+        for hook in self._hooks.get(event, ()):
+            hook(event, data)
+
+    def _EmitPhase(self, phase, start, **data):
+        self._Emit(EVENT_PHASE, phase=phase, seconds=time.time() - start, **data)
+
+    def GetThrottleStats(self):
+        '''Return a dict with the number of retries and the time, in
+        seconds, spent backing off and waiting on the rate limiter.'''
+        with self._throttle_lock:
+            return dict(self._throttle_stats)
 
     def SetCache(self, cache):
         '''Override the default cache.  Set to None to prevent caching.
@@ -95,16 +436,52 @@ class Api(object):
             self._cache = FileCache()
         else:
             self._cache = cache
+        self._SyncCacheTimeout()
 
-    def GetBusiness(self, id):
-        id = clean_url_component(id)
-        url = "http://" + self.host + "/v2/business/" + id
+    def _SyncCacheTimeout(self):
+        # Caches that expire entries themselves, like MemcachedCache, must
+        # keep them for as long as they may still be served
+        set_cache_timeout = getattr(getattr(self, '_cache', None), 'SetCacheTimeout', None)
+        if set_cache_timeout is not None and hasattr(self, '_stale_while_revalidate'):
+            set_cache_timeout(self._cache_timeout + self._stale_while_revalidate)
+
+    def SetTransport(self, transport):
+        '''Override the default transport.
+
+        Args:
+          transport:
+            An instance that supports the same API as the PooledTransport.
+            If None, a new PooledTransport is used.
+        '''
+        if transport is None:
+            self._transport = PooledTransport()
+        else:
+            self._transport = transport
 
+    def SetBatchConcurrency(self, batch_concurrency):
+        '''Override the number of requests batch calls run in parallel.
+
+        Args:
+          batch_concurrency:
+            The number of worker threads used by GetBusinesses and SearchMany.
+        '''
+        self._batch_concurrency = batch_concurrency
+        if self._batch_pool is not None:
+            self._batch_pool.close()
+            self._batch_pool = None
+
+    def Close(self):
+        '''Release the batch worker threads and pooled connections.'''
+        if self._batch_pool is not None:
+            self._batch_pool.close()
+            self._batch_pool = None
+        if hasattr(self._transport, 'Close'):
+            self._transport.Close()
+
+    def GetBusiness(self, id):
+        url = self._GetBusinessUrl(id)
         response = self._FetchUrl(url=url)
-        response = json.loads(response)
-        if "error" in response:
-            raise Exception(response["error"])
-        return Business.NewFromJsonDict(response)
+        return self._ParseBusiness(response, self._GetCacheKey(url))
 
     def Search(self,
                #term=None,
@@ -117,14 +494,298 @@ class Api(object):
                #location=None,
                **kwargs):
 
-        if not kwargs.get('location'):
-            raise Exception('Location parameter is required when searching. e.g. client.Search(term="restaurant", location="detroit")')
+        url = self._GetSearchUrl(kwargs)
+        response = self._FetchUrl(url=url)
+        return self._ParseSearch(response, self._GetCacheKey(url))
+
+    def IterSearch(self, **kwargs):
+        '''Lazily yield every Business matching a search, across pages.
+
+        Takes the same arguments as Search.  limit sets the page size and
+        offset the first result.  While the caller consumes one page the
+        next one is fetched on the batch pool, so at most two pages are held
+        in memory.  Iteration stops at the search total or at
+        SEARCH_RESULT_CAP, the most results the API will page through.
+
+        Unless the response format is RESPONSE_MODEL, the decoded business
+        dicts are yielded instead of Business objects.
+        '''
+        limit = min(int(kwargs.pop('limit', SEARCH_PAGE_SIZE)), SEARCH_PAGE_SIZE)
+        offset = int(kwargs.pop('offset', 0))
+        if offset >= SEARCH_RESULT_CAP:
+            return
+
+        page = self._SearchPage(dict(kwargs,
+                                     offset=offset,
+                                     limit=min(limit, SEARCH_RESULT_CAP - offset)))
+        while True:
+            businesses = page.get('businesses', [])
+            end = min(page.get('total', 0), SEARCH_RESULT_CAP)
+            offset += len(businesses)
+            next_page = None
+            if businesses and offset < end:
+                next_page = self._GetBatchPool().apply_async(
+                    self._SearchPage, (dict(kwargs,
+                                            offset=offset,
+                                            limit=min(limit, end - offset)),))
+            for business in businesses:
+                if self._response_format == RESPONSE_MODEL:
+                    business = Business.NewFromJsonDict(business, lazy=self._lazy_models)
+                yield business
+            if next_page is None:
+                return
+            page = next_page.get()
+
+    def GetBusinesses(self, ids, as_completed=False, no_cache=False):
+        '''Fetch many businesses concurrently.
+
+        Cached businesses are served from the calling thread; only cache
+        misses are handed to the worker threads.  A failure fetching one
+        business is reported on its BatchResult and does not abort the batch.
 
-        response = self._FetchUrl(url="http://" + self.host + '/v2/search?' +urllib.urlencode(kwargs))
-        response = json.loads(response)
-        if "error" in response:
-            raise Exception(response["error"])
-        return SearchResultSet.NewFromJsonDict(response)
+        Args:
+          ids:
+            An iterable of business ids.
+          as_completed:
+            If True, return an iterator yielding results as they complete
+            instead of a list in input order.
+          no_cache:
+            If True, fetch every business, ignoring but still updating the
+            cache.
+
+        Returns:
+          A list, or iterator, of BatchResult instances whose result is a
+          Business.
+        '''
+        return self._Batch(ids, self._GetBusinessUrl, self._ParseBusiness,
+                           as_completed, no_cache)
+
+    def SearchMany(self, queries, as_completed=False):
+        '''Run many searches concurrently.
+
+        Args:
+          queries:
+            An iterable of dicts, each holding the keyword arguments of
+            one Search call.
+          as_completed:
+            If True, return an iterator yielding results as they complete
+            instead of a list in input order.
+
+        Returns:
+          A list, or iterator, of BatchResult instances whose result is a
+          SearchResultSet.
+        '''
+        return self._Batch(queries, self._GetSearchUrl, self._ParseSearch,
+                           as_completed)
+
+    def GetBusinessCacheKey(self, id):
+        '''Return the cache key GetBusiness(id) reads and writes.'''
+        return self._GetCacheKey(self._GetBusinessUrl(id))
+
+    def GetSearchCacheKey(self, **kwargs):
+        '''Return the cache key Search(**kwargs) reads and writes.
+
+        Searches whose parameters only differ in order, whitespace, the case
+        of location or coordinate digits beyond the configured precision
+        share a key, and a single upstream request.
+        '''
+        return self._GetCacheKey(self._GetSearchUrl(kwargs))
+
+    def InvalidateCacheKey(self, key):
+        '''Remove the response cached under key, e.g. from GetSearchCacheKey.'''
+        if self._cache is not None:
+            self._cache.Remove(key)
+
+    def _GetBusinessUrl(self, id):
+        id = clean_url_component(id.strip())
+        return "http://" + self.host + "/v2/business/" + id
+
+    def _GetSearchUrl(self, kwargs):
+        if not (kwargs.get('location') or kwargs.get('ll') or kwargs.get('bounds')):
+            raise Exception('Location parameter is required when searching, unless ll or bounds is given. e.g. client.Search(term="restaurant", location="detroit")')
+
+        params = canonical_search_params(kwargs, self._coordinate_precision)
+        return "http://" + self.host + '/v2/search?' + urllib.urlencode(params)
+
+    def _SearchPage(self, kwargs):
+        '''Return the decoded response of a search, whatever the format.'''
+        url = self._GetSearchUrl(kwargs)
+        response = self._FetchUrl(url=url)
+        return self._Decode(response, self._GetCacheKey(url))
+
+    def _ParseBusiness(self, response, key=None):
+        return self._Parse(response, key, Business.NewFromJsonDict)
+
+    def _ParseSearch(self, response, key=None):
+        return self._Parse(response, key, SearchResultSet.NewFromJsonDict)
+
+    def _Parse(self, response, key, new_from_json_dict):
+        if self._response_format == RESPONSE_RAW:
+            return response
+        response = self._Decode(response, key)
+        if self._response_format == RESPONSE_DICT:
+            return response
+        if not self._hooks:
+            return new_from_json_dict(response, lazy=self._lazy_models)
+        start = time.time()
+        result = new_from_json_dict(response, lazy=self._lazy_models)
+        self._EmitPhase(PHASE_BUILD, start, key=key)
+        return result
+
+    def _Decode(self, response, key=None):
+        '''Decode a response body, raising if it holds an API error.
+
+        When the decoded cache is enabled and key names the cache entry the
+        body came from, decoding the same body again is skipped.
+        '''
+        decoded = None
+        if key is not None and self._decoded_cache is not None:
+            entry = self._decoded_cache.Get(key)
+            if entry is not None and (entry[0] is response or entry[0] == response):
+                decoded = entry[1]
+        if decoded is None:
+            if self._hooks:
+                start = time.time()
+                decoded = self._decoder(response)
+                self._EmitPhase(PHASE_DECODE, start, key=key)
+                if "error" in decoded:
+                    self._Emit(EVENT_ERROR, key=key, error=decoded["error"])
+            else:
+                decoded = self._decoder(response)
+            if "error" in decoded:
+                raise Exception(decoded["error"])
+            if key is not None and self._decoded_cache is not None:
+                self._decoded_cache.Set(key, (response, decoded))
+        return decoded
+
+    def _Batch(self, requests, get_url, parse, as_completed, no_cache=False):
+        results = self._IterBatch(requests, get_url, parse, no_cache)
+        if as_completed:
+            return results
+        return sorted(results, key=lambda result: result.index)
+
+    def _IterBatch(self, requests, get_url, parse, no_cache=False):
+        lookups = []
+        for index, request in enumerate(requests):
+            result = BatchResult(index=index, request=request)
+            try:
+                url = get_url(request)
+            except Exception, error:
+                result.error = error
+                yield result
+                continue
+            lookups.append((result, url, self._GetCacheKey(url)))
+
+        misses = []
+        if no_cache:
+            responses = [None] * len(lookups)
+        elif self._hooks:
+            start = time.time()
+            responses = self._GetCachedResponses([(key, url) for _, url, key in lookups])
+            self._EmitPhase(PHASE_CACHE_LOOKUP, start, keys=len(lookups))
+            for (_, url, key), response in zip(lookups, responses):
+                if response is None:
+                    self._Emit(EVENT_CACHE_MISS, url=url, key=key)
+                else:
+                    self._Emit(EVENT_CACHE_HIT, url=url, key=key)
+        else:
+            responses = self._GetCachedResponses([(key, url) for _, url, key in lookups])
+        for (result, url, key), response in zip(lookups, responses):
+            if response is None:
+                misses.append((result, url, key, parse))
+                continue
+            try:
+                result.result = parse(response, key)
+            except Exception, error:
+                result.error = error
+            yield result
+
+        if misses:
+            for result in self._GetBatchPool().imap_unordered(self._FetchBatchItem, misses):
+                yield result
+
+    def _FetchBatchItem(self, item):
+        result, url, key, parse = item
+        try:
+            result.result = parse(self._FetchUrl(url=url, no_cache=True), key)
+        except Exception, error:
+            result.error = error
+        return result
+
+    def _GetBatchPool(self):
+        with self._batch_lock:
+            if self._batch_pool is None:
+                self._batch_pool = ThreadPool(self._batch_concurrency)
+            return self._batch_pool
+
+    def _SignUrl(self, url, http_method="GET"):
+        '''Return url with the OAuth parameters and signature appended.'''
+        oauth_request = oauth.Request(http_method, url, {})
+        oauth_request.update({'oauth_nonce': oauth.generate_nonce(),
+                              'oauth_timestamp': oauth.generate_timestamp(),
+                              'oauth_token': self.access_token_key,
+                              'oauth_consumer_key': self.consumer_key})
+
+        oauth_request.sign_request(self._signature_method_hmac_sha1, self._oauth_consumer, self._oauth_token)
+        return oauth_request.to_url()
+
+    def _GetCacheKey(self, url):
+        # Unique keys are a combination of the url and the oAuth Consumer Key
+        if self.consumer_key:
+            return self.consumer_key + ':' + url
+        return url
+
+    def _GetCachedResponse(self, key, url=None):
+        '''Return the cached body for key if it is still fresh, else None.
+
+        If url is given and stale-while-revalidate is enabled, a body that
+        expired less than that long ago is returned as well, and url is
+        refreshed in the background.
+        '''
+        if self._cache is None:
+            return None
+
+        max_age = self._GetMaxCacheAge(url)
+        get_if_fresh = getattr(self._cache, 'GetIfFresh', None)
+        if get_if_fresh is not None:
+            entry = get_if_fresh(key, max_age)
+            if entry is None:
+                return None
+            response, age = entry
+        else:
+            # Caches that predate GetIfFresh only support the two-call protocol
+            last_cached = self._cache.GetCachedTime(key)
+            if not last_cached or time.time() >= last_cached + max_age:
+                return None
+            response = self._cache.Get(key)
+            age = time.time() - last_cached
+
+        if response is not None and age >= self._cache_timeout:
+            self._Revalidate(key, url)
+        return response
+
+    def _GetCachedResponses(self, lookups):
+        '''Return the cached body, or None, for each (key, url) pair, in a
+        single round trip for caches that support GetManyIfFresh.'''
+        get_many_if_fresh = getattr(self._cache, 'GetManyIfFresh', None)
+        if get_many_if_fresh is None or not lookups:
+            return [self._GetCachedResponse(key, url) for key, url in lookups]
+
+        entries = get_many_if_fresh([key for key, _ in lookups],
+                                    self._GetMaxCacheAge(lookups[0][1]))
+        responses = []
+        for key, url in lookups:
+            response, age = entries.get(key, (None, None))
+            if response is not None and age >= self._cache_timeout:
+                self._Revalidate(key, url)
+            responses.append(response)
+        return responses
+
+    def _GetMaxCacheAge(self, url):
+        max_age = self._cache_timeout
+        if url is not None and self._stale_while_revalidate:
+            max_age += self._stale_while_revalidate
+        return max_age
 
     def _FetchUrl(self,
                   url,
@@ -153,58 +814,214 @@ class Api(object):
 
         if post_data:
             http_method = "POST"
+            post_data = urllib.urlencode(post_data)
         else:
             http_method = "GET"
+            post_data = None
 
-        # if use_gzip_compression is None:
-        #     use_gzip = self._use_gzip
-        # else:
-        #     use_gzip = use_gzip_compression
-
-        # # Set up compression
-        # if use_gzip and not post_data:
-        #     opener.addheaders.append(('Accept-Encoding', 'gzip'))
+        if use_gzip_compression is None:
+            use_gzip = self._use_gzip
+        else:
+            use_gzip = use_gzip_compression
 
-        oauth_request = oauth.Request(http_method, url, {})
-        oauth_request.update({'oauth_nonce': oauth.generate_nonce(),
-                              'oauth_timestamp': oauth.generate_timestamp(),
-                              'oauth_token': self.access_token_key,
-                              'oauth_consumer_key': self.consumer_key})
+        # Set up compression
+        headers = {}
+        if use_gzip and not post_data:
+            headers['Accept-Encoding'] = 'gzip'
 
-        oauth_request.sign_request(oauth.SignatureMethod_HMAC_SHA1(), self._oauth_consumer, self._oauth_token)
-        signed_url = oauth_request.to_url()
+        # The cache key is derived from the unsigned url, so requests are
+        # only signed once they are known to miss the cache
+        key = self._GetCacheKey(url)
 
-        # Unique keys are a combination of the url and the oAuth Consumer Key
-        if self.consumer_key:
-            key = self.consumer_key + ':' + url
+        # See if a fresh copy has been cached before
+        if no_cache:
+            response = None
+        elif self._hooks:
+            start = time.time()
+            response = self._GetCachedResponse(key, url)
+            self._EmitPhase(PHASE_CACHE_LOOKUP, start, url=url, key=key)
+            if response is None:
+                self._Emit(EVENT_CACHE_MISS, url=url, key=key)
+            else:
+                self._Emit(EVENT_CACHE_HIT, url=url, key=key)
         else:
-            key = url
-
-        # See if it has been cached before
-        last_cached = self._cache.GetCachedTime(key)
+            response = self._GetCachedResponse(key, url)
 
         # If the cached version is outdated then fetch another and store it
-        if not last_cached or time.time() >= last_cached + self._cache_timeout:
-            # Connect
-            try:
-                conn = urllib.urlopen(signed_url, None)
-            except urllib2.HTTPError, error:
-                raise Exception("Error accessing yelp api " + error.read())
+        if response is None:
+            if post_data:
+                response = self._FetchAndStore(key, url, http_method, post_data, headers)
             else:
-                try:
-                    response = conn.read()
-                    self._cache.Set(key, response)
-                finally:
-                    conn.close()
-        else:
-            response = self._cache.Get(key)
+                # Identical concurrent GETs share a single upstream request
+                response = self._FetchOnce(key, lambda: self._FetchAndStore(
+                    key, url, http_method, post_data, headers))
 
         # Always return the latest version
         return response
 
-class SearchResultSet(object):
+    def _FetchAndStore(self, key, url, http_method, post_data, headers):
+        attempt = 0
+        while True:
+            if self._rate_limiter is not None:
+                waited = self._rate_limiter.Acquire()
+                if waited:
+                    self._AddThrottleStat('rate_limit_wait_time', waited)
+            if self._hooks:
+                result = self._FetchObserved(url, http_method, post_data, headers, attempt)
+            else:
+                # Each attempt needs a fresh nonce and timestamp
+                signed_url = self._SignUrl(url, http_method)
+                # Connect, reusing a pooled keep-alive connection if possible
+                result = self._transport.Fetch(signed_url, post_data, headers)
+            if attempt >= self._max_retries or \
+               (result.status != 429 and result.status < 500):
+                break
+            delay = self._GetRetryDelay(attempt, result)
+            self._AddThrottleStat('retries', 1)
+            self._AddThrottleStat('backoff_time', delay)
+            time.sleep(delay)
+            attempt += 1
+        # Error bodies are returned to the caller but never cached
+        if result.status == 200 and self._cache is not None:
+            gzipped_body = getattr(result, 'gzipped_body', None)
+            set_gzipped = getattr(self._cache, 'SetGzipped', None)
+            if gzipped_body is not None and set_gzipped is not None:
+                # Caches that compress can keep the body as received
+                set_gzipped(key, gzipped_body, len(result.body))
+            else:
+                self._cache.Set(key, result.body)
+        return result.body
+
+    def _FetchObserved(self, url, http_method, post_data, headers, attempt):
+        '''Sign and send one attempt, reporting it to the hooks.'''
+        start = time.time()
+        signed_url = self._SignUrl(url, http_method)
+        self._EmitPhase(PHASE_SIGN, start, url=url)
+        self._Emit(EVENT_BEFORE_REQUEST, url=url, method=http_method, attempt=attempt)
+        start = time.time()
+        try:
+            result = self._transport.Fetch(signed_url, post_data, headers)
+        except Exception, error:
+            self._Emit(EVENT_ERROR, url=url, attempt=attempt, error=error)
+            raise
+        self._EmitPhase(PHASE_NETWORK, start, url=url, status=result.status)
+        self._Emit(EVENT_AFTER_RESPONSE, url=url, attempt=attempt, status=result.status,
+                   seconds=time.time() - start)
+        return result
+
+    def _GetRetryDelay(self, attempt, result):
+        retry_after = result.headers.get('retry-after')
+        if retry_after is not None and retry_after.isdigit():
+            return min(float(retry_after), self._max_retry_backoff)
+        # Full jitter, so throttled clients do not retry in lockstep
+        return random.uniform(0, min(self._max_retry_backoff,
+                                     self._retry_backoff * 2 ** attempt))
+
+    def _AddThrottleStat(self, name, value):
+        with self._throttle_lock:
+            self._throttle_stats[name] += value
+
+    def _FetchOnce(self, key, fetch):
+        '''Call fetch, unless another thread is already fetching key, in
+        which case wait for and share its outcome.'''
+        with self._in_flight_lock:
+            call = self._in_flight_calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._in_flight_calls[key] = _SharedCall()
+
+        if leader:
+            try:
+                call.result = fetch()
+            except Exception:
+                call.exc_info = sys.exc_info()
+            finally:
+                with self._in_flight_lock:
+                    del self._in_flight_calls[key]
+                call.done.set()
+        else:
+            call.done.wait()
+
+        if call.exc_info is not None:
+            raise call.exc_info[0], call.exc_info[1], call.exc_info[2]
+        return call.result
+
+    def _Revalidate(self, key, url):
+        '''Refresh url in the background unless a refresh is already queued.'''
+        with self._in_flight_lock:
+            if key in self._revalidating or key in self._in_flight_calls:
+                return
+            self._revalidating.add(key)
+        self._GetBatchPool().apply_async(self._RefreshUrl, (key, url))
+
+    def _RefreshUrl(self, key, url):
+        try:
+            self._FetchUrl(url=url, no_cache=True)
+        except Exception:
+            # Keep serving the stale copy; the next lookup will retry
+            pass
+        finally:
+            with self._in_flight_lock:
+                self._revalidating.discard(key)
+
+class _SharedCall(object):
+    '''The outcome of an upstream fetch shared by concurrent callers.'''
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.exc_info = None
+
+
+class BatchResult(object):
+    '''The outcome of one request in a GetBusinesses or SearchMany batch.
+
+    Attributes:
+      index:
+        The position of the request in the batch input.
+      request:
+        The business id or search arguments as passed in.
+      result:
+        The Business or SearchResultSet, or None if the request failed.
+      error:
+        The exception raised by the request, or None if it succeeded.
+    '''
+
+    def __init__(self,
+                 index=None,
+                 request=None,
+                 result=None,
+                 error=None):
+        self.index = index
+        self.request = request
+        self.result = result
+        self.error = error
+
+
+class _Model(object):
+    '''Base class of the models, pickling and copying their __slots__, which
+    protocols 0 and 1 cannot do on their own.  Lazy models stay lazy.'''
+
+    __slots__ = ()
+
+    def __getstate__(self):
+        return dict((name, getattr(self, name)) for name in self.__slots__
+                    if hasattr(self, name))
+
+    def __setstate__(self, state):
+        for name, value in state.iteritems():
+            setattr(self, name, value)
+
+
+class SearchResultSet(_Model):
 
-    """ TODO make iterable, subscriptable """
+    '''One page of search results.  Iterating over, indexing and taking the
+    len() of a SearchResultSet applies to its businesses.'''
+
+    __slots__ = ('region',
+                 'total',
+                 '_businesses',
+                 '_data')
 
     def __init__(self,
                  region=None,
@@ -213,15 +1030,84 @@ class SearchResultSet(object):
         self.region = region
         self.total = total
         self.businesses = businesses
+        self._data = None
+
+    @property
+    def businesses(self):
+        if self._businesses is _NOT_LOADED:
+            self._businesses = [Business.NewFromJsonDict(business, lazy=True)
+                                for business in self._data.get('businesses', [])]
+        return self._businesses
+
+    @businesses.setter
+    def businesses(self, businesses):
+        self._businesses = businesses
+
+    def __iter__(self):
+        return iter(self.businesses or [])
+
+    def __len__(self):
+        return len(self.businesses or [])
+
+    def __getitem__(self, index):
+        return (self.businesses or [])[index]
+
+    def ToColumns(self, use_numpy=False):
+        '''Return the businesses as a columns.Table.
+
+        A lazily built result set is converted straight from its decoded
+        response without building any Business objects.
+
+        Args:
+          use_numpy:
+            If True, numeric columns are numpy arrays.  Requires numpy.
+        '''
+        if self._data is not None:
+            return columns.FromJsonDicts(self._data.get('businesses', []), use_numpy=use_numpy)
+        return columns.FromBusinesses(self.businesses or [], use_numpy=use_numpy)
 
     @staticmethod
-    def NewFromJsonDict(data):
-        return SearchResultSet(region=data.get('region', None),
-                               total=data.get('total', 0),
-                               businesses=map(Business.NewFromJsonDict, data.get('businesses', [])))
+    def NewFromJsonDict(data, lazy=False):
+        '''Build a SearchResultSet from a decoded response.
+
+        If lazy is True the Business objects are only built when businesses
+        is first read, and are themselves lazy.
+        '''
+        if lazy:
+            businesses = _NOT_LOADED
+        else:
+            businesses = map(Business.NewFromJsonDict, data.get('businesses', []))
+        result = SearchResultSet(region=data.get('region', None),
+                                 total=data.get('total', 0),
+                                 businesses=businesses)
+        if lazy:
+            result._data = data
+        return result
+
 
+class Business(_Model):
 
-class Business(object):
+    __slots__ = ('categories',
+                 'deals',
+                 'display_phone',
+                 'id',
+                 'image_url',
+                 'is_claimed',
+                 'is_closed',
+                 '_location',
+                 'mobile_url',
+                 'name',
+                 'phone',
+                 'rating',
+                 'rating_img_url',
+                 'rating_img_large',
+                 'rating_img_small',
+                 'review_count',
+                 '_reviews',
+                 'snippet_image_url',
+                 'snippet_text',
+                 'url',
+                 '_data')
 
     def __init__(self,
                  categories=None,
@@ -265,17 +1151,48 @@ class Business(object):
         self.snippet_image_url = snippet_image_url
         self.snippet_text = snippet_text
         self.url = url
+        self._data = None
+
+    @property
+    def location(self):
+        if self._location is _NOT_LOADED:
+            self._location = Location.NewFromJsonDict(self._data.get("location", None))
+        return self._location
+
+    @location.setter
+    def location(self, location):
+        self._location = location
+
+    @property
+    def reviews(self):
+        if self._reviews is _NOT_LOADED:
+            self._reviews = map(Review.NewFromJsonDict, self._data.get('reviews', []))
+        return self._reviews
+
+    @reviews.setter
+    def reviews(self, reviews):
+        self._reviews = reviews
 
     @staticmethod
-    def NewFromJsonDict(data):
-        return Business(categories=data.get("categories", None),
+    def NewFromJsonDict(data, lazy=False):
+        '''Build a Business from a decoded response.
+
+        If lazy is True the business keeps a reference to data and only
+        builds its location and reviews when they are first read.
+        '''
+        if lazy:
+            location = reviews = _NOT_LOADED
+        else:
+            location = Location.NewFromJsonDict(data.get("location", None))
+            reviews = map(Review.NewFromJsonDict, data.get('reviews', []))
+        business = Business(categories=_intern_categories(data.get("categories", None)),
                         deals=data.get("deals", None),
                         display_phone=data.get("display_phone", None),
                         id=data.get("id", None),
                         image_url=data.get("image_url", None),
                         is_claimed=data.get("is_claimed", None),
                         is_closed=data.get("is_closed", None),
-                        location=Location.NewFromJsonDict(data.get("location", None)),
+                        location=location,
                         mobile_url=data.get("mobile_url", None),
                         name=data.get("name", None),
                         phone=data.get("phone", None),
@@ -284,13 +1201,25 @@ class Business(object):
                         rating_img_large=data.get("rating_img_large", None),
                         rating_img_small=data.get("rating_img_small", None),
                         review_count=data.get("review_count", None),
-                        reviews=map(Review.NewFromJsonDict, data.get('reviews', [])),
+                        reviews=reviews,
                         snippet_image_url=data.get("snippet_image_url", None),
                         snippet_text=data.get("snippet_text", None),
                         url=data.get("url", None))
+        if lazy:
+            business._data = data
+        return business
+
 
+class Review(_Model):
+    __slots__ = ('excerpt',
+                 'id',
+                 'rating',
+                 'rating_image_large_url',
+                 'rating_image_small_url',
+                 'rating_image_url',
+                 'time_created',
+                 'user')
 
-class Review(object):
     def __init__(self,
                  excerpt=None,
                  id=None,
@@ -321,7 +1250,11 @@ class Review(object):
                       user=User.NewFromJsonDict(data.get("user", None)))
 
 
-class User(object):
+class User(_Model):
+    __slots__ = ('id',
+                 'image_url',
+                 'name')
+
     def __init__(self,
                  id=None,
                  image_url=None,
@@ -337,7 +1270,18 @@ class User(object):
                     name=data.get("name", None))
 
 
-class Location(object):
+class Location(_Model):
+    __slots__ = ('address',
+                 'city',
+                 'coordinate',
+                 'country_code',
+                 'cross_streets',
+                 'display_address',
+                 'geo_accuracy',
+                 'neighborhoods',
+                 'postal_code',
+                 'state_code')
+
     def __init__(self,
                  address=None,
                  city=None,
@@ -363,18 +1307,30 @@ class Location(object):
     @staticmethod
     def NewFromJsonDict(data):
         return Location(address=data.get("address", None),
-                        city=data.get("city", None),
+                        city=_intern(data.get("city", None)),
                         coordinate=data.get("coordinate", None),
-                        country_code=data.get("country_code", None),
+                        country_code=_intern(data.get("country_code", None)),
                         cross_streets=data.get("cross_streets", None),
                         display_address=data.get("display_address", None),
                         geo_accuracy=data.get("geo_accuracy", None),
                         neighborhoods=data.get("neighborhoods", None),
                         postal_code=data.get("postal_code", None),
-                        state_code=data.get("state_code", None))
+                        state_code=_intern(data.get("state_code", None)))
+
 
+class Deal(_Model):
+    __slots__ = ('id',
+                 'title',
+                 'url',
+                 'currency_code',
+                 'time_start',
+                 'time_end',
+                 'is_popular',
+                 'what_you_get',
+                 'important_restrictions',
+                 'additional_restrictions',
+                 'options')
 
-class Deal(object):
     def __init__(self,
                  id=None,
                  title=None,